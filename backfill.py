@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""
+Download data for large ranges of (mostly closed, historical) PRs: resumable, concurrent and within the rate limit.
+
+PRs are downloaded in chunks, using `download_prs` in `downloader.py` (concurrently, in batches).
+PRs whose data is already present and valid (see `_has_valid_entries` in `check_data_integrity.py`) are skipped.
+Before each chunk, the rate limit ledger (see `rate_limit.py`) decides how many PRs fit into the remaining budget,
+always reserving enough budget for `gather_stats.sh`: if none fit, the backfill waits until github resets
+the rate limit (or, with `--no-wait`, stops). With `--budget POINTS`, the backfill spends at most this many points.
+
+After each chunk, the progress is saved in the checkpoint file `backfill_checkpoint.json`, and the throughput
+and the estimated time until completion are printed. An interrupted backfill (e.g. killed or out of budget)
+continues where it stopped with `python3 backfill.py --resume`; PRs whose download failed are retried then.
+PRs which do not exist according to github (e.g. numbers of issues rather than PRs) are recorded as such, and not retried.
+The checkpoint file is removed once all PRs were downloaded successfully (or do not exist).
+
+Usage: `python3 backfill.py [--jobs J] [--max-batch-size B] [--chunk N] [--budget POINTS] [--no-wait] (RANGE... | --resume)`
+where each RANGE is a PR number N or a range A-B of PR numbers (inclusive).
+- `--jobs J` and `--max-batch-size B` are as for `downloader.py` (defaults: 4 and 20),
+- `--chunk N` downloads (at most) N PRs per chunk (default: 100).
+Starting a backfill for other PRs while an earlier backfill is unfinished is an error: resume or remove its checkpoint first.
+"""
+
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from datetime import timedelta
+from os import path
+from typing import Callable, List, Tuple
+
+from check_data_integrity import _has_valid_entries
+from data_manifest import DataManifest
+from downloader import GraphQLClient, GITHUB_GRAPHQL_URL, download_prs, github_token, read_stubborn_prs, record_in_manifest
+from graphql_batch import AdaptiveBatchSize
+from packed_data import PackedData, list_pr_dirs
+from rate_limit import RateLimitLedger
+from util import eprint
+
+CHECKPOINT_FILE = "backfill_checkpoint.json"
+
+DEFAULT_CHUNK_SIZE = 100
+
+USAGE = (
+    "usage: backfill.py [--jobs J] [--max-batch-size B] [--chunk N] [--budget POINTS] [--no-wait] (RANGE... | --resume)"
+)
+
+
+# Parse a range "A-B" (or a single PR number "N") of PR numbers. Return None if |arg| is not a valid range.
+def parse_range(arg: str) -> Tuple[int, int] | None:
+    (start, _sep, end) = arg.partition("-")
+    if not start.isdigit() or not (end or start).isdigit() or int(start) > int(end or start):
+        return None
+    return (int(start), int(end or start))
+
+
+# The progress of a backfill of the PRs in |ranges|: all PRs before |position| (in increasing order) were processed,
+# except for the PRs in |failed| (whose download failed); |downloaded| and |skipped| count the PRs downloaded
+# and skipped (as their data was valid already) so far. The PRs in |not_found| do not exist: they are done, too.
+class Checkpoint:
+    def __init__(
+        self, ranges: List[Tuple[int, int]], position: int = 0, failed: List[int] = [], downloaded: int = 0, skipped: int = 0,
+        not_found: List[int] = [],
+    ) -> None:
+        self.ranges = ranges
+        self.position = position
+        self.failed = list(failed)
+        self.downloaded = downloaded
+        self.skipped = skipped
+        self.not_found = list(not_found)
+
+    # All PR numbers to backfill, in increasing order.
+    def numbers(self) -> List[int]:
+        return sorted({n for (start, end) in self.ranges for n in range(start, end + 1)})
+
+    @staticmethod
+    def load(file: str = CHECKPOINT_FILE) -> "Checkpoint | None":
+        if not path.exists(file):
+            return None
+        with open(file, "r") as fi:
+            data = json.load(fi)
+        return Checkpoint(
+            [(start, end) for (start, end) in data["ranges"]], data["position"], data["failed"], data["downloaded"], data["skipped"],
+            data.get("not_found", []),
+        )
+
+    def save(self, file: str = CHECKPOINT_FILE) -> None:
+        data = {
+            "ranges": self.ranges, "position": self.position, "failed": sorted(self.failed),
+            "downloaded": self.downloaded, "skipped": self.skipped, "not_found": sorted(self.not_found),
+        }
+        tmp = f"{file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as fi:
+            json.dump(data, fi)
+            fi.write("\n")
+        os.replace(tmp, file)
+
+
+# The number of PRs which the next chunk may download at time |now|, given the rate limit ledger |ledger|,
+# the maximal chunk size |chunk_size| and the remaining budget |budget| of this backfill (in points, if limited).
+def chunk_allowance(ledger: RateLimitLedger, chunk_size: int, budget: float | None, now: float) -> int:
+    allowed = ledger.plan([("backfill", chunk_size)], now)[0][1]
+    if budget is not None:
+        allowed = min(allowed, max(0, math.floor(budget / ledger.cost_per_pr)))
+    return allowed
+
+
+# Run (or continue) the backfill described by |checkpoint|, saving the progress to |checkpoint_file| after each chunk.
+# |is_valid| tells whether the data of a PR is present and valid already. PRs are downloaded as `download_prs` does,
+# spending at most |budget| points of the rate limit (if given). If the rate limit is exhausted, wait until it is reset
+# if |wait| is true, and stop otherwise. Return whether all PRs were processed.
+async def run_backfill(
+    client: GraphQLClient, ledger: RateLimitLedger, checkpoint: Checkpoint, checkpoint_file: str, is_valid: Callable[[int], bool],
+    stubborn: List[int], jobs: int, compression: str, sizer: AdaptiveBatchSize | None, chunk_size: int,
+    budget: float | None = None, wait: bool = True,
+) -> bool:
+    numbers = checkpoint.numbers()
+    # PRs whose download failed in an earlier run are retried first. (They stay in |checkpoint.failed| until then,
+    # in case the backfill is interrupted.)
+    retry = list(checkpoint.failed)
+    (start, processed, spent) = (time.monotonic(), 0, 0.0)
+    while True:
+        allowed = chunk_allowance(ledger, chunk_size, None if budget is None else budget - spent, time.time())
+        if allowed == 0:
+            if budget is not None and budget - spent < ledger.cost_per_pr:
+                print("info: the budget for this backfill is exhausted, stopping: continue with `backfill.py --resume`")
+                break
+            if not wait:
+                print("info: the rate limit budget is exhausted, stopping: continue with `backfill.py --resume`")
+                break
+            delay = max(1.0, ledger.reset_at - time.time())
+            print(f"info: the rate limit budget is exhausted, waiting {timedelta(seconds=int(delay))} until it is reset")
+            await asyncio.sleep(delay)
+            continue
+        chunk: List[int] = []
+        while len(chunk) < allowed and (retry or checkpoint.position < len(numbers)):
+            if retry:
+                number = retry.pop(0)
+                checkpoint.failed.remove(number)
+            else:
+                number = numbers[checkpoint.position]
+                checkpoint.position += 1
+            if is_valid(number):
+                checkpoint.skipped += 1
+                processed += 1
+            else:
+                chunk.append(number)
+        if not chunk:
+            checkpoint.save(checkpoint_file)
+            return True
+        not_found: List[int] = []
+        written: List[str] = []
+        failed = await download_prs(
+            client, chunk, stubborn, jobs, compression, sizer, incremental=False, not_found=not_found, written=written
+        )
+        downloaded = [n for n in chunk if n not in failed and n not in not_found]
+        record_in_manifest(written)
+        if ledger.run_cost > 0:
+            spent += ledger.run_cost
+            ledger.record_run(len(downloaded))
+            ledger.run_cost = 0
+            ledger.save()
+        checkpoint.downloaded += len(downloaded)
+        checkpoint.failed.extend(failed)
+        checkpoint.not_found.extend(not_found)
+        checkpoint.save(checkpoint_file)
+        processed += len(chunk)
+        remaining = len(numbers) - checkpoint.position + len(retry)
+        rate = processed / max(time.monotonic() - start, 1e-3)
+        print(
+            f"backfill: {len(numbers) - remaining}/{len(numbers)} PR(s) processed ({checkpoint.downloaded} downloaded, "
+            f"{checkpoint.skipped} already present, {len(checkpoint.not_found)} not found, "
+            f"{len(checkpoint.failed) - len(retry)} failed), {rate:.1f} PR(s)/s, "
+            f"ETA {timedelta(seconds=int(remaining / rate)) if rate > 0 else 'unknown'}"
+        )
+    checkpoint.save(checkpoint_file)
+    return False
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    (jobs, max_batch_size, chunk_size, budget, wait, resume) = (4, 20, DEFAULT_CHUNK_SIZE, None, True, False)
+    ranges: List[Tuple[int, int]] = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--jobs" and args and args[0].isdigit() and int(args[0]) > 0:
+            jobs = int(args.pop(0))
+        elif arg == "--max-batch-size" and args and args[0].isdigit() and int(args[0]) > 0:
+            max_batch_size = int(args.pop(0))
+        elif arg == "--chunk" and args and args[0].isdigit() and int(args[0]) > 0:
+            chunk_size = int(args.pop(0))
+        elif arg == "--budget" and args and args[0].isdigit():
+            budget = float(args.pop(0))
+        elif arg == "--no-wait":
+            wait = False
+        elif arg == "--resume":
+            resume = True
+        elif parse_range(arg) is not None:
+            ranges.append(parse_range(arg))
+        else:
+            eprint(USAGE)
+            sys.exit(1)
+    if resume == bool(ranges):
+        eprint(USAGE)
+        sys.exit(1)
+    checkpoint = Checkpoint.load()
+    if resume and checkpoint is None:
+        eprint(f"error: there is no backfill to resume ({CHECKPOINT_FILE} does not exist)")
+        sys.exit(1)
+    if not resume:
+        if checkpoint is not None and checkpoint.ranges != ranges:
+            eprint(f"error: an unfinished backfill of PR(s) {checkpoint.ranges} exists: resume it, or remove {CHECKPOINT_FILE}")
+            sys.exit(1)
+        checkpoint = checkpoint or Checkpoint(ranges)
+    assert checkpoint is not None
+
+    packed = PackedData()
+    manifest = DataManifest.load()
+    data_dirs = set(list_pr_dirs(packed))
+    compression = os.environ.get("DATA_COMPRESSION") or "none"
+    url = os.environ.get("GITHUB_GRAPHQL_URL") or GITHUB_GRAPHQL_URL
+    ledger = RateLimitLedger.load()
+    client = GraphQLClient(url, github_token(), max_connections=jobs, ledger=ledger)
+    sizer = AdaptiveBatchSize(maximum=max_batch_size) if max_batch_size > 1 else None
+    try:
+        finished = asyncio.run(run_backfill(
+            client, ledger, checkpoint, CHECKPOINT_FILE, lambda n: _has_valid_entries(data_dirs, packed, manifest, n),
+            read_stubborn_prs(), jobs, compression, sizer, chunk_size, budget, wait,
+        ))
+    finally:
+        client.close()
+        manifest.save()
+    print(f"downloaded data for {checkpoint.downloaded} PR(s), skipped {checkpoint.skipped} PR(s) with data already present")
+    if checkpoint.not_found:
+        print(f"info: PR(s) {sorted(checkpoint.not_found)} do not exist (e.g. these are issues), skipped them")
+    if checkpoint.failed:
+        eprint(f"error: downloading data for PR(s) {sorted(checkpoint.failed)} failed: retry them with `backfill.py --resume`")
+    if finished and not checkpoint.failed:
+        os.remove(CHECKPOINT_FILE)
+        print("Backfilling run completed successfully")
+    else:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
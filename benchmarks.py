@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmarks for the data processing pipeline.
+
+Usage: `python3 benchmarks.py <name> [number of PRs]`, where <name> is one of the benchmarks listed in |BENCHMARKS|.
+Benchmarks use synthetic data for the given number of PRs (default: 5000).
+These benchmarks are not run automatically; they are meant for comparing the performance before and after a change.
+"""
+
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+from compute_dashboard_prs import parse_aggregate_file
+from util import (AGGREGATE_SCHEMA_VERSION, datetime_to_epoch, parse_json_file, relativedelta_tryParse,
+                  timedelta_toseconds, timedelta_tostr, zstandard)
+
+
+# Run |fun| |repeat| times and return the fastest time (in seconds).
+def _best_of(fun: Callable[[], object], repeat: int = 5) -> float:
+    return min(timeit.repeat(fun, number=1, repeat=repeat))
+
+
+def _report(name: str, before: float, after: float, n: int) -> None:
+    print(f"{name}: {before * 1000:.1f} ms (version 1) vs {after * 1000:.1f} ms (version 2) for {n} PRs, "
+          f"i.e. {before / n * 1e6:.1f} vs {after / n * 1e6:.1f} µs per PR: speed-up {before / after:.1f}x")
+
+
+# Generate synthetic inputs for encoding the time fields of |n| PRs:
+# tuples (last updated, first on queue, last status change, total time on the queue).
+def _synthetic_times(n: int) -> List[Tuple[datetime, datetime, datetime, timedelta]]:
+    rng = random.Random(42)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    result = []
+    for _ in range(n):
+        created = base + timedelta(seconds=rng.randrange(0, 60_000_000))
+        result.append((
+            created + timedelta(seconds=rng.randrange(0, 5_000_000)),
+            created + timedelta(seconds=rng.randrange(0, 500_000)),
+            created + timedelta(seconds=rng.randrange(0, 5_000_000)),
+            timedelta(seconds=rng.randrange(0, 5_000_000)),
+        ))
+    return result
+
+
+# Mirrors how `process.py` wrote the time fields in version 1 of the aggregate format.
+def _encode_v1(now: datetime, times: Tuple[datetime, datetime, datetime, timedelta]) -> dict:
+    time_format = "%Y-%m-%dT%H:%M:%SZ"
+    (updated, first_on_queue, last_change, queue_td) = times
+    delta = relativedelta(now, last_change)
+    assert relativedelta_tryParse(repr(delta)) == delta
+    queue_rd = relativedelta(days=0) + queue_td
+    assert relativedelta_tryParse(repr(queue_rd)) == queue_rd
+    return {
+        "last_updated": datetime.strftime(updated, time_format),
+        "first_on_queue": {"status": "valid", "date": datetime.strftime(first_on_queue, time_format)},
+        "last_status_change": {
+            "status": "valid", "time": datetime.strftime(last_change, time_format), "delta": repr(delta), "current_status": "AwaitingReview"
+        },
+        "total_queue_time": {"status": "valid", "value_td": timedelta_tostr(queue_td), "value_rd": repr(queue_rd), "explanation": ""},
+    }
+
+
+def _encode_v2(times: Tuple[datetime, datetime, datetime, timedelta]) -> dict:
+    (updated, first_on_queue, last_change, queue_td) = times
+    return {
+        "last_updated": datetime_to_epoch(updated),
+        "first_on_queue": {"status": "valid", "date": datetime_to_epoch(first_on_queue)},
+        "last_status_change": {"status": "valid", "time": datetime_to_epoch(last_change), "current_status": "AwaitingReview"},
+        "total_queue_time": {"status": "valid", "value": timedelta_toseconds(queue_td), "explanation": ""},
+    }
+
+
+# Wrap encoded time fields into a complete aggregate file.
+def _make_aggregate_file(time_fields: List[dict], version: int) -> dict:
+    prs = []
+    for (number, fields) in enumerate(time_fields):
+        pr = {
+            "number": number, "is_draft": False, "CI_status": "pass", "head_repo": {"login": "leanprover-community"},
+            "base_branch": "master", "branch_name": f"branch-{number}", "state": "open", "author": "someone",
+            "title": f"feat: PR {number}", "description": "", "direct_dependencies": [], "label_names": ["t-algebra"],
+            "additions": 10, "deletions": 2, "num_files": 1, "files": ["Mathlib.lean"], "number_comments": 3,
+            "commenters": {"status": "valid", "users": ["someone"]}, "assignees": [], "review_approvals": [],
+            "number_review_comments": 4,
+        }
+        pr.update(fields)
+        prs.append(pr)
+    data = {"timestamp": "2025-01-01T00:00:00Z", "label_colours": {"t-analysis": "d4c5f9"}, "pr_statusses": prs}
+    if version != 1:
+        data["schema_version"] = version
+    return data
+
+
+# Compare encoding (in `process.py`) and decoding (in `parse_aggregate_file`) of the time fields
+# in both versions of the aggregate data format.
+def bench_aggregate_schema(n: int) -> None:
+    now = datetime.now(timezone.utc)
+    times = _synthetic_times(n)
+    before = _best_of(lambda: [_encode_v1(now, t) for t in times])
+    after = _best_of(lambda: [_encode_v2(t) for t in times])
+    _report("encoding the time fields", before, after, n)
+
+    v1 = json.dumps(_make_aggregate_file([_encode_v1(now, t) for t in times], 1), indent=4)
+    v2 = json.dumps(_make_aggregate_file([_encode_v2(t) for t in times], AGGREGATE_SCHEMA_VERSION), indent=4)
+    before = _best_of(lambda: parse_aggregate_file(json.loads(v1)))
+    after = _best_of(lambda: parse_aggregate_file(json.loads(v2)))
+    _report("parsing the aggregate file", before, after, n)
+    print(f"aggregate file size: {len(v1) / 1e6:.2f} MB (version 1) vs {len(v2) / 1e6:.2f} MB (version 2)")
+
+
+# A synthetic `pr_info.json` file, roughly the size of a typical PR with some discussion.
+def _synthetic_pr_info(rng: random.Random, number: int) -> dict:
+    def user() -> dict:
+        return {"login": f"user{rng.randrange(200)}"}
+    comments = [{"author": user(), "body": "Some comment text. " * rng.randrange(1, 20), "createdAt": "2024-05-01T10:00:00Z"}
+                for _ in range(rng.randrange(0, 30))]
+    events = [{"__typename": "LabeledEvent", "createdAt": "2024-05-01T10:00:00Z", "label": {"name": "awaiting-author"}, "actor": user()}
+              for _ in range(rng.randrange(0, 40))]
+    return {"data": {"repository": {"pullRequest": {
+        "number": number, "title": f"feat: PR {number}", "body": "A description. " * rng.randrange(1, 50), "author": user(),
+        "files": {"nodes": [{"path": f"Mathlib/File{i}.lean"} for i in range(rng.randrange(1, 20))]},
+        "comments": {"nodes": comments}, "timelineItems": {"nodes": events},
+    }}}}
+
+
+# Compare reading the PR info files from the `data` directory,
+# stored as pretty-printed JSON (as `jq '.'` writes it) or as compact compressed JSON (as written by `compress_data.py`).
+# NB. This measures reading from the page cache: on a fresh checkout, the smaller compressed files save additional I/O.
+def bench_compression(n: int) -> None:
+    rng = random.Random(42)
+    formats = ["none", "gz"] + (["zst"] if zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as dir:
+        for number in range(n):
+            data = _synthetic_pr_info(rng, number)
+            pretty = (json.dumps(data, indent=2) + "\n").encode()
+            compact = json.dumps(data, separators=(",", ":")).encode()
+            for format in formats:
+                os.makedirs(os.path.join(dir, format, str(number)))
+                name = os.path.join(dir, format, str(number), "pr_info.json")
+                if format == "none":
+                    content = pretty
+                elif format == "gz":
+                    (name, content) = (name + ".gz", gzip.compress(compact, compresslevel=9, mtime=0))
+                else:
+                    (name, content) = (name + ".zst", zstandard.ZstdCompressor(level=19).compress(compact))
+                with open(name, "wb") as fi:
+                    fi.write(content)
+
+        def read_all(format: str) -> None:
+            for number in range(n):
+                parse_json_file(os.path.join(dir, format, str(number), "pr_info.json"), str(number))
+
+        def size(format: str) -> int:
+            return sum(os.stat(os.path.join(root, f)).st_size for (root, _, files) in os.walk(os.path.join(dir, format)) for f in files)
+
+        for format in formats:
+            time = _best_of(lambda: read_all(format))
+            print(f"format {format}: {size(format) / 1e6:.1f} MB, reading takes {time * 1000:.1f} ms for {n} PRs ({time / n * 1e6:.1f} µs per PR)")
+
+
+# Synthetic aggregate data for |n| PRs, with realistic repetition of authors, reviewers, labels and file names.
+def _synthetic_aggregate_file(n: int) -> dict:
+    rng = random.Random(42)
+    users = [f"user{i}" for i in range(400)]
+    labels = ["t-algebra", "t-analysis", "t-topology", "awaiting-author", "WIP", "merge-conflict", "easy", "maintainer-merge"]
+    files = [f"Mathlib/Area{i % 30}/File{i}.lean" for i in range(3000)]
+    times = _synthetic_times(n)
+    data = _make_aggregate_file([_encode_v2(t) for t in times], AGGREGATE_SCHEMA_VERSION)
+    data["label_colours"] = {name: "d4c5f9" for name in labels}
+    for pr in data["pr_statusses"]:
+        pr["author"] = rng.choice(users)
+        pr["label_names"] = rng.sample(labels, rng.randrange(0, 4))
+        pr["files"] = rng.sample(files, rng.randrange(1, 30))
+        pr["num_files"] = len(pr["files"])
+        pr["assignees"] = rng.sample(users, rng.randrange(0, 2))
+        pr["review_approvals"] = rng.sample(users, rng.randrange(0, 3))
+        pr["commenters"]["users"] = rng.sample(users, rng.randrange(0, 8))
+    return data
+
+
+# Measure the memory retained by the parsed aggregate data (i.e., the result of `parse_aggregate_file`).
+# This reads `processed_data/all_pr_data.json` if it exists (ignoring the number of PRs), and synthetic data otherwise.
+def bench_aggregate_memory(n: int) -> None:
+    filename = os.path.join("processed_data", "all_pr_data.json")
+    if os.path.exists(filename):
+        with open(filename, "r") as fi:
+            text = fi.read()
+        print(f"reading {filename}")
+    else:
+        text = json.dumps(_synthetic_aggregate_file(n))
+        print(f"{filename} does not exist, using synthetic data")
+    tracemalloc.start()
+    data = json.loads(text)
+    parsed = parse_aggregate_file(data)
+    # Only measure what is retained by the parsed data: strings shared with the JSON input are included,
+    # the remaining parts of the input are not.
+    del data
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(parsed)
+    print(f"parsed aggregate data for {n} PRs: {current / 1e6:.1f} MB retained ({current / n:.0f} bytes per PR), peak {peak / 1e6:.1f} MB")
+
+
+BENCHMARKS = {
+    "aggregate-schema": bench_aggregate_schema,
+    "compression": bench_compression,
+    "aggregate-memory": bench_aggregate_memory,
+}
+
+
+def main() -> None:
+    if len(sys.argv) not in [2, 3] or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: benchmarks.py <name> [number of PRs], where <name> is one of {', '.join(BENCHMARKS)}", file=sys.stderr)
+        sys.exit(1)
+    n = int(sys.argv[2]) if len(sys.argv) == 3 else 5000
+    BENCHMARKS[sys.argv[1]](n)
+
+
+if __name__ == "__main__":
+    main()
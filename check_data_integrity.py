@@ -5,65 +5,74 @@ This script checks if all files in the `data` directory are up to date,
 by comparing their time stamps with the data in the files `all-open-PRs-{1,2,3}.json`.
 
 This script assumes these files exist.
+
+PR directories which are known to be valid and have not changed since (see `data_manifest.py`) are not validated again;
+`--full-validation` validates all of them. Validation runs in several processes (one per CPU, unless
+`--jobs J` says otherwise); the output is the same for any number of processes.
+
+The files `all-open-PRs-{1,2,3}.json` and the aggregate data file are loaded once (see |IntegrityModel|),
+and all comparisons between them run in one pass over all PRs. Besides the text output, the findings are written
+to `integrity_report.json` (which is not committed).
 """
 
+import concurrent.futures
+import contextlib
+import io
 import json
 import glob
 import os
 import shutil
 import sys
+import time
 from datetime import datetime, timedelta, timezone
-from typing import List, NamedTuple, Tuple
+from typing import Collection, List, NamedTuple, Tuple
 
 from dateutil import parser
 
 from ci_status import CIStatus
 from compute_dashboard_prs import AggregatePRInfo, infer_pr_url, Label
 from dashboard import parse_aggregate_file
-from util import eprint, parse_json_file
-
-# Read the input JSON files, return a dictionary mapping each PR number
-# to the (current) last update data github provides.
-# This operation is (supposed to be) infallible.
-def extract_last_update_from_input() -> dict[int, str]:
-    output = dict()
-    with open("all-open-PRs-1.json", "r") as file1, open("all-open-PRs-2.json", "r") as file2, open("all-open-PRs-3.json", "r") as file3:
-        data = json.load(file1)
-        for page in data["output"]:
-            for entry in page["data"]["search"]["nodes"]:
-                output[entry["number"]] = entry["updatedAt"]
-        data2 = json.load(file2)
-        for page in data2["output"]:
-            for entry in page["data"]["search"]["nodes"]:
-                output[entry["number"]] = entry["updatedAt"]
-        data3 = json.load(file3)
-        for page in data3["output"]:
-            for entry in page["data"]["search"]["nodes"]:
-                output[entry["number"]] = entry["updatedAt"]
-    return output
+from data_manifest import DataManifest, make_entry
+from download_queue import MAX_FAILURES, DownloadQueue
+from download_state import DownloadState
+from packed_data import PackedData, is_packed, list_pr_dirs
+from rate_limit import MAX_PRS_PER_RUN
+from util import datetime_to_epoch, eprint, github_time_to_epoch, parse_json_file, pr_fingerprint, strip_compression_suffix
+
+# Check that the contents |content| of the timestamp file at 'path' are well-formed;
+# print errors to standard output if not.
+def _check_timestamp(content: str, path: str) -> bool:
+    is_valid = True
+    if not content.endswith("\n"):
+        eprint(f'error: timestamp file at path "{path}" should end with a newline')
+        is_valid = False
+    content = content.removesuffix("\n")
+    if "\n" in content:
+        eprint(f'error: timestamp file at path "{path}" contains more than one line of content')
+        return False
+    try:
+        _time = parser.isoparse(content)
+    except ValueError:
+        eprint(f'error: timestamp file at path "{path}" does not contain a valid date and time')
+        is_valid = False
+    return is_valid
 
 
 # Check that a timestamp file at 'path' is well-formed;
 # print errors to standard output if not.
 def _check_timestamp_file(path: str) -> bool:
-    is_valid = True
     with open(path, "r") as file:
-        content = file.read()
-        if not content.endswith("\n"):
-            eprint(f'error: timestamp file at path "{path}" should end with a newline')
-            is_valid = False
-        content = content.removesuffix("\n")
-        if "\n" in content:
-            eprint(f'error: timestamp file at path "{path}" contains more than one line of content')
-            return False
-        try:
-            _time = parser.isoparse(content)
-        except ValueError:
-            eprint(f'error: timestamp file at path "{path}" does not contain a valid date and time')
-            is_valid = False
-    return is_valid
+        return _check_timestamp(file.read(), path)
 
 
+# List the files in the directory |dir|, without any compression suffix (see `COMPRESSED_SUFFIXES`).
+# A file stored both compressed and uncompressed is listed twice, hence makes the directory invalid.
+def _list_data_files(dir: str) -> List[str]:
+    return sorted(strip_compression_suffix(file) for file in os.listdir(dir))
+
+
+# Check that all files in |dir| are valid. Data files may be stored compressed:
+# |files| is a list of file names without compression suffix, as returned by `_list_data_files`.
 def _check_directory(dir: str, pr_number: int, files: List[str]) -> bool:
     is_valid = True
     for file in files:
@@ -80,15 +89,57 @@ def _check_directory(dir: str, pr_number: int, files: List[str]) -> bool:
     return is_valid
 
 
-# Check the contents of the data directory; print information about errors to standard error.
+# List the files of the PR directory |dir| without compression suffix (like `_list_data_files`):
+# these are read from the pack files if |dir| is packed (and not overridden by a directory in `data`).
+def _list_pr_files(packed: PackedData, dir: str) -> List[str]:
+    if is_packed(packed, dir):
+        return sorted(strip_compression_suffix(file) for file in packed.files(dir))
+    return _list_data_files(os.path.join("data", dir))
+
+
+# Like `_check_directory`, for the PR directory |dir|, which may be packed.
+def _check_pr_directory(packed: PackedData, dir: str, pr_number: int, files: List[str]) -> bool:
+    if not is_packed(packed, dir):
+        return _check_directory(os.path.join("data", dir), pr_number, files)
+    is_valid = True
+    for file in files:
+        if file == "timestamp.txt":
+            try:
+                content = packed.timestamp(dir)
+            except (ValueError, UnicodeDecodeError) as err:
+                eprint(f"error: the packed timestamp file for PR {pr_number} is invalid: {err}")
+                is_valid = False
+                continue
+            is_valid = is_valid and _check_timestamp(content, os.path.join(packed.root, dir, file))
+        else:
+            match packed.parse_json_file(dir, file, str(pr_number)):
+                case str(err):
+                    eprint(err)
+                    is_valid = False
+                case dict(_data):
+                    pass
+    return is_valid
+
+
+# Check the contents of the data directory and the pack files; print information about errors to standard error.
 # - this contains only directories of the form "PR_number" or "PR_number-basic",
 # - no PR has both forms present,
 # - each directory only contains the expected files, and these parse successfully.
+# Directories known to be valid from the manifest |manifest| are not checked again (see `_validate_pr_directory`);
+# all others are validated using |jobs| processes. The output does not depend on |jobs|.
 # Return a tuple (normal, stubborn) of all PR numbers whose data was mal-formed (if any):
 # first all normal PRs, then all "stubborn" PRs.
 # For each normal PRs, we return the PR number as well as "true" iff the directory was temporary.
-def check_data_directory_contents() -> Tuple[List[Tuple[int, bool]], List[int]]:
-    data_dirs: List[str] = sorted(os.listdir("data"))
+def check_data_directory_contents(
+    packed: PackedData, manifest: DataManifest, jobs: int = 1
+) -> Tuple[List[Tuple[int, bool]], List[int]]:
+    data_dirs: List[str] = list_pr_dirs(packed)
+    tasks = [
+        ValidationTask(dir, int(dir.removesuffix("-basic")), ["basic_pr_info.json", "timestamp.txt"])
+        if dir.endswith("-basic") else ValidationTask(dir, int(dir), ["pr_info.json", "pr_reactions.json", "timestamp.txt"])
+        for dir in data_dirs if (dir.endswith("-basic") or dir.isnumeric()) and not manifest.is_known_valid(packed, dir)
+    ]
+    results = _validate_all(packed, tasks, jobs)
     normal_prs_with_errors = []
     stubborn_prs_with_errors = []
     for dir in data_dirs:
@@ -97,26 +148,14 @@ def check_data_directory_contents() -> Tuple[List[Tuple[int, bool]], List[int]]:
             if number in data_dirs:
                 eprint(f"error: there is both a normal and a 'basic' data directory for PR {number}")
                 normal_prs_with_errors.append((int(number), False))
-            expected = ["basic_pr_info.json", "timestamp.txt"]
-            files = sorted(os.listdir(os.path.join("data", dir)))
-            if files != expected:
-                eprint(f"files for PR {number} (in directory {dir}) did not match what I wanted: expected {expected}, got {files}")
-                stubborn_prs_with_errors.append(int(number))
-                continue
-            if not _check_directory(os.path.join("data", dir), int(number), files):
+            if not _record_result(manifest, dir, results.get(dir), True):
                 stubborn_prs_with_errors.append(int(number))
         elif dir.endswith("-temp"):
             number = dir.removesuffix("-temp")
             eprint(f"error: found a temporary directory for PR {number}")
             normal_prs_with_errors.append((int(number), True))
         elif dir.isnumeric():
-            expected = ["pr_info.json", "pr_reactions.json", "timestamp.txt"]
-            files = sorted(os.listdir(os.path.join("data", dir)))
-            if files != expected:
-                eprint(f"files for PR {dir} (in directory {dir}) did not match what I wanted: expected {expected}, got {files}")
-                normal_prs_with_errors.append((int(dir), False))
-                continue
-            if not _check_directory(os.path.join("data", dir), int(dir), files):
+            if not _record_result(manifest, dir, results.get(dir), True):
                 normal_prs_with_errors.append((int(dir), False))
         else:
             eprint(f"error: found directory {dir}, which was unexpected")
@@ -124,20 +163,89 @@ def check_data_directory_contents() -> Tuple[List[Tuple[int, bool]], List[int]]:
     return (list(set(sorted(normal_prs_with_errors))), list(set(sorted(stubborn_prs_with_errors))))
 
 
-# All data we are currently extracting from each PR's aggregate info.
-class AggregateData(NamedTuple):
-    last_updated: str
-    ci_status: CIStatus
-    # either "open" or "closed"
-    state: str
+# The validation of the PR directory |dir| of PR |number|, which should contain exactly the files |expected|.
+class ValidationTask(NamedTuple):
+    dir: str
+    number: int
+    expected: List[str]
+
+
+# The result of a |ValidationTask|: whether the directory is valid, the error messages found
+# and the directory's new manifest entry (see `data_manifest.make_entry`).
+class ValidationResult(NamedTuple):
+    is_valid: bool
+    messages: str
+    entry: dict
+
+
+# Run the validation |task| (reading packed data from |packed|). Error messages are not printed, but returned.
+def _run_validation(packed: PackedData, task: ValidationTask) -> ValidationResult:
+    messages = io.StringIO()
+    with contextlib.redirect_stderr(messages):
+        files = _list_pr_files(packed, task.dir)
+        if files != task.expected:
+            eprint(f"files for PR {task.number} (in directory {task.dir}) did not match what I wanted: expected {task.expected}, got {files}")
+            is_valid = False
+        else:
+            is_valid = _check_pr_directory(packed, task.dir, task.number, files)
+    return ValidationResult(is_valid, messages.getvalue(), make_entry(packed, task.dir, is_valid))
+
+
+# The pack files, as seen by a validation worker process.
+_worker_packed: PackedData | None = None
+
+
+def _init_worker() -> None:
+    global _worker_packed
+    _worker_packed = PackedData()
+
+
+def _run_validation_in_worker(task: ValidationTask) -> ValidationResult:
+    assert _worker_packed is not None
+    return _run_validation(_worker_packed, task)
+
+
+# Run all validation |tasks|, using |jobs| processes (reading and parsing JSON is CPU-bound, so threads would not help).
+# Return the results, indexed by directory.
+def _validate_all(packed: PackedData, tasks: List[ValidationTask], jobs: int) -> dict[str, ValidationResult]:
+    if jobs <= 1 or len(tasks) < 2 * jobs:
+        return {task.dir: _run_validation(packed, task) for task in tasks}
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_init_worker) as executor:
+        results = executor.map(_run_validation_in_worker, tasks, chunksize=max(1, min(64, len(tasks) // (4 * jobs))))
+        return {task.dir: result for (task, result) in zip(tasks, results)}
+
+
+# Print the error messages of the validation result |result| of the PR directory |dir| (if |verbose| is true),
+# record it in the manifest |manifest| and return whether the directory is valid.
+# If |result| is None, the directory was not validated: it is known to be valid.
+def _record_result(manifest: DataManifest, dir: str, result: ValidationResult | None, verbose: bool) -> bool:
+    if result is None:
+        return True
+    if verbose and result.messages:
+        sys.stderr.write(result.messages)
+    manifest.put(dir, result.entry)
+    return result.is_valid
+
+
+# Check that the PR directory |dir| (of PR |number|, possibly packed) contains exactly the files |expected|,
+# and that these are valid. If |verbose| is true, print the errors found.
+# Directories which the manifest |manifest| knows to be valid (and unchanged) are not checked again;
+# all other verdicts are recorded in |manifest|.
+def _validate_pr_directory(
+    packed: PackedData, manifest: DataManifest, dir: str, number: int, expected: List[str], verbose: bool
+) -> bool:
+    if manifest.is_known_valid(packed, dir):
+        return True
+    return _record_result(manifest, dir, _run_validation(packed, ValidationTask(dir, number, expected)), verbose)
 
 
 # Is there valid and complete PR data for a PR numbered |number|?
 # Either detailed or basic information counts, assuming all files are intact.
 #
-# |data_dirs| is the list of all (known/relevant) directories in the |data| dir:
-# we pass this as an argument to avoid re-computing it many times.
-def _has_valid_entries(data_dirs: List[str], number: int) -> bool:
+# |data_dirs| contains all (known/relevant) directories in the |data| dir and in the pack files |packed|:
+# we pass this as an argument to avoid re-computing it many times. (Pass a set when checking many PRs.)
+# |manifest| is used as in `_validate_pr_directory`. (Errors are not printed: `check_data_directory_contents` did that already.)
+def _has_valid_entries(data_dirs: Collection[str], packed: PackedData, manifest: DataManifest, number: int) -> bool:
     has_basic_dir = f"{number}-basic" in data_dirs
     has_std_dir = str(number) in data_dirs
     match (has_basic_dir, has_std_dir):
@@ -145,126 +253,51 @@ def _has_valid_entries(data_dirs: List[str], number: int) -> bool:
             return False
         case (True, False):
             expected = ["basic_pr_info.json", "timestamp.txt"]
-            path = os.path.join("data", f"{number}-basic")
-            files = sorted(os.listdir(path))
-            return files == expected and _check_directory(path, number, files)
+            return _validate_pr_directory(packed, manifest, f"{number}-basic", number, expected, False)
         case (False, True):
             expected = ["pr_info.json", "pr_reactions.json", "timestamp.txt"]
-            path = os.path.join("data", str(number))
-            files = sorted(os.listdir(path))
-            return files == expected and _check_directory(path, number, files)
+            return _validate_pr_directory(packed, manifest, str(number), number, expected, False)
         case _:
             assert False  # unreachable
 
 
-comment_second = "-- second attempt for "
-comment_third = "-- third attempt for "
-
-
-# Read the file 'missing_prs.txt', check for entries which can be removed now
-# and write out the updated file. Take care to keep manual comments in the file
-# (except for obsolete lines '-- second attempt for <N>' or '-- third attempt for <N>').
-# Return a list of all PR numbers which are in the new file.
-# Prune 'closed_prs_to_backfill.txt' in a similar way; the PRs in that file are not returned.
-def prune_missing_prs_files() -> List[int]:
-    with open("closed_prs_to_backfill.txt", "r") as file:
-        closed_pr_lines = file.read().strip().splitlines()
-
-    def inner(closed_pr_lines: List[str], filename: str) -> List[int]:
-        current_lines: List[str] = []
-        with open(filename, "r") as file:
-            current_lines = file.read().strip().splitlines()
-
-        data_dirs: List[str] = sorted(os.listdir("data"))
-        # Remove all superfluous lines: corresponding to PR numbers which have valid entries now.
-        # Keep the remaining ones unchanged.
-        new_lines = []
-        current_missing_prs: List[int] = []
-        superfluous: List[int] = []
-        comments = []
-        for line in current_lines:
-            if not line:
-                new_lines.append(line)
-                continue
-            elif line.startswith("--"):
-                comments.append(line)
-                new_lines.append(line)
-                continue
-            if _has_valid_entries(data_dirs, int(line)):
-                superfluous.append(int(line))
-            else:
-                new_lines.append(line)
-                current_missing_prs.append(int(line))
-        for comment in comments:
-            if comment.startswith(comment_second):
-                nstr = comment.removeprefix(comment_second)
-                if int(nstr) not in current_missing_prs and nstr not in closed_pr_lines:
-                    print(f"PR {nstr} is marked as 'second attempt', but is fine now --- removing the comment")
-                    new_lines.remove(comment)
-            elif comment.startswith(comment_third):
-                nstr = comment.removeprefix(comment_third)
-                if int(nstr) not in current_missing_prs and nstr not in closed_pr_lines:
-                    print(f"PR {nstr} is marked as 'third attempt', but is fine now --- removing the comment")
-                    new_lines.remove(comment)
+# Remove all PRs marked as missing or to be backfilled in the download state |state| whose data is present now
+# (and print them). Return a tuple of the lists of all remaining PRs which are missing and to be backfilled.
+def prune_missing_prs_files(packed: PackedData, manifest: DataManifest, state: DownloadState) -> Tuple[List[int], List[int]]:
+    data_dirs = set(list_pr_dirs(packed))
+    remaining = []
+    for status in ["missing", "backfill"]:
+        superfluous = [n for n in state.with_status(status) if _has_valid_entries(data_dirs, packed, manifest, n)]
         if superfluous:
-            eprint(f"{len(superfluous)} PR(s) marked as missing have present entries now, removing: {superfluous}")
-        with open(filename, "w") as file:
-            file.write("\n".join(new_lines) + "\n")
-        return current_missing_prs
-
-    _unused = inner(closed_pr_lines, "closed_prs_to_backfill.txt")
-    return inner(closed_pr_lines, "missing_prs.txt")
+            eprint(f"{len(superfluous)} PR(s) marked as {status} have present entries now, removing: {superfluous}")
+        state.mark_done(superfluous, time.time())
+        remaining.append(state.with_status(status))
+    return (remaining[0], remaining[1])
 
 
 # Remove broken data for a "normal" PR with number 'number':
 # - remove the entire directory of this PR's data,
-# - add/update a running comment to 'missing_prs.txt' resp. 'closed_prs_to_backfill.txt'
-#   about this being the second (or third) time this PR is downloaded,
-# - if there was a comment about the third attempt, i.e. a download failed thrice in a row, mark this PR as stubborn.
-# 'prune_missing_prs_files()' ensures that no stale "third attempt" comments are left behind.
+# - record the failed download (with the error |error|) in the download queue |queue|
+#   (so the PR is retried later, with backoff) and in the download state |state|,
+# - if downloading this PR failed too often in a row, mark this PR as stubborn in |state|
+#   (which removes it from 'missing_prs.txt' and 'closed_prs_to_backfill.txt' and adds it to 'stubborn_prs.txt').
 # If |is_temporary| is true, remove a '123-temp' directory instead.
 # If |no_remove| is true, don't try to remove any directory (but just mark the PR download as failed).
 # Recently, the temporary download directories are deleted by the shell script,
 # so there is no need to delete them again.
-def remove_broken_data(number: int, is_temporary: bool, no_remove: bool) -> None:
+def remove_broken_data(
+    number: int, is_temporary: bool, no_remove: bool, queue: DownloadQueue, state: DownloadState, error: str
+) -> None:
     if not no_remove:
         dirname = f"{number}-temp" if is_temporary else str(number)
         shutil.rmtree(os.path.join("data", dirname))
-    # Return whether the PR should now be marked as stubborn.
-    def _inner(number: int, filename: str) -> bool:
-        # NB. We write a comment "second time" to both missing_prs.txt and closed_prs_to_backfill.txt
-        # (as we don't know where the original one came from). This causes duplicate messages and entries,
-        # but is otherwise harmless.
-        with open(filename, "r") as fi:
-            content = fi.read().splitlines()
-        previous_comments = list(filter(lambda s: s.startswith("-- ") and s.rstrip().endswith(str(number)), content))
-        if not previous_comments:
-            # No comment about the file: just write a comment 'second' time.
-            with open(filename, "a") as fi:
-                fi.write(f"{comment_second}{number}\n")
-        else:
-            assert len(previous_comments) == 1
-            new_content = content[:]
-            new_content.remove(previous_comments[0])
-            if previous_comments[0].startswith(comment_second):
-                # Replace "second" by "third" in that line; remove broken data.
-                new_content.append(f"{comment_third}{number}")
-                with open(filename, "w") as fi:
-                    fi.write('\n'.join(new_content) + '\n')
-            elif previous_comments[0].startswith(comment_third):
-                # Remove the comment; remove the PR number from the file (any number of times);
-                # write an entry to stubborn_prs.txt instead.
-                new_content = [line for line in content if line != str(number)]
-                with open(filename, "w") as fi:
-                    fi.write('\n'.join(new_content) + '\n')
-                return True
-            else:
-                print(f"error: comment {previous_comments} for PR {number} is unexpected; aborting!")
-        return False
-    newly_stubborn = (_inner(number, "missing_prs.txt"), _inner(number, "closed_prs_to_backfill.txt"))
-    if newly_stubborn[0] or newly_stubborn[1]:
-        with open("stubborn_prs.txt", "a") as fi:
-            fi.write(f"{number}\n")
+    now = time.time()
+    # The download state counts the failed downloads; the queue only backs off.
+    failures = state.record_failure(number, error, now)
+    if not queue.record_failure(number, failures, now):
+        return
+    print(f"info: downloading data for PR {number} failed {MAX_FAILURES} times in a row, marking it as stubborn")
+    state.mark_stubborn(number, now)
 
 
 # All data contained in the files all-open-PRs.json passed to the dashboard.
@@ -276,88 +309,245 @@ class RESTData(NamedTuple):
     state: str
     updatedAt: str
     labels: List[Label]
+    # The fingerprint of this PR's key data (see `pr_fingerprint` in `util.py`), if the search results contain all its fields.
+    fingerprint: str | None = None
+    # The SHA of the PR's head commit and the state of its status check rollup (None if there is none),
+    # if the search results contain these. (Otherwise, |head_oid| is None.)
+    head_oid: str | None = None
+    CI_rollup_state: str | None = None
 
 
 # If the aggregate data is less than this amount behind the REST data,
 # we don't warn yet (but allow for `gather_stats.sh` to download this normally).
 ALLOWED_DELAY_MINS = 12
 
-
-# Return a list of PR numbers whose aggregate data differs from the REST data,
-# and whose aggregate data is not newer than the REST data.
-def compare_data_inner(rest: List[RESTData], aggregate: dict[int, AggregatePRInfo]) -> List[int]:
-    # Return whether left and right are equal. Print an error if not.
-    def different(left, right, field_name, number) -> bool:
+# Aggregate data claiming that CI is running, but last updated longer ago than this, is almost surely outdated.
+# (Such runs are almost certainly already complete. 60 minutes is rather conservative).
+CI_RUNNING_LIMIT_MINS = 60
+
+# PRs with missing CI data are only re-downloaded if there are fewer than this many other outdated PRs.
+MAX_OUTDATED_FOR_MISSING_CI = 5
+
+# The file the structured report of the integrity check is written to. Like `outdated_prs.txt`, it is not committed.
+REPORT_FILE = "integrity_report.json"
+
+
+# All data the integrity check compares, loaded once and indexed by PR number:
+# github's current information about all open PRs (from the files `all-open-PRs-{1,2,3}.json`)
+# and the aggregate data file.
+class IntegrityModel(NamedTuple):
+    rest: dict[int, RESTData]
+    aggregate: dict[int, AggregatePRInfo]
+
+    @staticmethod
+    def load() -> "IntegrityModel":
+        rest: dict[int, RESTData] = dict()
+        for filename in ["all-open-PRs-1.json", "all-open-PRs-2.json", "all-open-PRs-3.json"]:
+            with open(filename, "r") as fi:
+                data = json.load(fi)
+            for page in data["output"]:
+                for pr in page["data"]["search"]["nodes"]:
+                    rest[int(pr["number"])] = _parse_rest_data(pr)
+        with open(ensure_file(os.path.join("processed_data", "all_pr_data.json")), "r") as f:
+            aggregate = parse_aggregate_file(json.load(f))
+        return IntegrityModel(rest, aggregate)
+
+
+def _parse_rest_data(pr: dict) -> RESTData:
+    parsed_labels = [Label(lab["name"], lab["color"], lab["url"]) for lab in pr["labels"]["nodes"]]
+    # dependabot PRs don't have a login name in their REST API data; handle this gracefully.
+    if "login" in pr["author"]:
+        author = pr["author"]["login"]
+        url = pr["author"]["url"]
+        if url != f'https://github.com/{author}':
+            print("warning: PR author {author} has URL {url}, which is unexpected", file=sys.stderr)
+    else:
+        author = "dependabot?"
+    (fingerprint, head_oid, ci_state) = (None, None, None)
+    if "headRefOid" in pr and "statusCheckRollup" in pr:
+        (head_oid, ci_state) = (pr["headRefOid"], pr["statusCheckRollup"] and pr["statusCheckRollup"]["state"])
+        # Without the author's login, there is nothing to compare with.
+        if "login" in pr["author"]:
+            fingerprint = pr_fingerprint(
+                author, pr["title"], pr["state"], github_time_to_epoch(pr["updatedAt"]), [lab.name for lab in parsed_labels],
+                ci_state, head_oid
+            )
+    return RESTData(
+        int(pr["number"]), pr["url"], author, pr["title"], pr["state"], pr["updatedAt"], parsed_labels, fingerprint, head_oid, ci_state
+    )
+
+
+# A problem found by the integrity check: |kind| is one of
+# - "missing": there is no aggregate data for an open PR,
+# - "outdated": the aggregate data is older than github's last update of the PR,
+# - "head_changed": the PR's head commit changed (e.g., after a force-push), but the aggregate data is not outdated (yet),
+# - "ci_changed": the state of the PR's CI changed (e.g., CI finished), but the aggregate data is not outdated (yet),
+# - "field_mismatch": the aggregate data differs from github's current data (e.g., in the PR title or labels),
+# - "wrongly_open": the aggregate data says a PR is open, but it is not,
+# - "ci_running": the aggregate data claims CI is running, but has not been updated for a long time
+#   (this is only checked if the CI states cannot be compared directly),
+# - "ci_missing": the aggregate data for an open PR has no CI information.
+class Finding(NamedTuple):
+    number: int
+    kind: str
+    message: str
+
+
+# The findings of the integrity check, in the order they were found.
+class IntegrityReport:
+    def __init__(self) -> None:
+        self.findings: List[Finding] = []
+
+    # Record a finding, and print its message.
+    def add(self, number: int, kind: str, message: str) -> None:
+        print(message)
+        self.findings.append(Finding(number, kind, message))
+
+    def numbers(self, *kinds: str) -> List[int]:
+        return sorted(set(f.number for f in self.findings if f.kind in kinds))
+
+    # The PRs whose aggregate data is missing.
+    def missing_prs(self) -> List[int]:
+        return self.numbers("missing")
+
+    # The PRs whose aggregate data is outdated and should be downloaded again. PRs with merely missing CI data are only
+    # included if there are only a few other PRs (and at most as many to fill up to |MAX_OUTDATED_FOR_MISSING_CI| PRs).
+    def outdated_prs(self) -> List[int]:
+        outdated = self.numbers("missing", "outdated", "head_changed", "ci_changed", "field_mismatch", "wrongly_open", "ci_running")
+        missing_ci = [n for n in self.numbers("ci_missing") if n not in outdated]
+        return sorted(outdated + missing_ci[:max(0, MAX_OUTDATED_FOR_MISSING_CI - len(outdated))])
+
+    def to_json(self, timestamp: str) -> dict:
+        counts: dict[str, int] = dict()
+        for finding in self.findings:
+            counts[finding.kind] = counts.get(finding.kind, 0) + 1
+        return {
+            "timestamp": timestamp,
+            "counts": dict(sorted(counts.items())),
+            "missing_prs": self.missing_prs(),
+            "outdated_prs": self.outdated_prs(),
+            "findings": [finding._asdict() for finding in self.findings],
+        }
+
+
+# Return messages describing all differences between the REST data |pr| and the aggregate data |agg|
+# (one per differing field), or an empty list if they agree.
+def _field_mismatches(pr: RESTData, agg: AggregatePRInfo) -> List[str]:
+    mismatches = []
+    if pr.url != infer_pr_url(pr.number):
+        mismatches.append(f"error for PR {pr.number}: REST data has url {pr.url}, but inferred {infer_pr_url(pr.number)}")
+    # For PR labels, also normalise the colours into lower-case and sort alphabetically.
+    norm1 = [Label(lab.name, lab.color.lower(), lab.url.replace(" ", "%20")) for lab in sorted(pr.labels, key=lambda lab: lab.name)]
+    norm2 = [Label(lab.name, lab.color.lower(), lab.url.replace(" ", "%20")) for lab in sorted(agg.labels, key=lambda lab: lab.name)]
+    for (left, right, field_name) in [
+        (pr.author, agg.author, "author"), (pr.title, agg.title, "title"), (pr.state.lower(), agg.state, "state"),
+        (parser.isoparse(pr.updatedAt), agg.last_updated, "updatedAt"), (norm1, norm2, "labels"),
+    ]:
         if left != right:
-            print(f"mismatched data field '{field_name}' for PR {number}: REST data says {left}, aggregate data {right}")
-            return True
-        return False
+            mismatches.append(f"mismatched data field '{field_name}' for PR {pr.number}: REST data says {left}, aggregate data {right}")
+    return mismatches
 
-    outdated = []
-    # For each PR in the REST data, check if the aggregate data matches.
-    # This will overlook aggregate PRs with no REST data; this is fine.
-    for pr in rest:
-        if pr.number not in aggregate:
-            print(f"error: no aggregate data for PR {pr.number}")
-            outdated.append(pr.number)
-            continue
-        agg = aggregate[pr.number]
-        if parser.isoparse(pr.updatedAt) < agg.last_updated:
-            # If the aggregate information is newer, different data is fine.
-            continue
-        elif parser.isoparse(pr.updatedAt) <= agg.last_updated + timedelta(minutes=ALLOWED_DELAY_MINS):
-            # If the aggregate data just very slightly outdated, we don't warn either.
-            continue
-        if pr.url != infer_pr_url(pr.number):
-            print(f"error for PR {pr.number}: REST data has url {pr.url}, but inferred {infer_pr_url(pr.number)}")
-            outdated.append(pr.number)
-        elif different(pr.author, agg.author, "author", pr.number):
-            outdated.append(pr.number)
-        elif different(pr.title, agg.title, "title", pr.number):
-            outdated.append(pr.number)
-        elif different(pr.state.lower(), agg.state, "state", pr.number):
-            outdated.append(pr.number)
-        elif different(parser.isoparse(pr.updatedAt), agg.last_updated, "updatedAt", pr.number):
-            outdated.append(pr.number)
-        else:
-            # For PR labels, also normalise the colours into lower-case and sort alphabetically.
-            norm1 = [Label(lab.name, lab.color.lower(), lab.url.replace(" ", "%20")) for lab in sorted(pr.labels, key=lambda lab: lab.name)]
-            norm2 = [Label(lab.name, lab.color.lower(), lab.url.replace(" ", "%20")) for lab in sorted(agg.labels, key=lambda lab: lab.name)]
-            if different(norm1, norm2, "labels", pr.number):
-                outdated.append(pr.number)
-    print(f"Compared information about {len(rest)} PRs, found {len(outdated)} PRs with different data")
-    return outdated
-
-
-# Compare the information from the aggregate data file with the contents of
-# a pr_info.json file downloaded via the REST API: the goal is to find PRs
-# where the data differs, to find PRs with outdated information sooner.
-def compare_data_aggressive() -> List[int]:
-    rest_data: List[RESTData] = []
-    with open("all-open-PRs-1.json", "r") as fi:
-        data1 = json.load(fi)
-    with open("all-open-PRs-2.json", "r") as fi:
-        data2 = json.load(fi)
-    with open("all-open-PRs-3.json", "r") as fi:
-        data3 = json.load(fi)
-    for data in [data1, data2, data3]:
-        for page in data["output"]:
-            for pr in page["data"]["search"]["nodes"]:
-                parsed_labels = [Label(lab["name"], lab["color"], lab["url"]) for lab in pr["labels"]["nodes"]]
-                # dependabot PRs don't have a login name in their REST API data; handle this gracefully.
-                if "login" in pr["author"]:
-                    author = pr["author"]["login"]
-                    url = pr["author"]["url"]
-                    if url != f'https://github.com/{author}':
-                        print("warning: PR author {author} has URL {url}, which is unexpected", file=sys.stderr)
-                else:
-                    author = "dependabot?"
-                rest_data.append(RESTData(
-                    int(pr["number"]), pr["url"], author, pr["title"], pr["state"], pr["updatedAt"], parsed_labels
-                ))
-    with open(os.path.join("processed_data", "all_pr_data.json"), "r") as f:
-        aggregate_data = parse_aggregate_file(json.load(f))
-    return compare_data_inner(rest_data, aggregate_data)
+
+# Compare the head commit and the CI state of the REST data |pr| and the aggregate data |agg| (if both know these),
+# recording any differences in |report|. Return whether there were any.
+def _compare_head_and_ci(pr: RESTData, agg: AggregatePRInfo, report: IntegrityReport) -> bool:
+    if pr.head_oid is None or agg.head_oid is None:
+        return False
+    if pr.head_oid != agg.head_oid:
+        report.add(pr.number, "head_changed", (
+            f"mismatch: the head commit of PR {pr.number} changed from {agg.head_oid} to {pr.head_oid} "
+            "(e.g., after a force-push), please re-download!"
+        ))
+        return True
+    if pr.CI_rollup_state != agg.CI_rollup_state:
+        report.add(pr.number, "ci_changed", (
+            f"mismatch: the CI state of PR {pr.number} changed from {agg.CI_rollup_state} to {pr.CI_rollup_state}, please re-download!"
+        ))
+        return True
+    return False
+
+
+# Run all checks for PR |number| of |model| at time |now|, recording all findings in |report|.
+def check_pr(model: IntegrityModel, number: int, now: datetime, report: IntegrityReport) -> None:
+    (rest, agg) = (model.rest.get(number), model.aggregate.get(number))
+    if rest is not None:
+        if agg is None:
+            report.add(number, "missing", f"mismatch: missing data for PR {number}")
+            return
+        current_updated = parser.isoparse(rest.updatedAt)
+        # current_updated should be at least as new, the aggregate data is allowed to lag behind by a small amount.
+        if agg.last_updated < current_updated - timedelta(minutes=ALLOWED_DELAY_MINS):
+            report.add(number, "outdated", (
+                f"mismatch: the aggregate file for PR {number} is outdated by {current_updated - agg.last_updated}, please re-download!\n"
+                f"  the aggregate file says {agg.last_updated}, current last update is {current_updated}"
+            ))
+            # Compare the other fields as well, to highlight what changed. (If the aggregate data is newer,
+            # or just very slightly outdated, different data is fine.)
+            for mismatch in _field_mismatches(rest, agg):
+                report.add(number, "field_mismatch", mismatch)
+        elif agg.last_updated <= current_updated:
+            # A force-push or CI finishing need not change a PR's last update time (by much):
+            # the aggregate data is outdated nonetheless.
+            changed = _compare_head_and_ci(rest, agg, report)
+            fingerprints = (rest.fingerprint, agg.fingerprint)
+            if not changed and agg.last_updated == current_updated and None not in fingerprints and fingerprints[0] != fingerprints[1]:
+                # Both describe the same update of this PR, so all key data should agree: comparing the fingerprints is
+                # enough to check this. Only compare the fields one by one if the fingerprints differ.
+                mismatches = _field_mismatches(rest, agg) or [
+                    f"mismatched fingerprint for PR {number}: its head commit or CI state changed, please re-download!"
+                ]
+                for mismatch in mismatches:
+                    report.add(number, "field_mismatch", mismatch)
+    if agg is None:
+        return
+    # Check for PRs which are still marked as open in the aggregate data,
+    # but are in reality closed (or merged, if into a non-master branch).
+    if agg.state == "open" and rest is None:
+        report.add(number, "wrongly_open", f"mismatch: the aggregate file says PR {number} is still open, which is wrong.")
+    # Also check for PRs whose aggregate CI data is "almost surely not up to date".
+    # Most commonly, this is about CI which is "running", but whose last update was long ago:
+    # if github's current CI state is known (and compared in |_compare_head_and_ci|), this heuristic is not needed.
+    # Another, very rare, possibility is PR whose CI data is `None`. In both cases, we ask for re-downloading.
+    ci_comparable = rest is not None and rest.head_oid is not None and agg.head_oid is not None
+    if agg.CI_status == CIStatus.Running and not ci_comparable and agg.last_updated < now - timedelta(minutes=CI_RUNNING_LIMIT_MINS):
+        report.add(number, "ci_running", (
+            f"outdated data: the aggregate data for PR {number} claims CI is still running, "
+            f"but was last updated more than {CI_RUNNING_LIMIT_MINS} minutes ago"
+        ))
+    elif agg.CI_status == CIStatus.Missing and agg.state == "open":
+        report.add(number, "ci_missing", f"outdated data: PR {number} has missing CI data")
+
+
+# Run all checks on all PRs of |model| at time |now|, in one pass.
+def check_model(model: IntegrityModel, now: datetime) -> IntegrityReport:
+    report = IntegrityReport()
+    for number in sorted(model.rest.keys() | model.aggregate.keys()):
+        check_pr(model, number, now, report)
+    compared = sum(1 for n in model.rest if n in model.aggregate)
+    fingerprinted = sum(1 for (n, pr) in model.rest.items() if pr.fingerprint and n in model.aggregate and model.aggregate[n].fingerprint)
+    mismatched = len(report.numbers("field_mismatch"))
+    print(f"Compared information about {compared} PRs ({fingerprinted} with fingerprints), found {mismatched} PRs with different data")
+    return report
+
+
+# Update the file 'redownload.txt' with the |count| outdated PRs of highest priority in the download queue,
+# given the failed downloads |failures| (see |DownloadState.failures|).
+# Comments (lines starting with "--") and PRs which are not tracked by the download queue
+# (i.e., which were added by hand) are kept, in their original order; PRs tracked by the queue
+# are replaced by its current choice (see |DownloadQueue.next|).
+def update_redownload_file(
+    queue: DownloadQueue, failures: dict[int, int], count: int, now: float, filename: str = "redownload.txt"
+) -> None:
+    try:
+        with open(filename, "r") as file:
+            lines = file.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+    kept = [line for line in lines if line.strip() and (not line.strip().isdigit() or int(line) not in queue.entries)]
+    listed = set(int(line) for line in kept if line.strip().isdigit())
+    chosen = [str(n) for n in queue.next(count, now, failures) if n not in listed]
+    with open(filename, "w") as file:
+        file.write("\n".join(kept + chosen) + "\n")
 
 
 def ensure_file(filename):
@@ -390,12 +580,28 @@ def ensure_file(filename):
     return filename
 
 
-# Read the last updated fields of the aggregate data file, and compare it with the
-# dates from querying github.
+# Check the data directory, and compare the aggregate data file with the data from querying github.
 def main() -> None:
-    outdated_aggressive = compare_data_aggressive()
-
-    (normal_prs_with_errors, stubborn_prs_with_errors) = check_data_directory_contents()
+    args = sys.argv[1:]
+    (full_validation, jobs) = (False, os.cpu_count() or 1)
+    while args:
+        arg = args.pop(0)
+        if arg == "--full-validation":
+            full_validation = True
+        elif arg == "--jobs" and args and args[0].isdigit() and int(args[0]) > 0:
+            jobs = int(args.pop(0))
+        else:
+            eprint("usage: check_data_integrity.py [--full-validation] [--jobs J]")
+            sys.exit(1)
+    # Load github's current data and the aggregate data once: all checks below share this model.
+    model = IntegrityModel.load()
+
+    packed = PackedData()
+    queue = DownloadQueue.load()
+    state = DownloadState.open()
+    # With --full-validation, all PR directories are validated again, and the manifest is rebuilt.
+    manifest = DataManifest(dict()) if full_validation else DataManifest.load()
+    (normal_prs_with_errors, stubborn_prs_with_errors) = check_data_directory_contents(packed, manifest, jobs)
     lines = []
     try:
         with open('broken_pr_data.txt', 'r') as fi:
@@ -408,116 +614,63 @@ def main() -> None:
             normal_prs_with_errors.append((int(line), True))
 
     # Prune broken data for all PRs, and remove superfluous entries from 'missing_prs.txt'.
-    for (pr_number, is_temporary) in normal_prs_with_errors:
-        remove_broken_data(pr_number, is_temporary, True)
-    for pr_number in stubborn_prs_with_errors:
-        shutil.rmtree(os.path.join("data", f"{pr_number}-basic"))
-    current_missing_entries = prune_missing_prs_files()
+    # All changes to the download state are committed together, and written to the `.txt` files at the end.
+    with state.transaction():
+        for (pr_number, is_temporary) in normal_prs_with_errors:
+            remove_broken_data(pr_number, is_temporary, True, queue, state, "download failed" if is_temporary else "broken data")
+        for pr_number in stubborn_prs_with_errors:
+            # Broken packed data cannot be removed: it is overridden once the PR is downloaded again.
+            if os.path.isdir(os.path.join("data", f"{pr_number}-basic")):
+                shutil.rmtree(os.path.join("data", f"{pr_number}-basic"))
+        (current_missing_entries, closed_backfill_entries) = prune_missing_prs_files(packed, manifest, state)
+    manifest.save()
     stubborn = f"and {len(stubborn_prs_with_errors)} stubborn " if stubborn_prs_with_errors else ""
     print(f"info: found {len(normal_prs_with_errors)} normal {stubborn}PR(s) with broken data")
 
-    # "Last updated" information as returned from a fresh github query.
-    current_last_updated = extract_last_update_from_input()
-    # "Last updated" information as found in the aggregate data file.
-    aggregate_last_updated: dict[int, AggregateData] = dict()
-    with open(ensure_file(os.path.join("processed_data", "all_pr_data.json")), "r") as aggregate_file:
-        data = json.load(aggregate_file)
-        for pr in data["pr_statusses"]:
-            updated = pr["last_updated"]
-            ci = pr["CI_status"]
-            state = pr["state"]
-            aggregate_last_updated[pr["number"]] = AggregateData(updated, CIStatus.from_string(ci), state)
-
-    # All PRs whose aggregate data is at least 10 minutes older than github's current "last update".
-    outdated_prs: List[int] = []
-    missing_prs = []
-    # Note that both "last updated" fields have the same format.
-    for pr_number in current_last_updated:
-        current_updated = parser.isoparse(current_last_updated[pr_number])
-        if pr_number not in aggregate_last_updated:
-            print(f"mismatch: missing data for PR {pr_number}")
-            missing_prs.append(pr_number)
-            continue
-        aggregate_updated = parser.isoparse(aggregate_last_updated[pr_number].last_updated)
-
-        # current_updated should be at least as new,
-        # aggregate_updated is allowed to lag behind by a small amount.
-        if aggregate_updated < current_updated - timedelta(minutes=ALLOWED_DELAY_MINS):
-            delta = current_updated - aggregate_updated
-            print(f"mismatch: the aggregate file for PR {pr_number} is outdated by {delta}, please re-download!")
-            print(f"  the aggregate file says {aggregate_updated}, current last update is {current_updated}")
-            outdated_prs.append(pr_number)
-
-    # Check for PRs which are still marked as open in the aggregate data,
-    # but are in reality closed (or merged, if into a non-master branch).
-    for pr_number in aggregate_last_updated:
-        if aggregate_last_updated[pr_number].state == "open":
-            if pr_number not in current_last_updated:
-                print(f"mismatch: the aggregate file says PR {pr_number} is still open, which is wrong.")
-                outdated_prs.append(pr_number)
-
-    # Also check for PRs whose aggregate CI data is "almost surely not up to date".
-    # Most commonly, this is about CI which is "running", but whose last update was at least 60 minutes old.
-    # (Such runs are almost certainly already complete. 60 minutes is rather conservative).
-    # Another, very rare, possibility is PR whose CI data is `None`. In both cases, we ask for re-downloading.
-    ci_limit = 60
-    for pr_number in aggregate_last_updated:
-        ci_status = aggregate_last_updated[pr_number].ci_status
-        if ci_status == CIStatus.Running and aggregate_updated < datetime.now(timezone.utc) - timedelta(minutes=ci_limit):
-            print(
-                f"outdated data: the aggregate data for PR {pr_number} claims CI is still running, "
-                f"but was last updated more than {ci_limit} minutes ago"
-            )
-            outdated_prs.append(pr_number)
-        elif ci_status == CIStatus.Missing and aggregate_last_updated[pr_number].state == "open":
-            print(f"outdated data: PR {pr_number} has missing CI data")
-            # When there are actual PRs to re-download, don't include PRs with merely missing CI data in them.
-            # Future: if all commits are old enough, don't re-ask at all.
-            if len(outdated_prs) < 5:
-                outdated_prs.append(pr_number)
-
-    outdated_prs.extend(outdated_aggressive)
-
-    # Some PRs are marked as stubborn: for them, only basic information is downloaded.
-    stubborn_prs = []
-    with open("stubborn_prs.txt", "r") as file:
-        for line in file:
-            line = line.strip()
-            if not line.startswith("--") and line:
-                stubborn_prs.append(int(line))
-
-    # NB. One PR might be missing or outdated in several ways: make sure to deduplicate it.
-    missing_prs = sorted(list(set(missing_prs)))
-    outdated_prs = sorted(list(set(outdated_prs)))
+    # Run all checks on all PRs in one pass.
+    report = check_model(model, datetime.now(timezone.utc))
+    missing_prs = report.missing_prs()
+    outdated_prs = report.outdated_prs()
+    with open(REPORT_FILE, "w") as fi:
+        json.dump(report.to_json(datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")), fi, indent=1)
+        fi.write("\n")
 
     # Write out the list of missing PRs.
     if missing_prs:
         print(f"SUMMARY: found {len(missing_prs)} PR(s) whose aggregate information is missing:\n{missing_prs}", file=sys.stderr)
-        # Append any 'newly' missing PRs to the file.
-        new_missing_entries = [n for n in missing_prs if n not in current_missing_entries and n not in stubborn_prs]
+        # Mark any 'newly' missing PRs as missing (except for stubborn PRs: for them, only basic information is downloaded).
         # No need to shuffle this list: gather_stats.sh skips PRs with existing
         # broken data, so each PR is tried at most once anyway.
+        with state.transaction():
+            new_missing_entries = state.add("missing", missing_prs, time.time())
         if new_missing_entries:
             print(f"info: adding PR(s) {new_missing_entries} as missing")
-            with open("missing_prs.txt", "a") as file:
-                file.write("\n".join([str(n) for n in new_missing_entries]) + "\n")
+            current_missing_entries = state.with_status("missing")
             print("  Scheduled all PRs for backfilling")
+    # Update the download queue: add all outdated PRs, and remove all PRs which need no download any more.
+    # (PRs in 'missing_prs.txt' or 'closed_prs_to_backfill.txt' are kept, to remember failed downloads.)
+    now = time.time()
+    for pr_number in outdated_prs:
+        aggregate = model.aggregate.get(pr_number)
+        last_updated = int(now) if aggregate is None else datetime_to_epoch(aggregate.last_updated)
+        is_running = aggregate is not None and aggregate.CI_status == CIStatus.Running
+        queue.add(pr_number, pr_number in model.rest, last_updated, last_updated if is_running else None)
+    needed = set(outdated_prs) | set(current_missing_entries) | set(closed_backfill_entries)
+    queue.retain(needed)
+    queue.save()
+    # The data of all other PRs is fine: their failed downloads (in a row) are over.
+    with state.transaction():
+        state.clear_failures([n for n in state.failures() if n not in needed], now)
+    failures = state.failures()
+    state.export()
+    state.close()
+
     if outdated_prs:
         print(f"SUMMARY: the data integrity check found {len(outdated_prs)} PRs with outdated aggregate information:\n{outdated_prs}")
-        # Batch the PRs to to re-download: write the first 5 PRs into redownload.txt,
-        # if that file is basically empty (i.e. no other files to already handle).
-        # The next run of this script will pick this up and try to download them.
-        with open("redownload.txt", "r") as file:
-            content2 = file.read().strip().splitlines()
-        if len(content2) != 5 and len(content2) > 1:
-            return
-        with open("redownload.txt", "w") as file:
-            # Shuffle the list of outdated PRs, to avoid this getting stuck in a loop
-            # of trying and failing to re-download the same PR over and over.
-            import random
-
-            random.shuffle(outdated_prs)
-            file.write("\n".join([str(n) for n in outdated_prs[: min(5, len(outdated_prs))]]) + "\n")
+        # Write the outdated PRs with the highest priority into redownload.txt, skipping PRs whose download failed recently.
+        # Manually added entries are kept. The next run of `download_missing_outdated_PRs.sh` re-downloads
+        # as many of them as the rate limit allows.
+        update_redownload_file(queue, failures, MAX_PRS_PER_RUN["redownload"], now)
         # Write all outdated PRs to a file "outdated_prs.txt". That file is not committed,
         # but is used to inform the reviewer suggestion algorithm.
         with open("outdated_prs.txt", "w") as fi:
@@ -526,4 +679,5 @@ def main() -> None:
         print("All PR aggregate data appears up to date, congratulations!")
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+One-shot migration tool: compress all JSON files in the `data` directory.
+
+Usage: `python3 compress_data.py [--format gz|zst] [--decompress]`.
+By default, every file `data/<dir>/<name>.json` is replaced by a compact, gzip-compressed file `<name>.json.gz`.
+With `--format zst`, zstandard is used instead (this requires the `zstandard` python module).
+With `--decompress`, all compressed files are converted back to pretty-printed JSON files instead.
+
+Files are only replaced once their converted version has been written completely, so this script can be
+interrupted and re-run safely. Temporary directories (`<N>-temp`) are skipped, as are files already in the desired format.
+After running this, set the environment variable `DATA_COMPRESSION` to the same format when running the download scripts,
+so newly downloaded data is stored compressed as well.
+"""
+
+import json
+import os
+import sys
+from os import path
+
+from util import COMPRESSED_SUFFIXES, encode_json_data, read_data_file, strip_compression_suffix, zstandard
+
+
+# Convert the file |name| in the directory |dir| to the target format |format| (one of "none", "gz" or "zst").
+# Return the size of the converted file (in bytes).
+def _convert_file(dir: str, name: str, format: str) -> int:
+    source = path.join(dir, name)
+    (suffix, content) = encode_json_data(json.loads(read_data_file(source)), format)
+    target = path.join(dir, strip_compression_suffix(name) + suffix)
+    # Write to a temporary file first, so an interrupted run never leaves a truncated file behind.
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as fi:
+        fi.write(content)
+    os.replace(tmp, target)
+    os.remove(source)
+    return len(content)
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    format = "gz"
+    if args[:1] == ["--format"] and len(args) == 2 and args[1] in ["gz", "zst"]:
+        format = args[1]
+    elif args == ["--decompress"]:
+        format = "none"
+    elif args:
+        print("usage: compress_data.py [--format gz|zst] [--decompress]", file=sys.stderr)
+        sys.exit(1)
+    if format == "zst" and zstandard is None:
+        print("error: compressing with zstandard requires the 'zstandard' python module", file=sys.stderr)
+        sys.exit(1)
+
+    suffix = "" if format == "none" else f".{format}"
+    (converted, bytes_before, bytes_after) = (0, 0, 0)
+    for dir in sorted(os.listdir("data")):
+        if dir.endswith("-temp"):
+            continue
+        for name in sorted(os.listdir(path.join("data", dir))):
+            if not strip_compression_suffix(name).endswith(".json") or name.endswith(".tmp"):
+                continue
+            current_suffix = next((s for s in COMPRESSED_SUFFIXES if name.endswith(s)), "")
+            if current_suffix == suffix:
+                continue
+            bytes_before += os.stat(path.join("data", dir, name)).st_size
+            bytes_after += _convert_file(path.join("data", dir), name, format)
+            converted += 1
+    print(f"converted {converted} files: {bytes_before / 1e6:.1f} MB before, {bytes_after / 1e6:.1f} MB after")
+
+
+if __name__ == "__main__":
+    main()
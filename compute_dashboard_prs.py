@@ -16,7 +16,8 @@ from ci_status import CIStatus
 from classify_pr_state import (PRState, PRStatus,
                                determine_PR_status, label_categorisation_rules)
 from mathlib_dashboards import Dashboard, getIdTitle
-from util import my_assert_eq, timedelta_tryParse, relativedelta_tryParse
+from util import (epoch_to_datetime, my_assert_eq, parse_aggregate_time, relativedelta_tryParse,
+                  seconds_to_relativedelta, timedelta_toseconds, timedelta_tryParse)
 
 
 # The following structures are completely project-agnostic.
@@ -77,17 +78,69 @@ class DataStatus(Enum):
             "missing": DataStatus.Missing,
         }[val]
 
-class LastStatusChange(NamedTuple):
-    status: DataStatus
-    time: datetime
-    delta: relativedelta.relativedelta
-    current_status: PRStatus
+# Information about a PR's last status change. Version 2 aggregate files do not store |delta|:
+# it is computed (relative to |now|) when accessed, to avoid storing a |relativedelta| for every PR.
+class LastStatusChange:
+    __slots__ = ("status", "time", "_delta", "_now", "current_status")
+    __match_args__ = ("status", "time", "delta", "current_status")
 
-class TotalQueueTime(NamedTuple):
-    status: DataStatus
-    value_td: timedelta
-    value_rd: relativedelta.relativedelta
-    explanation: str
+    def __init__(
+        self, status: DataStatus, time: datetime, delta: relativedelta.relativedelta | None, current_status: PRStatus | None,
+        now: datetime | None = None,
+    ) -> None:
+        self.status = status
+        self.time = time
+        self._delta = delta
+        self._now = now
+        self.current_status = current_status
+
+    # The time elapsed since the last status change.
+    @property
+    def delta(self) -> relativedelta.relativedelta | None:
+        return self._delta if self._now is None else relativedelta.relativedelta(self._now, self.time)
+
+    # Like a |NamedTuple|, compare and hash by the (public) fields.
+    def _fields(self) -> tuple:
+        return (self.status, self.time, self.delta, self.current_status)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, LastStatusChange) and self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    def __repr__(self) -> str:
+        return f"LastStatusChange({self.status!r}, {self.time!r}, {self.delta!r}, {self.current_status!r})"
+
+
+# A PR's total time on the review queue. To save memory, only the number of seconds is stored:
+# the |timedelta| and |relativedelta| forms are computed when accessed.
+class TotalQueueTime:
+    __slots__ = ("status", "seconds", "explanation")
+    __match_args__ = ("status", "value_td", "value_rd", "explanation")
+
+    def __init__(self, status: DataStatus, seconds: int | None, explanation: str) -> None:
+        self.status = status
+        # None if the input data was invalid
+        self.seconds = seconds
+        self.explanation = explanation
+
+    @property
+    def value_td(self) -> timedelta | None:
+        return None if self.seconds is None else timedelta(seconds=self.seconds)
+
+    @property
+    def value_rd(self) -> relativedelta.relativedelta | None:
+        return None if self.seconds is None else seconds_to_relativedelta(self.seconds)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TotalQueueTime) and (self.status, self.seconds, self.explanation) == (other.status, other.seconds, other.explanation)
+
+    def __hash__(self) -> int:
+        return hash((self.status, self.seconds, self.explanation))
+
+    def __repr__(self) -> str:
+        return f"TotalQueueTime({self.status!r}, {self.value_td!r}, {self.value_rd!r}, {self.explanation!r})"
 
 # All information about a single PR contained in `open_pr_info.json`.
 # Keep this in sync with the actual file, extending this once new data is added!
@@ -138,6 +191,13 @@ class AggregatePRInfo(NamedTuple):
     last_status_change: LastStatusChange | None
     first_on_queue: Tuple[DataStatus, datetime | None] | None
     total_queue_time: TotalQueueTime | None
+    # The fingerprint of this PR's key data (see `pr_fingerprint` in `util.py`),
+    # or None if the data was downloaded before fingerprints were introduced.
+    fingerprint: str | None = None
+    # The SHA of this PR's head commit and the state of its status check rollup (e.g. "SUCCESS" or "PENDING",
+    # None if there is none). If the data was downloaded before these were queried, |head_oid| is None.
+    head_oid: str | None = None
+    CI_rollup_state: str | None = None
 
 # Missing aggregate information will be replaced by this default item.
 PLACEHOLDER_AGGREGATE_INFO = AggregatePRInfo(
@@ -148,10 +208,22 @@ PLACEHOLDER_AGGREGATE_INFO = AggregatePRInfo(
 
 
 # Parse the contents |data| of an aggregate json file into a dictionary pr number -> AggregatePRInfo.
+# This accepts both versions of the aggregate data format (see AGGREGATE_SCHEMA_VERSION in util.py).
+#
+# This is called on the data for all PRs ever, so we take some care to keep the result small:
+# all PRs with a given label share the same |Label| instance, and user names and file paths
+# (which repeat across many PRs) are interned.
 def parse_aggregate_file(data: dict) -> dict[int, AggregatePRInfo]:
     label_colours = data["label_colours"]
+    is_v1 = data.get("schema_version", 1) == 1
+    # Version 2 files do not store the time since a PR's last status change: compute it relative to now.
+    now = datetime.now(timezone.utc)
+
+    labels_by_name: dict[str, Label] = dict()
 
     def toLabel(name: str) -> Label:
+        if name in labels_by_name:
+            return labels_by_name[name]
         url = f"https://github.com/leanprover-community/mathlib4/labels/{name}"
         if name.startswith("t-"):
             colour = label_colours["t-analysis"]
@@ -159,60 +231,83 @@ def parse_aggregate_file(data: dict) -> dict[int, AggregatePRInfo]:
             colour = label_colours["blocked-by-other-PR"]
         else:
             colour = label_colours[name]
-        return Label(name, colour, url)
+        label = Label(sys.intern(name), colour, url)
+        labels_by_name[name] = label
+        return label
+
+    def intern_all(names: List[str]) -> List[str]:
+        return [sys.intern(name) for name in names]
+
+    # Parse the "last_status_change" field of a version 1 file.
+    def parse_last_status_change_v1(st: dict) -> LastStatusChange:
+        (data_status, raw_time, raw_delta, raw_current_status) = st["status"], st["time"], st["delta"], st["current_status"]
+        delta = relativedelta_tryParse(raw_delta)
+        current_status = PRStatus.tryFrom_str(raw_current_status)
+        if delta is None:
+            print(f"error: invalid data, input {raw_delta} for 'delta' field of 'last_status_change' is invalid", file=sys.stderr)
+        elif current_status is None:
+            print(f"error: invalid data, input {raw_current_status} for 'current_status' field of 'last_status_change' is invalid", file=sys.stderr)
+        return LastStatusChange(DataStatus.fromStr(data_status), parser.isoparse(raw_time), delta, current_status)
+
+    def parse_last_status_change_v2(st: dict) -> LastStatusChange:
+        current_status = PRStatus.tryFrom_str(st["current_status"])
+        if current_status is None:
+            print(f"error: invalid data, input {st['current_status']} for 'current_status' field of 'last_status_change' is invalid", file=sys.stderr)
+        time = epoch_to_datetime(st["time"])
+        return LastStatusChange(DataStatus.fromStr(st["status"]), time, None, current_status, now)
+
+    # Parse the "total_queue_time" field of a version 1 file.
+    def parse_total_queue_time_v1(tqt: dict) -> TotalQueueTime:
+        (data_status, value_td, value_rd, explanation) = (tqt["status"], tqt["value_td"], tqt["value_rd"], tqt["explanation"])
+        td = timedelta_tryParse(value_td)
+        rd = relativedelta_tryParse(value_rd)
+        if rd is None:
+            print(f"error: invalid data, input {rd} for 'value_rd' field of 'total_queue_time' is invalid", file=sys.stderr)
+        elif td is None:
+            print(f"error: invalid data, input {td} for 'value_td' field of 'total_queue_time' is invalid", file=sys.stderr)
+        # |value_rd| was computed from |value_td|, so storing the latter suffices.
+        seconds = None if td is None or rd is None else timedelta_toseconds(td)
+        return TotalQueueTime(DataStatus.fromStr(data_status), seconds, explanation)
+
+    def parse_total_queue_time_v2(tqt: dict) -> TotalQueueTime:
+        return TotalQueueTime(DataStatus.fromStr(tqt["status"]), tqt["value"], tqt["explanation"])
+
+    parse_last_status_change = parse_last_status_change_v1 if is_v1 else parse_last_status_change_v2
+    parse_total_queue_time = parse_total_queue_time_v1 if is_v1 else parse_total_queue_time_v2
 
     aggregate_info = dict()
     for pr in data["pr_statusses"]:
-        date = parser.isoparse(pr["last_updated"])
+        date = parse_aggregate_time(pr["last_updated"])
         label_names = pr["label_names"]
         commenters = pr["commenters"]
-        users_commented = (DataStatus.fromStr(commenters["status"]), commenters["users"])
+        users_commented = (DataStatus.fromStr(commenters["status"]), intern_all(commenters["users"]))
         # Some PRs only have basic information present.
         if "number_review_comments" in pr:
             number_all_comments = pr["number_comments"] + pr["number_review_comments"]
             # If status information is invalid, omit it.
             st = pr["last_status_change"]
-            if st["status"] == "missing":
-                last_status_change = None
-            else:
-                (data_status, raw_time, raw_delta, raw_current_status) = st["status"], st["time"], st["delta"], st["current_status"]
-                delta = relativedelta_tryParse(raw_delta)
-                current_status = PRStatus.tryFrom_str(raw_current_status)
-                if delta is None:
-                    print(f"error: invalid data, input {raw_delta} for 'delta' field of 'last_status_change' is invalid", file=sys.stderr)
-                elif current_status is None:
-                    print(f"error: invalid data, input {raw_current_status} for 'current_status' field of 'last_status_change' is invalid", file=sys.stderr)
-                last_status_change = LastStatusChange(DataStatus.fromStr(data_status), parser.isoparse(raw_time), delta, current_status)
+            last_status_change = None if st["status"] == "missing" else parse_last_status_change(st)
 
             foq = pr["first_on_queue"]
             if foq["status"] == "missing":
                 first_on_queue = None
             else:
-                date2 = None if foq["date"] is None else parser.isoparse(foq["date"])
+                date2 = None if foq["date"] is None else parse_aggregate_time(foq["date"])
                 first_on_queue = (DataStatus.fromStr(foq["status"]), date2)
 
             tqt = pr["total_queue_time"]
-            if tqt["status"] == "missing":
-                total_queue_time = None
-            else:
-                (data_status, value_td, value_rd, explanation) = (tqt["status"], tqt["value_td"], tqt["value_rd"], tqt["explanation"])
-                td = timedelta_tryParse(value_td)
-                rd = relativedelta_tryParse(value_rd)
-                if rd is None:
-                    print(f"error: invalid data, input {rd} for 'value_rd' field of 'total_queue_time' is invalid", file=sys.stderr)
-                elif td is None:
-                    print(f"error: invalid data, input {td} for 'value_td' field of 'total_queue_time' is invalid", file=sys.stderr)
-                total_queue_time = TotalQueueTime(DataStatus.fromStr(data_status), td, rd, explanation)
+            total_queue_time = None if tqt["status"] == "missing" else parse_total_queue_time(tqt)
         else:
             number_all_comments = None
             last_status_change = None
             first_on_queue = None
             total_queue_time = None
         info = AggregatePRInfo(
-            pr["is_draft"], CIStatus.from_string(pr["CI_status"]), pr["base_branch"], pr["branch_name"], pr["head_repo"]["login"],
-            pr["state"], date, pr["author"], pr["title"], pr["description"], pr["direct_dependencies"], [toLabel(name) for name in label_names],
-            pr["additions"], pr["deletions"], pr["files"], pr["num_files"], pr["review_approvals"], pr["assignees"],
+            pr["is_draft"], CIStatus.from_string(pr["CI_status"]), sys.intern(pr["base_branch"]), pr["branch_name"], sys.intern(pr["head_repo"]["login"]),
+            sys.intern(pr["state"]), date, sys.intern(pr["author"]), pr["title"], pr["description"], pr["direct_dependencies"], [toLabel(name) for name in label_names],
+            pr["additions"], pr["deletions"], intern_all(pr["files"]), pr["num_files"], intern_all(pr["review_approvals"]), intern_all(pr["assignees"]),
             users_commented, number_all_comments, last_status_change, first_on_queue, total_queue_time,
+            pr.get("fingerprint"), pr.get("head_oid"), pr.get("CI_rollup_state"),
         )
         aggregate_info[pr["number"]] = info
     return aggregate_info
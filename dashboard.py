@@ -5,6 +5,7 @@
 # there is a file N.json in the `data` directory, which contains all necessary detailed information about that PR.
 
 import json
+import os
 import sys
 from datetime import datetime, timedelta, timezone
 from os import path
@@ -99,6 +100,25 @@ class JSONInputData(NamedTuple):
     aggregate_info: dict[int, AggregatePRInfo]
     # Information about all open PRs
     all_open_prs: List[BasicPRInformation]
+    # The statistics about all assigned PRs, and the current (weighted) load of each reviewer,
+    # as computed by `process.py` (see |read_assignment_files|).
+    assignment_data: dict
+    reviewer_load: dict
+
+
+# Read the statistics about all assigned PRs and the (weighted) load of each reviewer from the `processed_data` directory.
+# Processed data generated before the reviewer loads were computed by `process.py` lacks the latter: exit with an error then.
+def read_assignment_files() -> Tuple[dict, dict]:
+    with open(path.join("processed_data", "assignment_data.json"), "r") as fi:
+        assignment_data = json.load(fi)
+    load_file = path.join("processed_data", "reviewer_load.json")
+    try:
+        with open(load_file, "r") as fi:
+            reviewer_load = json.load(fi)
+    except FileNotFoundError:
+        print(f"error: the file {load_file} is missing: the processed data is too old, please run process.py again", file=sys.stderr)
+        sys.exit(1)
+    return (assignment_data, reviewer_load)
 
 
 # Validate the command-line arguments and try to read all data passed in via JSON files.
@@ -120,7 +140,8 @@ def read_json_files() -> JSONInputData:
             all_open_prs.extend(open_prs)
     with open(path.join("processed_data", "open_pr_data.json"), "r") as f:
         aggregate_info = parse_aggregate_file(json.load(f))
-    return JSONInputData(aggregate_info, all_open_prs)
+    (assignment_data, reviewer_load) = read_assignment_files()
+    return JSONInputData(aggregate_info, all_open_prs, assignment_data, reviewer_load)
 
 
 ### Helper methods: writing HTML code for various parts of the generated webpage ###
@@ -1229,10 +1250,11 @@ def main() -> None:
     # and write this information to "automatic_assignments.json".
     # NB. These 50 PRs include any PRs without any suggested reviewer (say, because an area has not enough
     # reviewers or everybody is too busy) --- so in practice, fewer reviewers may be actually assigned.
+    # With REVIEWER_ASSIGNMENT=batch, all stale unassigned PRs are assigned at once instead (see below).
     # XXX: importing this at the beginning leads to a circular import; importing it here seems to work.
-    from suggest_reviewer import read_reviewer_info, collect_assignment_statistics, suggest_reviewers_many
+    from suggest_reviewer import read_reviewer_info, collect_assignment_statistics, suggest_reviewers_many, suggest_reviewers_batch, assignment_objective
     reviewer_info = read_reviewer_info()
-    assignment_stats = collect_assignment_statistics(aggregate_info)
+    assignment_stats = collect_assignment_statistics(input_data.assignment_data, input_data.reviewer_load)
     all_stale_unassigned : List[int] = [pr.number for pr in prs_to_list[Dashboard.QueueStaleUnassigned]]
     shuffle(all_stale_unassigned)
     try:
@@ -1242,7 +1264,20 @@ def main() -> None:
         lines = []
     outdated_prs = [int(s) for s in lines if s]
     to_analyze = [pr for pr in all_stale_unassigned if pr not in outdated_prs]
-    proposed_reviews = suggest_reviewers_many(assignment_stats.assignments, reviewer_info, sorted(to_analyze[0:50]), aggregate_info)
+    if os.environ.get("REVIEWER_ASSIGNMENT") == "batch":
+        # Assign all stale unassigned PRs at once (see `suggest_reviewers_batch`), taking into account
+        # which PRs have few suitable reviewers. This needs no sample: it is fast enough for all open PRs.
+        # For comparison, also assign the same PRs one by one.
+        prs = sorted(to_analyze)
+        proposed_reviews = suggest_reviewers_batch(assignment_stats.assignments, reviewer_info, prs, aggregate_info)
+        greedy = suggest_reviewers_many(assignment_stats.assignments, reviewer_info, prs, aggregate_info)
+        (value, greedy_value) = [assignment_objective(assignment_stats.assignments, reviewer_info, a, aggregate_info) for a in [proposed_reviews, greedy]]
+        print(
+            f"info: batch reviewer assignment: assigned {len(proposed_reviews)} PR(s) with objective {value}, "
+            f"compared to {len(greedy)} PR(s) with objective {greedy_value} when assigning one by one ({value - greedy_value:+})"
+        )
+    else:
+        proposed_reviews = suggest_reviewers_many(assignment_stats.assignments, reviewer_info, sorted(to_analyze[0:50]), aggregate_info)
     with open("automatic_assignments.json", "w") as fi:
         print(json.dumps(proposed_reviews, indent=4), file=fi)
 
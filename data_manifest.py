@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""
+A manifest of the PR directories in `data` (and in the pack files), recording which of them have been validated.
+
+`check_data_integrity.py` checks that each PR directory contains the expected files, that all JSON files parse
+and that the timestamp is well-formed. Reading and parsing all files on every run is slow, and almost all of them
+have not changed since the last run. The manifest (`data_manifest.json`) records for each directory
+- each file's name, size, modification time and SHA-256 hash (for packed directories: the file's location in the pack files),
+- the contents of its timestamp file, and
+- whether the directory was valid when it was last validated.
+A directory whose files have the same names, sizes and modification times as recorded (or, if the modification times
+differ, e.g. after a fresh checkout, the same hashes) need not be validated again. Packed directories only change
+when they are packed again (the pack files are only ever appended to), which changes their recorded location.
+
+The manifest is maintained by
+- `downloader.py`, which records each directory it wrote (as valid: the downloader wrote the files itself),
+- `check_data_integrity.py`, which records each directory it validated, and
+- `process.py`, which drops the entries of all directories which no longer exist.
+Running `check_data_integrity.py --full-validation` ignores the manifest and validates all directories.
+
+The manifest is not committed to the repository (file modification times differ between checkouts anyway):
+to be useful in CI, it should be kept between runs of the workflow.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+from os import path
+from typing import Iterator, List
+
+from packed_data import PackedData, is_packed
+
+MANIFEST_FILE = "data_manifest.json"
+
+
+def _sha256(file: str) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as fi:
+        for chunk in iter(lambda: fi.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The names, sizes and modification times (in nanoseconds) of all files in the loose PR directory |dir|.
+def _stat_files(dir: str) -> dict[str, dict]:
+    result = dict()
+    for name in sorted(os.listdir(path.join("data", dir))):
+        stat = os.stat(path.join("data", dir, name))
+        result[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return result
+
+
+# The locations of all packed files of the packed directory |dir|.
+def _packed_files(packed: PackedData, dir: str) -> dict[str, dict]:
+    return {name: dict(packed.entries[dir][name]._asdict()) for name in packed.files(dir)}
+
+
+# The manifest entry for the PR directory |dir| (which may be packed) with the verdict |valid|, for its current files.
+# (This is a separate function, so validation in several processes can compute the entries in parallel.)
+def make_entry(packed: PackedData | None, dir: str, valid: bool) -> dict:
+    entry: dict = {"valid": valid}
+    if packed is not None and is_packed(packed, dir):
+        entry["packed"] = _packed_files(packed, dir)
+        try:
+            entry["timestamp"] = packed.timestamp(dir).strip()
+        except (KeyError, ValueError, UnicodeDecodeError):
+            entry["timestamp"] = None
+    else:
+        files = _stat_files(dir)
+        for (name, info) in files.items():
+            info["sha256"] = _sha256(path.join("data", dir, name))
+        entry["files"] = files
+        try:
+            with open(path.join("data", dir, "timestamp.txt"), "r") as fi:
+                entry["timestamp"] = fi.read().strip()
+        except (OSError, UnicodeDecodeError):
+            entry["timestamp"] = None
+    return entry
+
+
+class DataManifest:
+    def __init__(self, entries: dict[str, dict] = {}, file: str = MANIFEST_FILE) -> None:
+        self.entries = dict(entries)
+        self.file = file
+        # The directories whose entries were changed since loading: only these are written back by |save|.
+        self.changed: set[str] = set()
+
+    @staticmethod
+    def load(file: str = MANIFEST_FILE) -> "DataManifest":
+        try:
+            with open(file, "r") as fi:
+                return DataManifest(json.load(fi)["entries"], file)
+        except (OSError, ValueError, KeyError):
+            # A missing or broken manifest only means that all directories are validated again.
+            return DataManifest(dict(), file)
+
+    # Save the manifest, merging it with the entries of the current manifest file: several processes
+    # (e.g., download workers) can update the manifest at the same time. Entries changed in this manifest take precedence;
+    # entries of the directories in |removed| are dropped.
+    def save(self, removed: List[str] = []) -> None:
+        with self._locked():
+            merged = DataManifest.load(self.file).entries
+            merged.update({dir: self.entries[dir] for dir in self.changed})
+            for dir in removed:
+                merged.pop(dir, None)
+            self.entries = merged
+            tmp = f"{self.file}.tmp-{os.getpid()}"
+            with open(tmp, "w") as fi:
+                json.dump({"entries": dict(sorted(merged.items()))}, fi, separators=(",", ":"))
+            os.replace(tmp, self.file)
+        self.changed = set()
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # Record the verdict |valid| for the PR directory |dir| (which may be packed), with its current files.
+    def record(self, packed: PackedData | None, dir: str, valid: bool) -> None:
+        self.put(dir, make_entry(packed, dir, valid))
+
+    # Record the entry |entry| (as returned by |make_entry|) for the PR directory |dir|.
+    def put(self, dir: str, entry: dict) -> None:
+        self.entries[dir] = entry
+        self.changed.add(dir)
+
+    # Return whether the PR directory |dir| (which may be packed) was valid when it was last validated,
+    # and has not changed since.
+    def is_known_valid(self, packed: PackedData, dir: str) -> bool:
+        entry = self.entries.get(dir)
+        if entry is None or not entry["valid"]:
+            return False
+        if is_packed(packed, dir):
+            return entry.get("packed") == _packed_files(packed, dir)
+        if "files" not in entry:
+            return False
+        current = _stat_files(dir)
+        recorded = entry["files"]
+        if sorted(current) != sorted(recorded) or any(current[n]["size"] != recorded[n]["size"] for n in current):
+            return False
+        changed = [n for n in current if current[n]["mtime_ns"] != recorded[n]["mtime_ns"]]
+        if any(_sha256(path.join("data", dir, n)) != recorded[n]["sha256"] for n in changed):
+            return False
+        # The files are unchanged: remember their new modification times, so the hashes need not be computed again.
+        for n in changed:
+            recorded[n]["mtime_ns"] = current[n]["mtime_ns"]
+        if changed:
+            self.changed.add(dir)
+        return True
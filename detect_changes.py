@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+Find all PRs which were updated since the last successful run of `gather_stats.sh`.
+
+`gather_stats.sh` used to fetch the first page (100 PRs) of the most recently updated PRs, and filter those updated
+in the last few minutes: a burst of more than 100 updates, or a delayed run, silently dropped PRs.
+Instead, this script stores a *watermark*: the last update time of the most recently updated PR seen by the last
+successful run (in `change_watermark.json`). It pages through all PRs, sorted by the time of their last update
+(most recent first), until it reaches PRs updated before the watermark, and prints all PRs updated since.
+
+Github's `updated_at` times have a resolution of one second, and the REST API is not a consistent snapshot:
+a PR updated during the paging can appear on two pages (which is harmless) or, in principle, be updated right
+before the watermark time. So PRs updated up to |OVERLAP_SECONDS| before the watermark are also considered;
+the state file also records the update times of these PRs, so PRs whose update time did not change are not printed again.
+
+The new watermark only takes effect once the PRs have been downloaded: `python3 detect_changes.py list` stores it as
+"pending", and `python3 detect_changes.py commit` (run after the download) makes it the watermark.
+If the downloader fails (e.g. crashes), the next run lists the same PRs again (together with all PRs updated since).
+PRs whose download failed individually do not hold back the watermark: `gather_stats.sh` records them for a retry
+by `download_missing_outdated_PRs.sh` instead.
+
+Usage:
+- `python3 detect_changes.py list [--since-minutes N]` prints the numbers of all PRs updated since the watermark,
+  one per line. Without a watermark (e.g. on the first run), it prints the PRs updated in the last N minutes (default: 60).
+- `python3 detect_changes.py commit` makes the pending watermark the watermark.
+
+The REST requests are conditional (see `http_cache.py`): if no PR was updated, github only answers `304 Not Modified`.
+Setting GITHUB_API_URL directs these requests to a different server (such as the stub server in `stub_github.py`).
+"""
+
+import json
+import os
+import sys
+import time
+from os import path
+from functools import partial
+from typing import Callable, List, Tuple
+
+from downloader import OWNER, REPO, github_token
+from http_cache import HttpCache
+from util import eprint, epoch_to_github_time, github_time_to_epoch
+
+WATERMARK_FILE = "change_watermark.json"
+
+GITHUB_API_URL = "https://api.github.com"
+
+# PRs updated up to this many seconds before the watermark are also checked for updates.
+OVERLAP_SECONDS = 120
+
+# The number of PRs per page (github's maximum), and the maximum number of pages fetched in one run.
+PER_PAGE = 100
+MAX_PAGES = 30
+
+DEFAULT_SINCE_MINUTES = 60
+
+
+class TooManyChanges(Exception):
+    pass
+
+
+# The state of change detection: the watermark (seconds since the epoch) and the update times of all PRs
+# updated shortly before it (as a dictionary mapping PR numbers to github time strings).
+class Watermark:
+    def __init__(self, time: int, boundary: dict[int, str]) -> None:
+        self.time = time
+        self.boundary = boundary
+
+    def to_json(self) -> dict:
+        return {"watermark": epoch_to_github_time(self.time), "boundary": {str(n): t for (n, t) in sorted(self.boundary.items())}}
+
+    @staticmethod
+    def from_json(data: dict) -> "Watermark":
+        return Watermark(github_time_to_epoch(data["watermark"]), {int(n): t for (n, t) in data["boundary"].items()})
+
+
+# Read the watermark and the pending watermark from |file|.
+def load_state(file: str = WATERMARK_FILE) -> Tuple[Watermark | None, Watermark | None]:
+    if not path.exists(file):
+        return (None, None)
+    with open(file, "r") as fi:
+        data = json.load(fi)
+    (current, pending) = (data.get("current"), data.get("pending"))
+    return (current and Watermark.from_json(current), pending and Watermark.from_json(pending))
+
+
+def save_state(current: Watermark | None, pending: Watermark | None, file: str = WATERMARK_FILE) -> None:
+    data = {"current": current and current.to_json(), "pending": pending and pending.to_json()}
+    with open(file, "w") as fi:
+        json.dump(data, fi, indent=2)
+        fi.write("\n")
+
+
+# Fetch page |page| (starting at 1) of all PRs, sorted by the time of their last update (most recent first),
+# from the REST API at |api_url|, using the cache |cache| (see `http_cache.py`). Return a list of pairs (PR number, update time).
+def fetch_page(cache: HttpCache, api_url: str, token: str | None, page: int) -> List[Tuple[int, str]]:
+    url = f"{api_url}/repos/{OWNER}/{REPO}/pulls?state=all&sort=updated&direction=desc&per_page={PER_PAGE}&page={page}"
+    headers = {"Accept": "application/vnd.github+json"}
+    if token:
+        headers["Authorization"] = f"bearer {token}"
+    return [(pr["number"], pr["updated_at"]) for pr in json.loads(cache.get(url, headers))]
+
+
+# Return all PRs updated since the watermark |watermark| (or since the time |since|, if there is no watermark),
+# using |fetch_page| to fetch the pages of PRs sorted by update time, together with the new watermark.
+# Raise TooManyChanges if this takes more than |MAX_PAGES| pages.
+def detect_changes(
+    fetch_page: Callable[[int], List[Tuple[int, str]]], watermark: Watermark | None, since: int
+) -> Tuple[List[int], Watermark]:
+    if watermark is None:
+        watermark = Watermark(since, dict())
+    threshold = watermark.time - OVERLAP_SECONDS
+    # The last update time of all PRs updated since |threshold| (the same PR can appear on several pages).
+    updated: dict[int, str] = dict()
+    for page in range(1, MAX_PAGES + 1):
+        prs = fetch_page(page)
+        for (number, updated_at) in prs:
+            if github_time_to_epoch(updated_at) >= threshold:
+                updated[number] = max(updated_at, updated.get(number, updated_at))
+        if len(prs) < PER_PAGE or any(github_time_to_epoch(updated_at) < threshold for (_n, updated_at) in prs):
+            break
+    else:
+        raise TooManyChanges(f"more than {MAX_PAGES * PER_PAGE} PRs were updated since {epoch_to_github_time(threshold)}")
+    changed = sorted(n for (n, updated_at) in updated.items() if watermark.boundary.get(n) != updated_at)
+    new_time = max([watermark.time] + [github_time_to_epoch(t) for t in updated.values()])
+    boundary = {n: t for (n, t) in {**watermark.boundary, **updated}.items() if github_time_to_epoch(t) >= new_time - OVERLAP_SECONDS}
+    return (changed, Watermark(new_time, boundary))
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    (current, pending) = load_state()
+    if args == ["commit"]:
+        if pending is None:
+            eprint("warning: there is no pending watermark to commit")
+            return
+        save_state(pending, None)
+        print(f"committed watermark {epoch_to_github_time(pending.time)}")
+    elif args[:1] == ["list"] and (args[1:] == [] or (len(args) == 3 and args[1] == "--since-minutes" and args[2].isdigit())):
+        since_minutes = int(args[2]) if len(args) == 3 else DEFAULT_SINCE_MINUTES
+        since = current.time if current else int(time.time()) - 60 * since_minutes
+        cache = HttpCache()
+        api_url = os.environ.get("GITHUB_API_URL") or GITHUB_API_URL
+        try:
+            (changed, new) = detect_changes(partial(fetch_page, cache, api_url, github_token()), current, since)
+        except TooManyChanges as err:
+            eprint(f"error: {err}: please re-download all open PRs, and remove {WATERMARK_FILE}")
+            sys.exit(1)
+        finally:
+            eprint(f"info: {cache.stats()}")
+        save_state(current, new)
+        eprint(f"info: found {len(changed)} PR(s) updated since {epoch_to_github_time(since)}")
+        print("\n".join(str(n) for n in changed))
+    else:
+        eprint("usage: detect_changes.py list [--since-minutes N] | detect_changes.py commit")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
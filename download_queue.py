@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+"""
+A persistent queue of PRs whose data should be downloaded again, with per-PR state.
+
+`check_data_integrity.py` adds all PRs whose aggregate data is outdated, and removes PRs whose data is fine again.
+It also records each failed download: after a failure, a PR is not retried for a while
+(with exponential backoff), and a PR whose download failed |MAX_FAILURES| times in a row is marked as stubborn.
+The number of failed downloads in a row is counted by the download state (see `download_state.py`), and passed in:
+the queue itself only stores the time until which a PR is backing off.
+The PRs to re-download next (written into `redownload.txt`) are the ones with the highest priority
+which are not backing off. The priority of a PR (see |priority|) grows with
+- how long its data has been outdated (logarithmically: a PR outdated for days is not a hundred times as urgent),
+- whether the PR is open (open PRs are shown on the dashboard),
+- how long its data has claimed that CI is running (such information is almost surely wrong),
+and shrinks with the number of failed downloads.
+
+The queue is stored in `download_queue.json`.
+
+Usage:
+- `python3 download_queue.py ready PR_NUMBER...` prints those of the given PRs which are not backing off,
+- `python3 download_queue.py show` prints all entries of the queue, in order of priority.
+"""
+
+import json
+import math
+import sys
+import time
+from os import path
+from typing import List, NamedTuple
+
+from download_state import DownloadState
+from util import epoch_to_github_time, eprint, github_time_to_epoch
+
+QUEUE_FILE = "download_queue.json"
+
+# After this many failed downloads in a row, a PR is marked as stubborn.
+MAX_FAILURES = 3
+
+# How long to wait before retrying a failed download: this doubles after each further failure.
+BACKOFF_SECONDS = 30 * 60
+MAX_BACKOFF_SECONDS = 24 * 60 * 60
+
+# Weights of the different factors of a PR's priority.
+OPEN_PR_WEIGHT = 4.0
+CI_RUNNING_WEIGHT = 2.0
+
+
+class QueueEntry(NamedTuple):
+    number: int
+    # Whether the PR is open, according to the last check.
+    is_open: bool
+    # Since when the PR's data is outdated (in seconds since the epoch), as far as we know:
+    # this is the last update of the PR which the data knows about.
+    outdated_since: int
+    # Since when the PR's data claims that CI is running (in seconds since the epoch), if it does.
+    ci_running_since: int | None
+    # The earliest time of the next attempt (after a failed download).
+    not_before: int
+
+
+# The priority of |entry| at time |now|, given its number of failed downloads in a row |failures|:
+# entries with higher priority should be downloaded first.
+def priority(entry: QueueEntry, now: float, failures: int = 0) -> float:
+    score = 1 + math.log1p(max(0, now - entry.outdated_since) / 3600)
+    if entry.ci_running_since is not None:
+        score += CI_RUNNING_WEIGHT * math.log1p(max(0, now - entry.ci_running_since) / 3600)
+    if entry.is_open:
+        score *= OPEN_PR_WEIGHT
+    return score / (1 + failures)
+
+
+class DownloadQueue:
+    def __init__(self, entries: dict[int, QueueEntry] = {}) -> None:
+        self.entries = dict(entries)
+
+    @staticmethod
+    def load(file: str = QUEUE_FILE) -> "DownloadQueue":
+        if not path.exists(file):
+            return DownloadQueue()
+        with open(file, "r") as fi:
+            data = json.load(fi)
+        entries = dict()
+        # (Older versions also stored the number of failed downloads: it is ignored.)
+        for item in data["entries"]:
+            ci_running_since = item["ci_running_since"]
+            entries[item["number"]] = QueueEntry(
+                item["number"], item["is_open"], github_time_to_epoch(item["outdated_since"]),
+                None if ci_running_since is None else github_time_to_epoch(ci_running_since),
+                github_time_to_epoch(item["not_before"]),
+            )
+        return DownloadQueue(entries)
+
+    def save(self, file: str = QUEUE_FILE) -> None:
+        items = []
+        for entry in sorted(self.entries.values()):
+            items.append({
+                "number": entry.number,
+                "is_open": entry.is_open,
+                "outdated_since": epoch_to_github_time(entry.outdated_since),
+                "ci_running_since": None if entry.ci_running_since is None else epoch_to_github_time(entry.ci_running_since),
+                "not_before": epoch_to_github_time(entry.not_before),
+            })
+        # One line per entry keeps diffs of this file small.
+        with open(file, "w") as fi:
+            fi.write('{"entries": [\n' + ",\n".join(json.dumps(item) for item in items) + "\n]}\n")
+
+    # Add PR |number| to the queue, or update its entry (keeping its failure count and backoff).
+    def add(self, number: int, is_open: bool, outdated_since: int, ci_running_since: int | None = None) -> None:
+        old = self.entries.get(number)
+        if old is not None:
+            # The data has been outdated since the first time this was noticed.
+            outdated_since = min(outdated_since, old.outdated_since)
+            self.entries[number] = old._replace(is_open=is_open, outdated_since=outdated_since, ci_running_since=ci_running_since)
+        else:
+            self.entries[number] = QueueEntry(number, is_open, outdated_since, ci_running_since, 0)
+
+    # Remove all entries except for the PRs in |numbers|.
+    def retain(self, numbers: set[int]) -> None:
+        self.entries = {n: entry for (n, entry) in self.entries.items() if n in numbers}
+
+    # Record that downloading the data for PR |number| failed at time |now|, for the |failures|-th time in a row
+    # (see |DownloadState.record_failure|), adding the PR if necessary.
+    # Return True if the PR should now be marked as stubborn: its entry is removed then.
+    def record_failure(self, number: int, failures: int, now: float) -> bool:
+        if failures >= MAX_FAILURES:
+            self.entries.pop(number, None)
+            return True
+        entry = self.entries.get(number) or QueueEntry(number, True, int(now), None, 0)
+        backoff = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (failures - 1))
+        self.entries[number] = entry._replace(not_before=int(now + backoff))
+        return False
+
+    # Whether PR |number| may be downloaded at time |now|, i.e. is not backing off after a failure.
+    def is_ready(self, number: int, now: float) -> bool:
+        entry = self.entries.get(number)
+        return entry is None or entry.not_before <= now
+
+    # The (at most) |count| PRs with the highest priority which are ready at time |now|,
+    # given the number of failed downloads in a row of each PR |failures| (see |DownloadState.failures|).
+    def next(self, count: int, now: float, failures: dict[int, int] = {}) -> List[int]:
+        ready = [entry for entry in self.entries.values() if entry.not_before <= now]
+        ready.sort(key=lambda entry: (-priority(entry, now, failures.get(entry.number, 0)), entry.number))
+        return [entry.number for entry in ready[:count]]
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    queue = DownloadQueue.load()
+    now = time.time()
+    if args and args[0] == "ready" and all(arg.isdigit() for arg in args[1:]):
+        print(" ".join(arg for arg in args[1:] if queue.is_ready(int(arg), now)))
+    elif args == ["show"]:
+        state = DownloadState.open()
+        failures = state.failures()
+        state.close()
+        for entry in sorted(queue.entries.values(), key=lambda entry: -priority(entry, now, failures.get(entry.number, 0))):
+            backoff = f", backing off until {epoch_to_github_time(entry.not_before)}" if entry.not_before > now else ""
+            count = failures.get(entry.number, 0)
+            print(f"PR {entry.number}: priority {priority(entry, now, count):.2f}, {count} failure(s){backoff}")
+    else:
+        eprint("usage: download_queue.py ready PR_NUMBER... | download_queue.py show")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""
+The download bookkeeping for all PRs whose data is missing, which are to be backfilled, or which are stubborn,
+stored in a small SQLite database (`download_state.sqlite`).
+
+For each PR, the database records
+- its status: "missing" (an open PR without data), "backfill" (a closed PR without data) or none,
+- whether it is stubborn (i.e., only basic information is downloaded for it),
+- the number of failed downloads in a row and the last error, and the time of the last change.
+This is the only record of failed downloads: the download queue (`download_queue.py`) uses these counts
+for its backoff and priorities, and `check_data_integrity.py` marks a PR as stubborn once its count is too high.
+All changes made in one `with state.transaction():` block are committed at once (or not at all),
+and only the rows which actually change are written.
+
+The files `missing_prs.txt`, `closed_prs_to_backfill.txt` and `stubborn_prs.txt` remain the committed form of this state
+(and are read by the shell scripts, `downloader.py` and `process.py`): |DownloadState.open| reads them (so manual edits
+to these files take effect), and |DownloadState.export| writes them, keeping all manual comments and the order of all
+remaining entries. Thus, reading and writing each file happens once per run, rather than once per PR.
+If the database is lost, it is rebuilt from these files: only the failure counts and errors are lost.
+For this reason, the database is not committed; to be useful in CI, it should be kept between runs of the workflow.
+
+Usage:
+- `python3 download_state.py show` prints all PRs with failed downloads, with their last error,
+- `python3 download_state.py export` writes the `.txt` files from the database.
+"""
+
+import contextlib
+import os
+import sqlite3
+import sys
+import time
+from os import path
+from typing import Iterator, List
+
+from util import epoch_to_github_time, eprint
+
+STATE_FILE = "download_state.sqlite"
+
+# The file listing the PRs of each status.
+STATUS_FILES = {"missing": "missing_prs.txt", "backfill": "closed_prs_to_backfill.txt"}
+STUBBORN_FILE = "stubborn_prs.txt"
+
+# Failed downloads used to be tracked by such comments in 'missing_prs.txt' and 'closed_prs_to_backfill.txt':
+# these are dropped once the PR is no longer missing.
+OBSOLETE_COMMENTS = ["-- second attempt for ", "-- third attempt for "]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prs (
+    number INTEGER PRIMARY KEY,
+    status TEXT,
+    stubborn INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    changed INTEGER NOT NULL
+)
+"""
+
+
+# Read the file |file| (in the directory |directory|), and return its lines and all PR numbers listed in it.
+def _read_list(directory: str, file: str) -> tuple[List[str], List[int]]:
+    try:
+        with open(path.join(directory, file), "r") as fi:
+            lines = fi.read().strip().splitlines()
+    except FileNotFoundError:
+        return ([], [])
+    return (lines, [int(line) for line in lines if line.strip() and not line.startswith("--")])
+
+
+class DownloadState:
+    def __init__(self, connection: sqlite3.Connection, directory: str) -> None:
+        self.connection = connection
+        self.directory = directory
+
+    # Open the database in the directory |directory| (creating it if necessary), and update it from the `.txt` files.
+    @staticmethod
+    def open(directory: str = ".", now: float | None = None) -> "DownloadState":
+        connection = sqlite3.connect(path.join(directory, STATE_FILE))
+        connection.execute(_SCHEMA)
+        state = DownloadState(connection, directory)
+        state._import_files(int(time.time() if now is None else now))
+        return state
+
+    def close(self) -> None:
+        self.connection.close()
+
+    # All changes within this context are committed together, or rolled back on an exception.
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.connection:
+            yield
+
+    # Make the database agree with the `.txt` files: these are the committed state, and may have been edited by hand.
+    def _import_files(self, now: int) -> None:
+        wanted: dict[int, tuple[str | None, int]] = dict()
+        for (status, file) in STATUS_FILES.items():
+            for number in _read_list(self.directory, file)[1]:
+                wanted.setdefault(number, (status, 0))
+        for number in _read_list(self.directory, STUBBORN_FILE)[1]:
+            wanted[number] = (wanted.get(number, (None, 0))[0], 1)
+        current = {n: (s, st) for (n, s, st) in self.connection.execute("SELECT number, status, stubborn FROM prs")}
+        changes = [(n, s, st) for (n, (s, st)) in wanted.items() if current.get(n) != (s, st)]
+        changes += [(n, None, 0) for (n, value) in current.items() if n not in wanted and value != (None, 0)]
+        with self.transaction():
+            self.connection.executemany(
+                "INSERT INTO prs (number, status, stubborn, changed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET status = excluded.status, stubborn = excluded.stubborn, changed = excluded.changed",
+                [(n, s, st, now) for (n, s, st) in changes],
+            )
+
+    # All PRs with status |status|, in increasing order.
+    def with_status(self, status: str) -> List[int]:
+        return [n for (n,) in self.connection.execute("SELECT number FROM prs WHERE status = ? ORDER BY number", (status,))]
+
+    # All stubborn PRs, in increasing order.
+    def stubborn(self) -> List[int]:
+        return [n for (n,) in self.connection.execute("SELECT number FROM prs WHERE stubborn = 1 ORDER BY number")]
+
+    # Give all PRs in |numbers| which are not stubborn and have no status yet the status |status|.
+    # Return the PRs whose status was changed.
+    def add(self, status: str, numbers: List[int], now: float) -> List[int]:
+        added = []
+        for number in numbers:
+            cursor = self.connection.execute(
+                "INSERT INTO prs (number, status, changed) VALUES (?, ?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET status = excluded.status, changed = excluded.changed "
+                "WHERE prs.status IS NULL AND prs.stubborn = 0",
+                (number, status, int(now)),
+            )
+            if cursor.rowcount:
+                added.append(number)
+        return added
+
+    # The data for all PRs in |numbers| is present now: clear their status and failures.
+    def mark_done(self, numbers: List[int], now: float) -> None:
+        self.connection.executemany(
+            "UPDATE prs SET status = NULL, failures = 0, last_error = NULL, changed = ? WHERE number = ? AND status IS NOT NULL",
+            [(int(now), n) for n in numbers],
+        )
+
+    # Record that downloading the data for PR |number| failed at time |now| with the error |error|.
+    # Return the number of failed downloads of this PR in a row.
+    def record_failure(self, number: int, error: str, now: float) -> int:
+        self.connection.execute(
+            "INSERT INTO prs (number, failures, last_error, changed) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT (number) DO UPDATE SET failures = failures + 1, last_error = excluded.last_error, changed = excluded.changed",
+            (number, error, int(now)),
+        )
+        return self.connection.execute("SELECT failures FROM prs WHERE number = ?", (number,)).fetchone()[0]
+
+    # The number of failed downloads in a row of all PRs with at least one.
+    def failures(self) -> dict[int, int]:
+        return dict(self.connection.execute("SELECT number, failures FROM prs WHERE failures > 0 ORDER BY number"))
+
+    # The data for all PRs in |numbers| is fine (again), e.g. after a re-download: forget their failed downloads.
+    def clear_failures(self, numbers: List[int], now: float) -> None:
+        self.connection.executemany(
+            "UPDATE prs SET failures = 0, last_error = NULL, changed = ? WHERE number = ? AND failures > 0",
+            [(int(now), n) for n in numbers],
+        )
+
+    # Mark PR |number| as stubborn: it no longer has a status. Its failed downloads (of all data) no longer count,
+    # but the last error is kept.
+    def mark_stubborn(self, number: int, now: float) -> None:
+        self.connection.execute(
+            "INSERT INTO prs (number, stubborn, changed) VALUES (?, 1, ?) "
+            "ON CONFLICT (number) DO UPDATE SET status = NULL, stubborn = 1, failures = 0, changed = excluded.changed",
+            (number, int(now)),
+        )
+
+    # Write the `.txt` files for the current state. Comments and the order of all remaining entries are kept;
+    # new entries are appended. Files whose contents do not change are not written.
+    def export(self) -> None:
+        pending = set(self.with_status("missing")) | set(self.with_status("backfill"))
+        for (file, numbers) in [(f, self.with_status(s)) for (s, f) in STATUS_FILES.items()] + [(STUBBORN_FILE, self.stubborn())]:
+            (lines, listed) = _read_list(self.directory, file)
+            keep = set(numbers)
+            new_lines = []
+            for line in lines:
+                if line.startswith("--"):
+                    obsolete = [c for c in OBSOLETE_COMMENTS if line.startswith(c)]
+                    if obsolete and int(line.removeprefix(obsolete[0])) not in pending:
+                        continue
+                    new_lines.append(line)
+                elif not line.strip() or int(line) in keep:
+                    new_lines.append(line)
+            new_lines += [str(n) for n in numbers if n not in set(listed)]
+            content = "\n".join(new_lines) + "\n"
+            if new_lines != lines or not path.exists(path.join(self.directory, file)):
+                tmp = path.join(self.directory, f"{file}.tmp-{os.getpid()}")
+                with open(tmp, "w") as fi:
+                    fi.write(content)
+                os.replace(tmp, path.join(self.directory, file))
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    if args == ["show"]:
+        state = DownloadState.open()
+        rows = state.connection.execute(
+            "SELECT number, status, stubborn, failures, last_error, changed FROM prs "
+            "WHERE failures > 0 OR last_error IS NOT NULL ORDER BY number"
+        )
+        for (number, status, stubborn, failures, last_error, changed) in rows:
+            kind = "stubborn" if stubborn else (status or "done")
+            print(f"PR {number} ({kind}): {failures} failure(s), last error '{last_error}', last changed {epoch_to_github_time(changed)}")
+    elif args == ["export"]:
+        DownloadState.open().export()
+    else:
+        eprint("usage: download_state.py show | download_state.py export")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+
+"""
+Download data about PRs from github's GraphQL API into the `data` directory.
+
+This replaces the per-PR loops in the shell scripts, which ran one `gh api graphql` process per query and PR:
+here, PRs are downloaded concurrently (with a bounded number of concurrent downloads),
+over a small pool of HTTP connections which are re-used between requests.
+Transient failures (network errors, server errors, rate limiting and time-outs) are retried with exponential backoff.
+Connections with more than one page of data (such as the commits of a large PR) are downloaded completely,
+by following their cursors (see `pagination.py`). If complete data for a PR has already been downloaded,
+`pr_info.json` is updated incrementally: only timeline items, commits, comments and reviews after the stored cursors
+are downloaded (together with all other, small fields). `pr_reactions.json` is always downloaded completely.
+
+The on-disk layout is the same as before:
+- for a normal PR, `data/<N>` contains `pr_info.json`, `pr_reactions.json` and `timestamp.txt`,
+- for a stubborn PR, `data/<N>-basic` contains `basic_pr_info.json` and `timestamp.txt`.
+All files for a PR are first written to a temporary directory `data/<N>-temp`, which is only moved into place
+once the download is complete. If a download fails, the temporary directory is removed again.
+JSON files are stored in the format given by the environment variable `DATA_COMPRESSION`
+(`none`, `gz` or `zst`; see `util.encode_json_data`).
+
+Usage: `python3 downloader.py [--jobs J] [--max-batch-size B] [--normal] [--full] [--record-failures FILE] PR_NUMBER...`
+or `python3 downloader.py [OPTIONS...] --worker NAME [--claim N] [--lease-seconds T]`
+- `--jobs J` sends at most J requests at once (default: 4),
+- `--max-batch-size B` downloads up to B PRs in one request (default: 20; see `graphql_batch.py`). The batch size
+  is chosen adaptively, depending on the response times. With `--max-batch-size 1`, each PR is downloaded separately,
+- `--normal` downloads normal information for all PRs (by default, PRs in `stubborn_prs.txt` only get basic information),
+- `--full` downloads all data completely, even if it could be updated incrementally,
+- `--record-failures FILE` appends the numbers of all non-stubborn PRs whose download failed to FILE.
+The exit code is 2 if any download failed (after recording the failures), and 1 on other errors (such as a usage error).
+
+With `--worker NAME`, no PR numbers are given: instead, the downloader takes its PRs from the work queue (see `work_queue.py`),
+as the worker NAME, until the queue is empty. Several workers (on one or more machines) can drain the same queue at once.
+- `--claim N` claims N PRs at a time (default: J times B),
+- `--lease-seconds T` claims them for T seconds (default: 15 minutes).
+
+The github token is read from the environment variables GH_TOKEN or GITHUB_TOKEN, or from `gh auth token`.
+The cost of all queries is recorded in the rate limit ledger (see `rate_limit.py`).
+All directories written are recorded as valid in the data manifest (see `data_manifest.py`).
+Setting GITHUB_GRAPHQL_URL directs all requests to a different server (for instance, a local stub server for testing).
+"""
+
+import asyncio
+import functools
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from os import path
+from typing import List, Tuple
+from urllib.parse import urlsplit
+
+from data_manifest import DataManifest
+from graphql_batch import AdaptiveBatchSize, build_batch_query, split_batch_response
+from pagination import merge_page, merge_update, next_pages, page_query, update_query, update_variables
+from rate_limit import RateLimitLedger, pop_rate_limit, with_rate_limit
+from util import eprint, encode_json_data, find_data_file, parse_json_file
+from work_queue import LEASE_SECONDS, WorkQueue
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+OWNER = "leanprover-community"
+REPO = "mathlib4"
+
+# How often a request is tried at most, and the initial delay (in seconds) before retrying a failed request.
+# Each further retry waits twice as long (plus some random jitter).
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 2.0
+
+# HTTP status codes which indicate a transient problem: retrying later will probably help.
+# (Github answers time-outs of GraphQL queries with 502, and rate limiting with 403 or 429.)
+TRANSIENT_STATUS_CODES = [403, 429, 500, 502, 503, 504]
+
+# The exit code if some downloads failed, but the downloader ran to completion (and recorded the failures).
+DOWNLOAD_FAILED_EXIT_CODE = 2
+
+USAGE = (
+    "usage: downloader.py [--jobs J] [--max-batch-size B] [--normal] [--full] [--record-failures FILE] "
+    "(PR_NUMBER... | --worker NAME [--claim N] [--lease-seconds T])"
+)
+
+
+class DownloadError(Exception):
+    pass
+
+
+# Raised when github aborted a query for taking too long or asking for too much data:
+# a smaller query (e.g., a batch with fewer PRs) might succeed.
+class QueryTooLarge(DownloadError):
+    pass
+
+
+# Raised when github reports that the PR asked for does not exist (e.g., as its number belongs to an issue):
+# retrying will not help.
+class PRNotFound(DownloadError):
+    pass
+
+
+# Whether all GraphQL errors in |errors| say that the PR asked for does not exist.
+# (Errors about the repository itself, e.g. due to missing permissions, have a shorter path and do not count.)
+def is_not_found(errors: List[dict]) -> bool:
+    return bool(errors) and all(
+        err.get("type") == "NOT_FOUND" and len(err.get("path") or []) >= 2 and err["path"][0] == "repository" for err in errors
+    )
+
+
+# GraphQL error types which indicate that a query was too large.
+TOO_LARGE_ERROR_TYPES = ["TIMEOUT", "MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED"]
+
+
+# A client for github's GraphQL API, using a pool of at most |max_connections| persistent connections.
+# Requests are sent from worker threads (`http.client` is blocking), one connection per request at a time.
+# If |ledger| is given, each query also asks for github's rate limit status, which is recorded in |ledger|.
+class GraphQLClient:
+    def __init__(
+        self, url: str, token: str | None, max_connections: int, backoff: float = BACKOFF_SECONDS, ledger: RateLimitLedger | None = None
+    ) -> None:
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname or ""
+        self.port = parts.port
+        self.path = parts.path or "/"
+        self.token = token
+        self.backoff = backoff
+        self.ledger = ledger
+        self._max_connections = max_connections
+        self._pool: asyncio.Queue | None = None
+        self._connections: List[http.client.HTTPConnection] = []
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=120)
+        return http.client.HTTPConnection(self.host, self.port, timeout=120)
+
+    async def _acquire(self) -> http.client.HTTPConnection:
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            for _ in range(self._max_connections):
+                conn = self._new_connection()
+                self._connections.append(conn)
+                self._pool.put_nowait(conn)
+        return await self._pool.get()
+
+    # Send a single POST request with the JSON-encoded |body|. Return the HTTP status, headers and response body.
+    # On network errors, the connection is closed (it is re-opened automatically on the next request).
+    def _post(self, conn: http.client.HTTPConnection, body: bytes) -> Tuple[int, dict[str, str], bytes]:
+        headers = {"Content-Type": "application/json", "Accept": "application/json", "User-Agent": "queueboard-downloader"}
+        if self.token:
+            headers["Authorization"] = f"bearer {self.token}"
+        try:
+            conn.request("POST", self.path, body, headers)
+            response = conn.getresponse()
+            return (response.status, dict(response.getheaders()), response.read())
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+
+    # Run the GraphQL query |query| with the given variables, and return the parsed response.
+    # Transient failures are retried (with backoff); raise a DownloadError if all attempts fail
+    # or github returns an error which does not look transient.
+    # |kind| describes the query (e.g. "pr_info"), for estimating the cost of each kind of query.
+    async def query(self, query: str, variables: dict, kind: str = "query") -> dict:
+        return (await self.request(query, variables, kind=kind))[0]
+
+    # Like |query|, but also return the size of the response (in bytes).
+    # If |allow_errors| is true, responses containing (non-transient) errors are returned as long as they contain data.
+    # If |retry_timeouts| is false, time-outs (and other signs of a query being too large) are not retried:
+    # a QueryTooLarge exception is raised instead.
+    async def request(
+        self, query: str, variables: dict, allow_errors: bool = False, retry_timeouts: bool = True, kind: str = "query"
+    ) -> Tuple[dict, int]:
+        if self.ledger is not None:
+            query = with_rate_limit(query)
+        body = json.dumps({"query": query, "variables": variables}).encode()
+        problem = ""
+        # How long github asked us to wait before retrying, if it did.
+        retry_after: float | None = None
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt > 0:
+                delay = retry_after if retry_after is not None else self.backoff * 2 ** (attempt - 1) * (1 + random.random())
+                await asyncio.sleep(delay)
+            retry_after = None
+            conn = await self._acquire()
+            try:
+                (status, headers, content) = await asyncio.to_thread(self._post, conn, body)
+            except (OSError, http.client.HTTPException) as err:
+                problem = f"network error: {err!r}"
+                continue
+            finally:
+                assert self._pool is not None
+                self._pool.put_nowait(conn)
+            if status in [502, 504] and not retry_timeouts:
+                raise QueryTooLarge(f"HTTP status {status}")
+            # A 403 response is only transient if it is about rate limiting (and not, e.g., about missing permissions).
+            is_rate_limited = "Retry-After" in headers or b"rate limit" in content.lower()
+            if status in TRANSIENT_STATUS_CODES and (status != 403 or is_rate_limited):
+                problem = f"HTTP status {status}"
+                if headers.get("Retry-After", "").isdigit():
+                    retry_after = float(headers["Retry-After"])
+                continue
+            if status != 200:
+                raise DownloadError(f"HTTP status {status}: {content[:200]!r}")
+            try:
+                data = json.loads(content)
+            except json.decoder.JSONDecodeError:
+                problem = "invalid JSON response"
+                continue
+            rate_limit = pop_rate_limit(data)
+            if self.ledger is not None and rate_limit is not None:
+                self.ledger.record(rate_limit, kind)
+            errors = data.get("errors") or []
+            error_types = [err.get("type") for err in errors]
+            if "RATE_LIMITED" in error_types or ("TIMEOUT" in error_types and retry_timeouts):
+                problem = f"github reported {'RATE_LIMITED' if 'RATE_LIMITED' in error_types else 'TIMEOUT'}"
+                continue
+            if not retry_timeouts and any(t in TOO_LARGE_ERROR_TYPES for t in error_types):
+                raise QueryTooLarge(f"github reported {[t for t in error_types if t in TOO_LARGE_ERROR_TYPES][0]}")
+            if not allow_errors and is_not_found(errors):
+                raise PRNotFound(f"github returned errors: {json.dumps(errors)[:500]}")
+            if "data" not in data or (errors and not allow_errors):
+                raise DownloadError(f"github returned errors: {json.dumps(errors)[:500]}")
+            return (data, len(content))
+        raise DownloadError(f"giving up after {MAX_ATTEMPTS} attempts; last problem: {problem}")
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+
+
+@functools.cache
+def _read_query(name: str) -> str:
+    with open(f"{name}.graphql", "r") as fi:
+        return fi.read()
+
+
+# Write the contents of the directory for one PR: |files| maps each file name to its JSON contents.
+# The directory is assembled in `data/<number>-temp`, and only moved to `data/<dirname>` if complete. Return |dirname|.
+def _write_pr_directory(number: int, dirname: str, files: dict[str, dict], timestamp: str, compression: str) -> str:
+    tmpdir = path.join("data", f"{number}-temp")
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    try:
+        for (name, data) in files.items():
+            (suffix, content) = encode_json_data(data, compression)
+            with open(path.join(tmpdir, name + suffix), "wb") as fi:
+                fi.write(content)
+        with open(path.join(tmpdir, "timestamp.txt"), "w") as fi:
+            fi.write(f"{timestamp}\n")
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    shutil.rmtree(path.join("data", dirname), ignore_errors=True)
+    os.rename(tmpdir, path.join("data", dirname))
+    return dirname
+
+
+# Download all further pages of the connections which are incomplete in |response|, the response to the query |name|
+# for PR |number|, and add them to |response| (see `pagination.py`). Raise a DownloadError if downloading failed.
+async def fetch_remaining_pages(client: GraphQLClient, name: str, number: int, response: dict) -> None:
+    async def fetch(connection: str, cursor: str) -> None:
+        while True:
+            variables = {"owner": OWNER, "repo": REPO, "prNumber": number, "cursor": cursor}
+            page = await client.query(page_query(name, connection), variables, kind=f"{name}.{connection}")
+            merge_page(response, connection, page)
+            cursor = next_pages(name, response).get(connection)
+            if cursor is None:
+                return
+
+    await asyncio.gather(*[fetch(conn, cursor) for (conn, cursor) in next_pages(name, response).items()])
+
+
+# Run the query |name| for PR |number|, including all further pages. Raise a DownloadError if downloading failed.
+async def query_pr(client: GraphQLClient, name: str, number: int) -> dict:
+    response = await client.query(_read_query(name), {"owner": OWNER, "repo": REPO, "prNumber": number}, kind=name)
+    await fetch_remaining_pages(client, name, number, response)
+    return response
+
+
+def _stored_pr_info_file(number: int) -> str:
+    return find_data_file(path.join("data", str(number), "pr_info.json"))
+
+
+# Download the data from `pr_info.graphql` for PR |number|. If |incremental| is true and complete data
+# has been downloaded before, only download what changed since then (see `pagination.py`).
+# Raise a DownloadError if downloading failed.
+async def query_pr_info(client: GraphQLClient, number: int, incremental: bool) -> dict:
+    stored_file = _stored_pr_info_file(number)
+    stored = parse_json_file(stored_file, str(number)) if incremental and path.exists(stored_file) else None
+    variables = update_variables(stored) if isinstance(stored, dict) else None
+    if isinstance(stored, dict) and variables is not None:
+        update = await client.query(
+            update_query(), {"owner": OWNER, "repo": REPO, "prNumber": number, **variables}, kind="pr_info_update"
+        )
+        await fetch_remaining_pages(client, "pr_info", number, update)
+        if merge_update(stored, update):
+            return update
+        print(f"info: the data for PR {number} cannot be updated incrementally, downloading it completely")
+    return await query_pr(client, "pr_info", number)
+
+
+# Download all data for the PR |number| and write it to the `data` directory; return the name of the directory written.
+# Stubborn PRs only get basic information. Raise a DownloadError if downloading failed.
+async def download_pr(
+    client: GraphQLClient, number: int, is_stubborn: bool, timestamp: str, compression: str, incremental: bool = True
+) -> str:
+    if is_stubborn:
+        basic = await query_pr(client, "basic_pr_info", number)
+        return _write_pr_directory(number, f"{number}-basic", {"basic_pr_info.json": basic}, timestamp, compression)
+    (info, reactions) = await asyncio.gather(
+        query_pr_info(client, number, incremental), query_pr(client, "pr_reactions", number)
+    )
+    return _write_pr_directory(number, str(number), {"pr_info.json": info, "pr_reactions.json": reactions}, timestamp, compression)
+
+
+# Download all data for the PRs in |batch| using a single batched query (see `graphql_batch.py`),
+# and write it to the `data` directory. Return the list of PRs whose download failed.
+# If the query is too large, split the batch in half (and tell |sizer| about it).
+# PRs which do not exist are added to |not_found| instead, if given, and the directories written to |written| (see |download_prs|).
+async def download_batch(
+    client: GraphQLClient, sizer: AdaptiveBatchSize, batch: List[int], stubborn: List[int], timestamp: str, compression: str,
+    not_found: List[int] | None = None, written: List[str] | None = None,
+) -> List[int]:
+    requests = [(name, n) for n in batch for name in (["basic_pr_info"] if n in stubborn else ["pr_info", "pr_reactions"])]
+    start = time.monotonic()
+    try:
+        (response, size) = await client.request(
+            build_batch_query(requests), {"owner": OWNER, "repo": REPO}, allow_errors=True, retry_timeouts=len(batch) == 1, kind="batch"
+        )
+    except QueryTooLarge as err:
+        sizer.record_timeout()
+        half = len(batch) // 2
+        print(f"info: batched query for {len(batch)} PRs was too large ({err}), splitting it")
+        return (await download_batch(client, sizer, batch[:half], stubborn, timestamp, compression, not_found, written)
+                + await download_batch(client, sizer, batch[half:], stubborn, timestamp, compression, not_found, written))
+    except DownloadError as err:
+        eprint(f"error: downloading data for PR(s) {batch} failed: {err}")
+        return batch
+    sizer.record_success(len(batch), time.monotonic() - start, size)
+    responses = split_batch_response(response, requests)
+    failed = []
+    for number in batch:
+        files = {f"{name}.json": responses[(name, n)] for (name, n) in requests if n == number}
+        errors = [err for data in files.values() for err in data.get("errors", [])]
+        if errors:
+            eprint(f"error: downloading data for PR {number} failed: github returned errors: {json.dumps(errors)[:500]}")
+            (not_found if not_found is not None and is_not_found(errors) else failed).append(number)
+            continue
+        try:
+            await asyncio.gather(*[
+                fetch_remaining_pages(client, name, n, responses[(name, n)]) for (name, n) in requests if n == number
+            ])
+        except DownloadError as err:
+            eprint(f"error: downloading further pages for PR {number} failed: {err}")
+            failed.append(number)
+            continue
+        dirname = _write_pr_directory(number, f"{number}-basic" if number in stubborn else str(number), files, timestamp, compression)
+        if written is not None:
+            written.append(dirname)
+        print(f"downloaded data for PR {number}")
+    return failed
+
+
+# Download data for all PRs in |numbers|, using at most |jobs| concurrent requests. Return the list of PRs whose download failed.
+# If |sizer| is given, several PRs are downloaded in each request, with the batch size chosen by |sizer|;
+# otherwise, each PR is downloaded using separate requests.
+# If |incremental| is true, PRs with stored data are updated incrementally (using separate requests per PR).
+# If |not_found| is given, PRs which do not exist according to github (see |PRNotFound|) are added to it,
+# rather than to the list of failed PRs. If |written| is given, the names of all directories written are added to it
+# (for |record_in_manifest|).
+async def download_prs(
+    client: GraphQLClient, numbers: List[int], stubborn: List[int], jobs: int, compression: str,
+    sizer: AdaptiveBatchSize | None = None, incremental: bool = True, not_found: List[int] | None = None,
+    written: List[str] | None = None,
+) -> List[int]:
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    failed: List[int] = []
+    if sizer is None:
+        (single, pending) = (numbers, [])
+    else:
+        single = [n for n in numbers if incremental and n not in stubborn and path.exists(_stored_pr_info_file(n))]
+        pending = [n for n in numbers if n not in single]
+
+    async def worker() -> None:
+        assert sizer is not None
+        while pending:
+            batch = pending[:sizer.size]
+            del pending[:len(batch)]
+            failed.extend(await download_batch(client, sizer, batch, stubborn, timestamp, compression, not_found, written))
+
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def inner(number: int) -> None:
+        async with semaphore:
+            try:
+                dirname = await download_pr(client, number, number in stubborn, timestamp, compression, incremental)
+                if written is not None:
+                    written.append(dirname)
+                print(f"downloaded data for PR {number}")
+            except DownloadError as err:
+                eprint(f"error: downloading data for PR {number} failed: {err}")
+                (not_found if not_found is not None and isinstance(err, PRNotFound) else failed).append(number)
+
+    await asyncio.gather(*[inner(n) for n in single], *[worker() for _ in range(jobs if pending else 0)])
+    return sorted(failed)
+
+
+# Drain the work queue |queue| (see `work_queue.py`) as the worker |worker|: repeatedly claim (at most) |claim_size| PRs,
+# download them (as |download_prs| does) and mark them as completed or failed, until no PR can be claimed.
+# PRs of kind "closed" get normal information even if they are stubborn.
+# Return the list of PRs downloaded, and the list of PRs whose (last) download by this worker failed.
+# If |written| is given, the names of all directories written are added to it.
+async def drain_work_queue(
+    client: GraphQLClient, queue: WorkQueue, worker: str, claim_size: int, lease_seconds: int, stubborn: List[int], jobs: int,
+    compression: str, sizer: AdaptiveBatchSize | None = None, incremental: bool = True, written: List[str] | None = None,
+) -> Tuple[List[int], List[int]]:
+    (downloaded, failed) = ([], set())
+    while True:
+        claimed = queue.claim(worker, claim_size, time.time(), lease_seconds)
+        if not claimed:
+            break
+        for kind in dict.fromkeys(kind for (kind, _n) in claimed):
+            numbers = [n for (k, n) in claimed if k == kind]
+            kind_failed = await download_prs(
+                client, numbers, [] if kind == "closed" else stubborn, jobs, compression, sizer, incremental, written=written
+            )
+            completed = queue.complete(worker, [n for n in numbers if n not in kind_failed])
+            for number in queue.fail(worker, kind_failed, time.time()):
+                print(f"info: downloading data for PR {number} failed too often, removing it from the work queue")
+            downloaded.extend(completed)
+            failed.difference_update(completed)
+            failed.update(kind_failed)
+    return (sorted(downloaded), sorted(failed))
+
+
+# Record the data directories |dirnames|, which were just written by a download, as valid in the data manifest
+# (see `data_manifest.py`). Other directories of the same PRs (e.g. `data/<number>-basic` next to `data/<number>`)
+# were not touched by this download, so their entries are kept as they are.
+def record_in_manifest(dirnames: List[str]) -> None:
+    if not dirnames:
+        return
+    manifest = DataManifest.load()
+    for dirname in dirnames:
+        manifest.record(None, dirname, True)
+    manifest.save()
+
+
+def read_stubborn_prs() -> List[int]:
+    with open("stubborn_prs.txt", "r") as fi:
+        return [int(line) for line in fi.read().splitlines() if line.strip() and not line.startswith("--")]
+
+
+def github_token() -> str | None:
+    token = os.environ.get("GH_TOKEN") or os.environ.get("GITHUB_TOKEN")
+    if token:
+        return token
+    try:
+        return subprocess.run(["gh", "auth", "token"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    (jobs, all_normal, failures_file, max_batch_size, incremental) = (4, False, None, 20, True)
+    (worker, claim_size, lease_seconds) = (None, None, LEASE_SECONDS)
+    numbers: List[int] = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--jobs" and args and args[0].isdigit() and int(args[0]) > 0:
+            jobs = int(args.pop(0))
+        elif arg == "--max-batch-size" and args and args[0].isdigit() and int(args[0]) > 0:
+            max_batch_size = int(args.pop(0))
+        elif arg == "--normal":
+            all_normal = True
+        elif arg == "--full":
+            incremental = False
+        elif arg == "--record-failures" and args:
+            failures_file = args.pop(0)
+        elif arg == "--worker" and args:
+            worker = args.pop(0)
+        elif arg == "--claim" and args and args[0].isdigit() and int(args[0]) > 0:
+            claim_size = int(args.pop(0))
+        elif arg == "--lease-seconds" and args and args[0].isdigit() and int(args[0]) > 0:
+            lease_seconds = int(args.pop(0))
+        elif arg.isdigit() and worker is None:
+            numbers.append(int(arg))
+        else:
+            eprint(USAGE)
+            sys.exit(1)
+    if worker is not None and numbers:
+        eprint(USAGE)
+        sys.exit(1)
+    compression = os.environ.get("DATA_COMPRESSION") or "none"
+    stubborn = [] if all_normal else read_stubborn_prs()
+    url = os.environ.get("GITHUB_GRAPHQL_URL") or GITHUB_GRAPHQL_URL
+    ledger = RateLimitLedger.load()
+    client = GraphQLClient(url, github_token(), max_connections=jobs, ledger=ledger)
+    try:
+        sizer = AdaptiveBatchSize(maximum=max_batch_size) if max_batch_size > 1 else None
+        written: List[str] = []
+        if worker is None:
+            failed = asyncio.run(download_prs(client, numbers, stubborn, jobs, compression, sizer, incremental, written=written))
+            downloaded = [n for n in numbers if n not in failed]
+        else:
+            (downloaded, failed) = asyncio.run(drain_work_queue(
+                client, WorkQueue(), worker, claim_size or jobs * max_batch_size, lease_seconds, stubborn, jobs, compression, sizer, incremental,
+                written
+            ))
+    finally:
+        client.close()
+    if ledger.run_cost > 0:
+        ledger.record_run(len(downloaded))
+        ledger.save()
+    record_in_manifest(written)
+    # Failed downloads of stubborn PRs are not recorded: `check_data_integrity.py` treats recorded PRs as normal PRs.
+    if failures_file and [n for n in failed if n not in stubborn]:
+        with open(failures_file, "a") as fi:
+            fi.write("".join(f"{n}\n" for n in failed if n not in stubborn))
+    print(f"downloaded data for {len(downloaded)} PR(s), {len(failed)} download(s) failed")
+    if failed:
+        sys.exit(DOWNLOAD_FAILED_EXIT_CODE)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,7 @@ from dashboard import (
     infer_pr_url,
     parse_aggregate_file,
     pr_link,
+    read_assignment_files,
     user_link,
     write_dashboard,
     write_webpage,
@@ -138,7 +139,7 @@ def ensure_file(filename):
 def main() -> None:
     with open(ensure_file(path.join("processed_data", "all_pr_data.json")), "r") as fi:
         parsed = parse_aggregate_file(json.load(fi))
-    stats = collect_assignment_statistics(parsed)
+    stats = collect_assignment_statistics(*read_assignment_files())
 
     title = "  <h1>PR assigment overview</h1>"
     welcome = "<p>This is a hidden page, meant for maintainers: it displays information on which PRs are assigned and suggests appropriate reviewers for unassigned PRs. In the future, it could provide the means to contact them. To prevent spam, for now this page is a bit hidden: it has to be generated locally from a script.</p>"
@@ -162,7 +163,7 @@ def main() -> None:
     for name, (prs, n_weighted, n_all) in stats.assignments.items():
         formatted_prs = [pr_link(int(pr), infer_pr_url(pr), parsed[pr].title) for pr in prs]
         # FUTURE: add a detailed computation of this count, explanation how this sums up?
-        # (If so, make _compute_weight return a number and an explanatory string and use the latter here.)
+        # (The weight of each PR, and the inputs it depends on, are stored in the aggregate data.)
         tbody += _write_table_row([user_link(name), ", ".join(formatted_prs), str(len(prs)), f"{n_weighted:.1f}", str(n_all), ""], "    ")
     table = f"  <table>\n{thead}{tbody}  </table>"
     stats_section = f"{header}\n{intro}\n{stat}\n{table}"
@@ -175,7 +176,7 @@ def main() -> None:
     # NB. Add an empty column to please the formatting script.
     thead = _write_table_header(["Github username", "Zulip handle", "Topic areas", "Comments", curr, ""], "    ")
     tbody = ""
-    for rev in parsed_reviewers:
+    for rev in parsed_reviewers.reviewers:
         if rev.github in stats.assignments:
             (pr_numbers, n_weighted, n_all) = stats.assignments[rev.github]
             numbers = ", ".join([str(n) for n in pr_numbers]) if pr_numbers else "none"
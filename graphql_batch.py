@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+Batch GraphQL queries for several PRs into one request.
+
+Each of the queries `pr_info.graphql`, `pr_reactions.graphql` and `basic_pr_info.graphql` asks for data about one PR
+(`pullRequest(number: $prNumber) { ... }`). Github's GraphQL API allows asking for several PRs in one document
+by giving each `pullRequest` field an alias:
+    query($owner: String!, $repo: String!) {
+      repository(owner: $owner, name: $repo) {
+        pr_info_123: pullRequest(number: 123) { ... }
+        pr_reactions_123: pullRequest(number: 123) { ... }
+        pr_info_124: pullRequest(number: 124) { ... }
+      }
+    }
+The response is split into one response per query and PR, in exactly the format of a single query's response
+(`{"data": {"repository": {"pullRequest": ...}}}`), so the files written to disk are the same as before.
+
+How many PRs fit into one request depends on the PRs: github aborts queries running longer than about ten seconds.
+|AdaptiveBatchSize| chooses the batch size adaptively: it grows slowly while requests are fast,
+and is halved whenever a request times out (additive increase, multiplicative decrease).
+"""
+
+import functools
+import re
+from typing import List, Tuple
+
+# The per-PR queries which can be batched.
+QUERIES = ["pr_info", "pr_reactions", "basic_pr_info"]
+
+
+# Return the selection set of the `pullRequest` field in the GraphQL query |query|, including the outer braces.
+def pull_request_selection(query: str) -> str:
+    start = query.index("pullRequest(number: $prNumber)")
+    start = query.index("{", start)
+    depth = 0
+    for (i, char) in enumerate(query[start:], start):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return query[start:i + 1]
+    raise ValueError("unbalanced braces in GraphQL query")
+
+
+# The selection set of the query `<name>.graphql`.
+@functools.cache
+def query_selection(name: str) -> str:
+    with open(f"{name}.graphql", "r") as fi:
+        return pull_request_selection(fi.read())
+
+
+def alias(name: str, number: int) -> str:
+    return f"{name}_{number}"
+
+
+# Build a single GraphQL document asking for all pairs (query name, PR number) in |requests|.
+# The document has variables $owner and $repo, like the per-PR queries.
+def build_batch_query(requests: List[Tuple[str, int]]) -> str:
+    fields = "".join(
+        f"    {alias(name, number)}: pullRequest(number: {number}) {query_selection(name)}\n" for (name, number) in requests
+    )
+    return "query($owner: String!, $repo: String!) {\n  repository(owner: $owner, name: $repo) {\n" + fields + "  }\n}\n"
+
+
+# Inverse of |build_batch_query|, as used by the stub server in `stub_github.py`: return the list of
+# all pairs (query name, PR number) asked for in the batched document |query|, or None if a field's selection is unknown.
+def parse_batch_query(query: str) -> List[Tuple[str, int]] | None:
+    result = []
+    for match in re.finditer(r"(\w+)_(\d+): pullRequest\(number: (\d+)\) ", query):
+        (name, number) = (match.group(1), int(match.group(3)))
+        if name not in QUERIES or not query.startswith(query_selection(name), match.end()):
+            return None
+        result.append((name, number))
+    return result
+
+
+# Split the response |response| to a batched query for |requests| into one response per request,
+# each in the format of the response to a single per-PR query.
+# Errors are assigned to the request they concern (using their `path`): such requests get a response
+# with an "errors" field (like a failed single query). Errors not concerning a particular request are assigned to all requests.
+def split_batch_response(response: dict, requests: List[Tuple[str, int]]) -> dict[Tuple[str, int], dict]:
+    repository = (response.get("data") or {}).get("repository") or {}
+    errors_by_alias: dict[str, List[dict]] = dict()
+    global_errors: List[dict] = []
+    for error in response.get("errors") or []:
+        path = error.get("path") or []
+        if len(path) >= 2 and path[0] == "repository":
+            errors_by_alias.setdefault(path[1], []).append(error)
+        else:
+            global_errors.append(error)
+    result = dict()
+    for (name, number) in requests:
+        key = alias(name, number)
+        single: dict = {"data": {"repository": {"pullRequest": repository.get(key)}}}
+        errors = errors_by_alias.get(key, []) + global_errors
+        if errors:
+            single["errors"] = errors
+        elif repository.get(key) is None:
+            single["errors"] = [{"type": "NOT_FOUND", "message": f"no data for {key} in the batched response"}]
+        result[(name, number)] = single
+    return result
+
+
+# Choose the number of PRs per batched request adaptively.
+# |size| grows by one after each request for a full batch which took less than |target_seconds| and returned
+# less than |max_bytes|; it shrinks by a quarter after slower or larger responses, and is halved after a time-out.
+class AdaptiveBatchSize:
+    def __init__(self, initial: int = 4, maximum: int = 25, target_seconds: float = 4.0, max_bytes: int = 8_000_000) -> None:
+        self.size = max(1, min(initial, maximum))
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+
+    def record_success(self, number_prs: int, seconds: float, response_bytes: int) -> None:
+        if seconds > self.target_seconds or response_bytes > self.max_bytes:
+            self.size = max(1, self.size - max(1, self.size // 4))
+        elif number_prs >= self.size:
+            self.size = min(self.maximum, self.size + 1)
+
+    def record_timeout(self) -> None:
+        self.size = max(1, self.size // 2)
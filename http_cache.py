@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+A local cache for GET requests to github's REST API, using conditional requests.
+
+For each URL, the cache stores the last response body together with its `ETag` and `Last-Modified` headers.
+Further requests for the same URL send these as `If-None-Match` and `If-Modified-Since`: if the resource did not change,
+github answers with `304 Not Modified` and an empty body (and such responses do not count against the REST rate limit),
+and the cached body is used instead.
+
+Github's GraphQL API does not support conditional requests: this cache only helps with REST requests
+(such as the ones in `detect_changes.py`).
+
+The cache is stored in the directory `.http_cache` (one file per URL), which is not committed to the repository:
+to be useful in CI, it should be kept between runs of the workflow.
+"""
+
+import hashlib
+import json
+import os
+import urllib.error
+import urllib.request
+from os import path
+
+CACHE_DIRECTORY = ".http_cache"
+
+
+class HttpCache:
+    def __init__(self, directory: str = CACHE_DIRECTORY) -> None:
+        self.directory = directory
+        # Statistics for this run: the number of requests, the number of responses served from the cache
+        # (after a 304 response), and the number of bytes downloaded and not downloaded thanks to the cache.
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+
+    def _entry_file(self, url: str) -> str:
+        return path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def _read_entry(self, url: str) -> dict | None:
+        try:
+            with open(self._entry_file(url), "r") as fi:
+                entry = json.load(fi)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _write_entry(self, url: str, etag: str | None, last_modified: str | None, body: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        file = self._entry_file(url)
+        tmp = f"{file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as fi:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "body": body.decode()}, fi)
+        os.replace(tmp, file)
+
+    # Send a GET request for |url| (with the additional headers |headers|), using a conditional request
+    # if a previous response is cached. Return the response body.
+    # Errors (except for 304 responses) are raised as `urllib.error.HTTPError`, like `urllib.request.urlopen` does.
+    def get(self, url: str, headers: dict[str, str] = {}, timeout: float = 60) -> bytes:
+        self.requests += 1
+        entry = self._read_entry(url)
+        headers = dict(headers)
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                body = response.read()
+                (etag, last_modified) = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        except urllib.error.HTTPError as err:
+            if err.code != 304 or entry is None:
+                raise
+            self.not_modified += 1
+            body = entry["body"].encode()
+            self.bytes_saved += len(body)
+            return body
+        self.bytes_downloaded += len(body)
+        if etag or last_modified:
+            self._write_entry(url, etag, last_modified, body)
+        return body
+
+    # A one-line summary of the statistics of this run.
+    def stats(self) -> str:
+        return (
+            f"http cache: {self.requests} request(s), {self.not_modified} not modified (served from the cache), "
+            f"{self.bytes_downloaded} bytes downloaded, {self.bytes_saved} bytes saved"
+        )
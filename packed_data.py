@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+"""
+This file implements the packed archive format for the data of closed PRs.
+
+Closed PRs (almost) never change again, but each of them used to keep a directory of three files in `data`.
+This costs time for every listing of the `data` directory, for git and for the integrity checks.
+Instead, the contents of these directories can be stored in a few large *pack files* `packed_data/pack-NNNN.bin`.
+Each pack file is the concatenation of the (unchanged) files it contains; the text file `packed_data/index.txt`
+records where each file is stored. It contains one line per packed directory, of the form
+    <directory>\t<pack file>\t<file name>:<offset>:<length>\t<file name>:<offset>:<length>...
+where <directory> is the name the directory had in `data` (e.g., "1234" or "1234-basic"),
+each <file name> is the name of a file in it (e.g., "pr_info.json", or "pr_info.json.gz" for a compressed file)
+and all files of a directory are stored in the same pack file.
+
+Both the pack files and the index are only ever appended to: this keeps the git history small.
+If a directory was packed several times, the line appended last is valid.
+A loose directory in `data` takes precedence over packed data for the same directory:
+this way, re-downloading data for a PR (e.g., because its packed data is broken, or a closed PR was re-opened) just works.
+
+Running this file as a script packs all closed PRs which were closed at least 30 days ago (this can be configured using
+`--min-age-days N`) and removes their loose directories. Open PRs always remain as loose directories.
+"""
+
+import mmap
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+from os import path
+from typing import List, NamedTuple
+
+from dateutil import parser
+
+from util import COMPRESSED_SUFFIXES, eprint, parse_json_data, parse_json_file
+
+PACKED_DATA_DIR = "packed_data"
+INDEX_FILE = "index.txt"
+
+# Start a new pack file once the current one exceeds this size:
+# github rejects files larger than 100 MB.
+MAX_PACK_SIZE = 50_000_000
+
+
+# The location of a file in a pack file.
+class PackEntry(NamedTuple):
+    pack: str
+    offset: int
+    length: int
+
+
+# Parse a line of the index file into a directory name and the locations of its files.
+# Return None if the line is malformed.
+def _parse_index_line(line: str) -> tuple[str, dict[str, PackEntry]] | None:
+    fields = line.split("\t")
+    if len(fields) < 3:
+        return None
+    (dir, pack) = (fields[0], fields[1])
+    files: dict[str, PackEntry] = dict()
+    for field in fields[2:]:
+        parts = field.rsplit(":", 2)
+        if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+            return None
+        files[parts[0]] = PackEntry(pack, int(parts[1]), int(parts[2]))
+    return (dir, files)
+
+
+# Read-only access to the packed data. Pack files are memory-mapped (lazily, when first read from).
+class PackedData:
+    def __init__(self, root: str = PACKED_DATA_DIR) -> None:
+        self.root = root
+        # Map each directory to a dictionary mapping each of its file names to their location.
+        self.entries: dict[str, dict[str, PackEntry]] = dict()
+        self._maps: dict[str, mmap.mmap] = dict()
+        try:
+            with open(path.join(root, INDEX_FILE), "r") as fi:
+                lines = fi.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            entry = _parse_index_line(line)
+            # An interrupted write of the index can leave a partial last line behind: ignore it.
+            if entry is not None:
+                (dir, files) = entry
+                self.entries[dir] = files
+
+    def __contains__(self, dir: str) -> bool:
+        return dir in self.entries
+
+    # All packed directories, in no particular order.
+    def dirs(self) -> List[str]:
+        return list(self.entries.keys())
+
+    # The names of all packed files for the directory |dir| (with compression suffixes, if any), sorted alphabetically.
+    def files(self, dir: str) -> List[str]:
+        return sorted(self.entries[dir].keys())
+
+    # Find the actual name of the packed file |name| in directory |dir|, which may be compressed.
+    # Return None if there is no such file.
+    def find_file(self, dir: str, name: str) -> str | None:
+        for candidate in [name] + [name + suffix for suffix in COMPRESSED_SUFFIXES]:
+            if candidate in self.entries.get(dir, dict()):
+                return candidate
+        return None
+
+    # The size (in bytes) of the packed file |name| in directory |dir|, as stored (i.e., possibly compressed).
+    def size(self, dir: str, name: str) -> int:
+        return self.entries[dir][name].length
+
+    # Return the contents of the packed file |name| (including any compression suffix) in directory |dir|.
+    # Raise a ValueError if the index points past the end of the pack file.
+    def read(self, dir: str, name: str) -> bytes:
+        entry = self.entries[dir][name]
+        if entry.pack not in self._maps:
+            with open(path.join(self.root, entry.pack), "rb") as fi:
+                self._maps[entry.pack] = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._maps[entry.pack]
+        if entry.offset + entry.length > len(data):
+            raise ValueError(f"packed file {dir}/{name} extends beyond the end of {entry.pack}")
+        return data[entry.offset:entry.offset + entry.length]
+
+    # Like `util.parse_json_file`, for the packed file |name| (which may be stored compressed) in directory |dir|.
+    def parse_json_file(self, dir: str, name: str, pr_number: str) -> dict | str:
+        actual = self.find_file(dir, name)
+        if actual is None:
+            return f"error: there is no packed file {name} for PR {pr_number}"
+        try:
+            content = self.read(dir, actual)
+        except ValueError as err:
+            return f"error: {err}"
+        return parse_json_data(f"{self.root}/{dir}/{actual}", content, pr_number)
+
+    # The contents of the packed timestamp file of directory |dir|.
+    def timestamp(self, dir: str) -> str:
+        return self.read(dir, "timestamp.txt").decode()
+
+    def close(self) -> None:
+        for data in self._maps.values():
+            data.close()
+        self._maps = dict()
+
+
+# Return the names of all PR directories with data: all loose directories in `data`
+# and all packed directories, sorted alphabetically.
+def list_pr_dirs(packed: PackedData) -> List[str]:
+    return sorted(set(os.listdir("data")) | set(packed.dirs()))
+
+
+# Is the data for directory |dir| read from the pack files, i.e. packed and not overridden by a loose directory?
+def is_packed(packed: PackedData, dir: str) -> bool:
+    return dir in packed and not path.isdir(path.join("data", dir))
+
+
+# Append the files in the loose directories |dirs| to the pack files.
+# The index is only updated once all contents are written, so an interrupted run leaves at most
+# some unreferenced bytes at the end of a pack file behind.
+def pack_directories(dirs: List[str], root: str = PACKED_DATA_DIR) -> None:
+    if not dirs:
+        return
+    os.makedirs(root, exist_ok=True)
+    packs = sorted(name for name in os.listdir(root) if name.startswith("pack-") and name.endswith(".bin"))
+    if not packs:
+        packs = ["pack-0000.bin"]
+    index_lines: List[str] = []
+    pack = packs[-1]
+    fi = open(path.join(root, pack), "ab")
+    try:
+        for dir in dirs:
+            if fi.tell() >= MAX_PACK_SIZE:
+                fi.close()
+                pack = f"pack-{int(pack.removeprefix('pack-').removesuffix('.bin')) + 1:04}.bin"
+                fi = open(path.join(root, pack), "ab")
+            fields = [dir, pack]
+            for name in sorted(os.listdir(path.join("data", dir))):
+                with open(path.join("data", dir, name), "rb") as source:
+                    content = source.read()
+                fields.append(f"{name}:{fi.tell()}:{len(content)}")
+                fi.write(content)
+            index_lines.append("\t".join(fields) + "\n")
+        fi.flush()
+        os.fsync(fi.fileno())
+    finally:
+        fi.close()
+    with open(path.join(root, INDEX_FILE), "a") as index:
+        index.write("".join(index_lines))
+        index.flush()
+        os.fsync(index.fileno())
+
+
+# Is the PR with data in the loose directory |dir| closed, and was it closed at least |min_age| ago?
+def _is_closed_before(dir: str, min_age: timedelta) -> bool:
+    name = "basic_pr_info.json" if dir.endswith("-basic") else "pr_info.json"
+    match parse_json_file(path.join("data", dir, name), dir.removesuffix("-basic")):
+        case str(_err):
+            # Broken data is never packed: it will be re-downloaded instead.
+            return False
+        case dict(data):
+            pr = data["data"]["repository"]["pullRequest"]
+            if pr["state"] == "OPEN" or not pr.get("closedAt"):
+                return False
+            return parser.isoparse(pr["closedAt"]) <= datetime.now(timezone.utc) - min_age
+
+
+def main() -> None:
+    min_age_days = 30
+    if len(sys.argv) == 3 and sys.argv[1] == "--min-age-days" and sys.argv[2].isdigit():
+        min_age_days = int(sys.argv[2])
+    elif len(sys.argv) != 1:
+        eprint("usage: packed_data.py [--min-age-days N]")
+        sys.exit(1)
+    dirs = []
+    for dir in sorted(os.listdir("data")):
+        if dir.endswith("-temp") or not path.exists(path.join("data", dir, "timestamp.txt")):
+            continue
+        if _is_closed_before(dir, timedelta(days=min_age_days)):
+            dirs.append(dir)
+    pack_directories(dirs)
+    for dir in dirs:
+        shutil.rmtree(path.join("data", dir))
+    print(f"packed the data of {len(dirs)} closed PRs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Follow GraphQL cursors to download complete data for large PRs.
+
+The per-PR queries only ask for the first page of each connection (e.g. `commits(first: 100)`):
+for large PRs, this data is truncated. Asking for larger pages does not help, as github limits the page size,
+and large queries time out (which was the main reason for PRs to be listed in `stubborn_prs.txt`).
+Instead, the queries also ask for each connection's `pageInfo { hasNextPage endCursor }`:
+if a connection has more pages, these are downloaded using small separate queries (one per page, see |page_query|),
+which only ask for this connection, with the same selection for each node as the original query.
+All pages are stitched into the original response, which then looks like the response to a single query
+without any page size limit (with a `pageInfo` field whose `hasNextPage` is false).
+
+Data downloaded before this change has no `pageInfo` field: whether it is complete can only be guessed,
+by comparing the number of nodes with the page size (see |is_connection_complete|).
+
+The stored cursors also allow updating the data of a PR incrementally (see |update_query|):
+timeline items, commits, comments and reviews are only ever appended to (unless the PR's branch was force-pushed),
+so it suffices to ask for the nodes after the stored cursors, and to add them to the stored data.
+All other fields (such as labels, CI status or the draft state) are small, and downloaded again.
+Each connection's `totalCount` is compared with the number of nodes after merging: if nodes were deleted
+(or the branch was force-pushed), the PR's data is downloaded completely instead.
+
+Stored nodes can change without being appended to, though. The update therefore also downloads again
+- the last commit (whose `statusCheckRollup` changes as CI runs on it), and
+- the bodies of the last |RECENT_NODES| comments and reviews (which can be edited): these replace the bodies
+  of the stored nodes with the same id, also in the timeline items.
+Thus the following stored fields can be stale after an update: the CI status of all commits but the last one,
+and the bodies of older comments and reviews (and of the corresponding timeline items) which were edited.
+(The next full download, e.g. by `backfill.py` or with `downloader.py --full`, corrects them.)
+"""
+
+import functools
+import re
+from typing import List
+
+from graphql_batch import pull_request_selection, query_selection
+
+# The connections which are paginated, for each query. (Nested connections, such as the review comments
+# of a review thread or the CI checks of a commit, are not.)
+PAGINATED_CONNECTIONS: dict[str, List[str]] = {
+    "pr_info": ["timelineItems", "commits", "comments", "reviews", "files"],
+    "pr_reactions": ["comments", "reviews"],
+    "basic_pr_info": ["comments", "files", "reviews"],
+}
+
+# The connections which are only appended to (unless a PR's branch is force-pushed): these are updated incrementally.
+APPEND_ONLY_CONNECTIONS = ["timelineItems", "commits", "comments", "reviews"]
+
+# Timeline events after which the data of a PR has to be downloaded completely, as they can change existing nodes.
+FULL_DOWNLOAD_EVENTS = ["HeadRefForcePushedEvent", "BaseRefForcePushedEvent", "ReviewDismissedEvent"]
+
+# The number of nodes asked for in each follow-up page. (This is github's maximum.)
+PAGE_SIZE = 100
+
+# The number of most recent comments and reviews whose bodies are downloaded again by an incremental update.
+RECENT_NODES = PAGE_SIZE
+
+# The number of nodes of each connection in data downloaded before pagination was implemented
+# if the connection had more nodes, used for guessing whether such data is complete.
+# (The old query asked for 250 commits, but github only returned 100.)
+LEGACY_PAGE_SIZES = {"timelineItems": 250}
+
+
+# Find the top-level field |field| within the selection set |selection| (including the outer braces):
+# the match extends from the field's name to the opening brace of its own selection set.
+def _field_match(selection: str, field: str) -> re.Match:
+    for match in re.finditer(rf"\b{field}\b(\([^)]*\))?\s*{{", selection):
+        depth = selection.count("{", 0, match.start()) - selection.count("}", 0, match.start())
+        if depth == 1:
+            return match
+    raise ValueError(f"no top-level field '{field}' in the GraphQL selection")
+
+
+# Return the index of the opening brace of the selection set of the top-level field |field| within |selection|.
+def _field_start(selection: str, field: str) -> int:
+    return _field_match(selection, field).end() - 1
+
+
+# The selection set of each node of the connection |connection| in the query |name|, including the outer braces.
+@functools.cache
+def nodes_selection(name: str, connection: str) -> str:
+    selection = query_selection(name)
+    start = _field_start(selection, connection)
+    inner = pull_request_selection("pullRequest(number: $prNumber) " + selection[start:])
+    return pull_request_selection("pullRequest(number: $prNumber) " + inner[_field_start(inner, "nodes"):])
+
+
+# The query for the page after the cursor $cursor of the connection |connection| in the query |name|.
+# (The operation name tells apart page queries for different queries whose selections coincide.)
+@functools.cache
+def page_query(name: str, connection: str) -> str:
+    return (
+        f"query {name}_{connection}($owner: String!, $repo: String!, $prNumber: Int!, $cursor: String!) {{\n"
+        "  repository(owner: $owner, name: $repo) {\n"
+        "    pullRequest(number: $prNumber) {\n"
+        f"      {connection}(first: {PAGE_SIZE}, after: $cursor) {{\n"
+        "        pageInfo { hasNextPage endCursor }\n"
+        f"        nodes {nodes_selection(name, connection)}\n"
+        "      }\n"
+        "    }\n"
+        "  }\n"
+        "}\n"
+    )
+
+
+# All pairs (query name, connection) for which there is a page query, keyed by the query text.
+# (This is used by the stub server in `stub_github.py`.)
+def page_queries() -> dict[str, tuple[str, str]]:
+    return {page_query(name, conn): (name, conn) for (name, conns) in PAGINATED_CONNECTIONS.items() for conn in conns}
+
+
+# Return the cursors for the next page of each connection of the query |name| which is incomplete in |response|
+# (the response to that query for a single PR), as a dictionary mapping connection names to cursors.
+def next_pages(name: str, response: dict) -> dict[str, str]:
+    inner = response["data"]["repository"]["pullRequest"]
+    if inner is None:
+        return dict()
+    result = dict()
+    for connection in PAGINATED_CONNECTIONS[name]:
+        page_info = (inner.get(connection) or {}).get("pageInfo")
+        if page_info and page_info["hasNextPage"]:
+            result[connection] = page_info["endCursor"]
+    return result
+
+
+# Add the nodes of the page |page| (the response to a page query for |connection|) to |response|.
+def merge_page(response: dict, connection: str, page: dict) -> None:
+    target = response["data"]["repository"]["pullRequest"][connection]
+    source = page["data"]["repository"]["pullRequest"][connection]
+    target["nodes"].extend(source["nodes"])
+    target["pageInfo"] = source["pageInfo"]
+
+
+# Return whether the connection |connection| of the PR data |inner| (the `pullRequest` field of a response) is complete.
+# For data without a `pageInfo` field, this is a guess: a connection with exactly one full page of nodes is probably not.
+def is_connection_complete(inner: dict, connection: str) -> bool:
+    value = inner.get(connection)
+    if value is None:
+        return True
+    if "pageInfo" in value:
+        return not value["pageInfo"]["hasNextPage"]
+    return len(value["nodes"]) != LEGACY_PAGE_SIZES.get(connection, 100)
+
+
+# Return whether the PR data |inner| (the `pullRequest` field of a response) has been downloaded with pagination.
+def is_paginated(inner: dict) -> bool:
+    return any("pageInfo" in (inner.get(connection) or {}) for connection in PAGINATED_CONNECTIONS["pr_info"])
+
+
+# The query for updating the data of a PR from `pr_info.graphql` incrementally: like `pr_info.graphql`,
+# but the append-only connections only ask for the nodes after the cursors $after_<connection> (and their `totalCount`).
+# The fields `lastCommit`, `recentComments` and `recentReviews` ask for the stored nodes which can change (see |merge_update|).
+@functools.cache
+def update_query() -> str:
+    selection = query_selection("pr_info")
+    refetch = (
+        f"  lastCommit: commits(last: 1) {{\n        nodes {nodes_selection('pr_info', 'commits')}\n      }}\n"
+        f"      recentComments: comments(last: {RECENT_NODES}) {{\n        nodes {{\n          id\n          body\n        }}\n      }}\n"
+        f"      recentReviews: reviews(last: {RECENT_NODES}) {{\n        nodes {{\n          id\n          body\n        }}\n      }}\n"
+    )
+    selection = selection[:selection.rindex("}")] + refetch + "    }"
+    matches = sorted((_field_match(selection, conn) for conn in APPEND_ONLY_CONNECTIONS), key=lambda m: m.start())
+    for match in reversed(matches):
+        conn = match.group(0).split("(")[0]
+        replacement = f"{conn}(first: {PAGE_SIZE}, after: $after_{conn}) {{\n        totalCount"
+        selection = selection[:match.start()] + replacement + selection[match.end():]
+    cursors = "".join(f", $after_{conn}: String" for conn in APPEND_ONLY_CONNECTIONS)
+    return (
+        f"query pr_info_update($owner: String!, $repo: String!, $prNumber: Int!{cursors}) {{\n"
+        "  repository(owner: $owner, name: $repo) {\n"
+        f"    pullRequest(number: $prNumber) {selection}\n"
+        "  }\n"
+        "}\n"
+    )
+
+
+# Return the variables with the stored cursors for |update_query|, given the stored response |stored| to `pr_info.graphql`,
+# or None if the stored data cannot be updated incrementally (because it is incomplete or was downloaded without pagination).
+def update_variables(stored: dict) -> dict[str, str | None] | None:
+    inner = stored["data"]["repository"]["pullRequest"]
+    if inner is None:
+        return None
+    variables: dict[str, str | None] = dict()
+    for connection in APPEND_ONLY_CONNECTIONS:
+        page_info = (inner.get(connection) or {}).get("pageInfo")
+        if page_info is None or page_info["hasNextPage"]:
+            return None
+        variables[f"after_{connection}"] = page_info["endCursor"]
+    return variables
+
+
+# Merge the stored response |stored| to `pr_info.graphql` into |update|, a (complete) response to |update_query|:
+# afterwards, |update| contains all nodes of the append-only connections, in the format of a response to `pr_info.graphql`.
+# The stored last commit and the bodies of the stored recent comments and reviews are replaced by their downloaded versions.
+# Return False if this is not possible and the PR's data needs to be downloaded completely.
+def merge_update(stored: dict, update: dict) -> bool:
+    old = stored["data"]["repository"]["pullRequest"]
+    new = update["data"]["repository"]["pullRequest"]
+    if new is None:
+        return False
+    last_commit = new.pop("lastCommit")["nodes"]
+    bodies = {node["id"]: node["body"] for field in ["recentComments", "recentReviews"] for node in new.pop(field)["nodes"]}
+    old_commits = old["commits"]["nodes"]
+    if old_commits and last_commit and new["commits"]["nodes"] == []:
+        if old_commits[-1]["commit"]["oid"] != last_commit[0]["commit"]["oid"]:
+            return False
+        old_commits[-1] = last_commit[0]
+    for connection in ["comments", "reviews", "timelineItems"]:
+        for node in old[connection]["nodes"]:
+            if node.get("id") in bodies and "body" in node:
+                node["body"] = bodies[node["id"]]
+    for connection in APPEND_ONLY_CONNECTIONS:
+        value = new[connection]
+        total = value.pop("totalCount")
+        if connection == "timelineItems" and any(n.get("__typename") in FULL_DOWNLOAD_EVENTS for n in value["nodes"]):
+            return False
+        value["nodes"] = old[connection]["nodes"] + value["nodes"]
+        if len(value["nodes"]) != total:
+            return False
+        # Github returns no cursor for an empty page: keep the stored one.
+        if value["pageInfo"]["endCursor"] is None:
+            value["pageInfo"]["endCursor"] = old[connection]["pageInfo"]["endCursor"]
+    return True
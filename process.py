@@ -13,12 +13,20 @@ import json
 import re
 import sys
 from datetime import datetime, timezone
-from os import listdir, path
+from os import path
 from typing import List, Tuple
 
-from classify_pr_state import PRStatus
+from dateutil import relativedelta
+
+from ci_status import CIStatus
+from classify_pr_state import PRState, PRStatus, determine_PR_status, label_categorisation_rules
+from data_manifest import DataManifest
+from packed_data import PackedData, list_pr_dirs
+from pagination import is_connection_complete, is_paginated
+from slim_data import load_pr_info, prune_slim_records
 from state_evolution import first_time_on_queue, last_status_update, total_queue_time
-from util import eprint, parse_json_file, relativedelta_tryParse, timedelta_tostr
+from util import (AGGREGATE_SCHEMA_VERSION, datetime_to_epoch, epoch_to_datetime, epoch_to_github_time, eprint,
+                  github_time_to_epoch, pr_fingerprint, timedelta_toseconds)
 
 
 # Determine a PR's CI status: the return value is one of "pass", "fail", "fail-inessential" and "running".
@@ -89,8 +97,9 @@ def determine_ci_status(number, CI_check_nodes: dict) -> str:
 # Each dictionary contains its answer status (which can be "missing", "incomplete" or "valid")
 # and (if data is present) the computed value.
 def _compute_status_change_data(pr_data: dict, CI_status: str | None, number: int, is_incomplete: bool) -> Tuple[dict, dict, dict]:
-    # These particular PRs have one label noted as removed several times in a row.
-    # This trips up my algorithm. Omit the analysis for now. FIXME: make smarter?
+    # In the data downloaded before pagination was implemented, these particular PRs have
+    # one label noted as removed several times in a row. This trips up my algorithm.
+    # Omit the analysis for such data; complete (paginated) data is analysed as usual.
     bad_prs = [
         10655, 10823, 10878, 11703, 11711, 11385, 11874, 12076, 12268, 12311, 12371,
         12435, 12488, 12561, 13149, 13248, 13270, 13273, 13697, 14008, 14065,
@@ -98,43 +107,38 @@ def _compute_status_change_data(pr_data: dict, CI_status: str | None, number: in
         3200, 6595,
         9526, 9273, 12032, 24769, 25712, 25753, 25922, 26004,
     ]
-    if number in bad_prs:
+    if number in bad_prs and not is_paginated(pr_data["data"]["repository"]["pullRequest"]):
         missing = {"status": "missing"}
         return (missing, missing, missing)
     # print(f"trace: computing state changes for PR {number}")
 
     # PRs with "missing" status are the ones above; basic PRs omit this field.
     validity_status = "incomplete" if is_incomplete else "valid"
-    # Match the format produced by github, and expected by all the code.
-    # Produces output like "2024-07-15T21:08:42Z".
-    time_format = "%Y-%m-%dT%H:%M:%SZ"
+    # All points in time are stored as seconds since the epoch, all durations as integer seconds
+    # (see AGGREGATE_SCHEMA_VERSION): this is faster to write and to parse than formatted strings.
+    # In particular, the time since the last status change is only computed when displaying it.
 
     # I *could* cache the computed metadata (through _parse_data),
     # computing it only once and not thrice per PR. However,
     # this does not seem to make a big performance difference.
     first_on_queue = first_time_on_queue(pr_data)
-    stringified = None if first_on_queue is None else datetime.strftime(first_on_queue, time_format)
-    res_first_on_queue = {"status": validity_status, "date": stringified}
-    (time, delta, current_status) = last_status_update(pr_data)
+    res_first_on_queue = {"status": validity_status, "date": None if first_on_queue is None else datetime_to_epoch(first_on_queue)}
+    (time, _delta, current_status) = last_status_update(pr_data)
     # XXX: as long as the overall status classification does not take CI status into account
     # (and doing so is difficult in general!), we must take care to not simply use the last
     # computed status, but override that when PR CI is failing.
     if CI_status is not None:
         if CI_status in ["fail", "fail-inessential", "running"]:
             current_status = PRStatus.NotReady
-    assert relativedelta_tryParse(repr(delta)) == delta
     res_last_status_change = {
         "status": validity_status,
-        "time": datetime.strftime(time, time_format),
-        "delta": repr(delta),
+        "time": datetime_to_epoch(time),
         "current_status": PRStatus.to_str(current_status),
     }
-    ((value_td, value_rd), explanation) = total_queue_time(pr_data)
-    assert relativedelta_tryParse(repr(value_rd)) == value_rd
+    ((value_td, _value_rd), explanation) = total_queue_time(pr_data)
     res_total_queue_time = {
         "status": validity_status,
-        "value_td": timedelta_tostr(value_td),
-        "value_rd": repr(value_rd),
+        "value": timedelta_toseconds(value_td),
         "explanation": explanation,
     }
     return (res_first_on_queue, res_last_status_change, res_total_queue_time)
@@ -153,7 +157,7 @@ def _compute_commenter_data(pr_data: dict) -> Tuple[bool, List[str]]:
     reviews = inner["reviews"]["nodes"]
     for review in reviews:
         users.add(review["author"]["login"])
-    is_incomplete = len(comments) == 100 or len(reviews) == 100
+    is_incomplete = not (is_connection_complete(inner, "comments") and is_connection_complete(inner, "reviews"))
     return (is_incomplete, sorted(list(users)))
 
 
@@ -217,7 +221,7 @@ def get_aggregate_data(pr_data: dict, only_basic_info: bool) -> dict:
     base_branch = inner["baseRefName"]
     is_draft = inner["isDraft"]
     state = inner["state"].lower()
-    last_updated = inner["updatedAt"]
+    last_updated = github_time_to_epoch(inner["updatedAt"])
     # We assume the author URL is determined by the github handle: in practice, it is.
     author = inner["author"]["login"]
     title = inner["title"]
@@ -278,48 +282,79 @@ def get_aggregate_data(pr_data: dict, only_basic_info: bool) -> dict:
         "assignees": assignees,
         "review_approvals": approvals,
     }
+    # Data downloaded before the head commit and the CI rollup state were queried has neither (nor a fingerprint).
+    rollup = inner["statusCheckRollup"]
+    if "headRefOid" in inner and (rollup is None or "state" in rollup):
+        aggregate_data["head_oid"] = inner["headRefOid"]
+        # The state of the PR's status check rollup (e.g. "SUCCESS" or "PENDING"), None if there is none.
+        aggregate_data["CI_rollup_state"] = rollup and rollup["state"]
+        aggregate_data["fingerprint"] = pr_fingerprint(
+            author, title, state, last_updated, labels, rollup and rollup["state"], inner["headRefOid"]
+        )
     if not only_basic_info:
         number_review_comments = 0
         review_threads = inner["reviewThreads"]["nodes"]
         for t in review_threads:
             number_review_comments += len(t["comments"]["nodes"])
         aggregate_data["number_review_comments"] = number_review_comments
-        num_events = len(inner["timelineItems"]["nodes"])
-        # events_not_commit = [n for n in inner["timelineItems"]["nodes"]
-        #    if "__typename" not in n or n["__typename"] != "PullRequestCommit"]
-
-        # All these PRs have (sometimes far) more than commits or 250 events, so re-downloading their
-        # data now would not help: do not print information about them.
-        do_not_redownload = [
-            6057, 6277, 6468, 7849, 8585, 9013,
-            # 13611 has ~240 commits, so the events data is also incomplete
-            10235, 10383, 11465, 11466, 13194, 13429, 13611, 13905,
-            16152, 16316, 16351, 17518, 17519, 17715, 18672, 20768,
-            15564, 15746, 15748, 15749, 15978, 15981, 16077, 16080, 16112, 16148, 16313,
-            16362, 16375, 16534, 16535, 16657, 17132, 17240, 19706,
-            # adaptation PRs or benchmarking
-            8076,
-            15181, 15358, 15503, 15788, 15827, 16163, 16244, 16425, 16669, 16716, 17058,
-            17374, 17532, 18007, 18421, 18830, 19494, 19984, 20392, 20402,
-        ]
-        # Until cursor handling has been implemented, these warnings do not add helpful information.
-        # if num_events == 250 and len(events_not_commit) == 0:
-        #     print(f"process.py: {state} PR {number} has exactly 250 events, all of which are commits: probably this data is incomplete!", file=sys.stderr)
-        # elif num_events == 250:
-        #     print(f"process.py: {state} PR {number} has exactly 250 events: probably this data is incomplete, please double-check!", file=sys.stderr)
-        num_commits = len(inner["commits"]["nodes"])
-        if num_commits == 100 and state == "open":
-            if number not in do_not_redownload:
-                print(f"process.py: {state} PR {number} has exactly 100 commits; please double-check if this data is complete", file=sys.stderr)
+        # The downloader follows all cursors (see `pagination.py`), so only data downloaded
+        # before pagination was implemented can be incomplete. Re-downloading such data helps.
+        events_complete = is_connection_complete(inner, "timelineItems")
+        if not is_connection_complete(inner, "commits") and state == "open":
+            print(f"process.py: {state} PR {number} has incomplete commit data; please re-download it", file=sys.stderr)
 
         # Compute information about this PR's real status changes, using the code in state_evolution.py.
-        (res_first_on_queue, res_last_status_change, res_total_queue_time) = _compute_status_change_data(pr_data, CI_status, number, num_events == 250)
+        (res_first_on_queue, res_last_status_change, res_total_queue_time) = _compute_status_change_data(pr_data, CI_status, number, not events_complete)
         aggregate_data["first_on_queue"] = res_first_on_queue
         aggregate_data["last_status_change"] = res_last_status_change
         aggregate_data["total_queue_time"] = res_total_queue_time
     return aggregate_data
 
 
+# Compute the weight of an open PR (given by its aggregate data |aggregate_data|) for the purposes of counting
+# reviewer assignments, at time |now|. Return a dictionary with this weight and the inputs it depends on:
+# the PR's status (from its labels, CI status and draft state) and the time of its last status change (if valid).
+# A pull request has weight 1 if it is on the review queue or just has a merge conflict,
+# if it is waiting on the PR author or zulip, it has weight 1/(t+1)
+# (where t is the number of days since the PR was last on the queue; weight 0.1 if this is unknown),
+# blocked PRs get weight 0.
+def _compute_assignment_weight(aggregate_data: dict, now: datetime) -> dict:
+    # We don't use the last status change to determine the status, as that is missing for stubborn PRs
+    # (whereas we still classify them using labels and CI data).
+    labels = [label_categorisation_rules[name] for name in aggregate_data["label_names"] if name in label_categorisation_rules]
+    from_fork = aggregate_data["head_repo"]["login"] != "leanprover-community"
+    state = PRState(labels, CIStatus.from_string(aggregate_data["CI_status"]), aggregate_data["is_draft"], from_fork)
+    status = determine_PR_status(datetime(2025, 1, 1, tzinfo=timezone.utc), state)
+    last_change = aggregate_data.get("last_status_change")
+    since = last_change["time"] if last_change is not None and last_change["status"] == "valid" else None
+    match status:
+        case PRStatus.AwaitingReview | PRStatus.MergeConflict:
+            weight = 1.0
+        case PRStatus.AwaitingAuthor | PRStatus.AwaitingDecision:
+            # Future: do I want to refine this weight function?
+            weight = 0.1 if since is None else 1 / (relativedelta.relativedelta(now, epoch_to_datetime(since)).days + 1)
+        case _:
+            # Blocked, delegated and closed PRs, PRs awaiting bors, not ready or needing help.
+            weight = 0.0
+    return {"value": weight, "status": PRStatus.to_str(status), "since": since}
+
+
+# Compute the (weighted) load of each reviewer, given all assigned PRs |all_assignments| (see |main|)
+# and the aggregate data of all PRs, |all_pr_data|: for each github handle, record the open PRs assigned to them,
+# the sum of their assignment weights (see |_compute_assignment_weight|) and the number of all PRs ever assigned.
+# Self-assigned PRs get weight 0.
+def compute_reviewer_load(now: str, all_assignments: dict, all_pr_data: List[dict]) -> dict:
+    by_number = {pr["number"]: pr for pr in all_pr_data}
+    load = {}
+    for (reviewer, assigned) in all_assignments.items():
+        open_assigned = sorted([entry["number"] for entry in assigned if entry["state"] == "open"])
+        weighted = sum([
+            by_number[n]["assignment_weight"]["value"] for n in open_assigned if by_number[n]["author"] != reviewer
+        ])
+        load[reviewer] = {"open_assigned": open_assigned, "weighted": weighted, "number_all_assigned": len(assigned)}
+    return {"timestamp": now, "reviewers": load}
+
+
 # For each open PR with the "infinity-cosmos" label, record its last update
 # (according to github), its current state and its last real status change.
 def compute_infinity_cosmos_data(now: str, all_open_pr_items: dict) -> dict:
@@ -327,15 +362,17 @@ def compute_infinity_cosmos_data(now: str, all_open_pr_items: dict) -> dict:
     for pr in all_open_pr_items:
         if "infinity-cosmos" in pr["label_names"]:
             real = pr.get("last_status_change")
+            # This file is small; keep its human-readable time format.
+            last_updated = epoch_to_github_time(pr["last_updated"])
             if real is None or real["status"] != "valid":
                 prs.append({
-                    "number": pr["number"], "last_updated": pr["last_updated"],
+                    "number": pr["number"], "last_updated": last_updated,
                     "last_status_change": None, "current_status": None,
                 })
             else:
                 prs.append({
-                    "number": pr["number"], "last_updated": pr["last_updated"],
-                    "last_status_change": real["time"], "current_status": real["current_status"]
+                    "number": pr["number"], "last_updated": last_updated,
+                    "last_status_change": epoch_to_github_time(real["time"]), "current_status": real["current_status"]
                 })
     return {"timestamp": now, "prs": prs}
 
@@ -344,7 +381,8 @@ def main() -> None:
     if len(sys.argv) == 2:
         if sys.argv[1] == '--fast':
             fast = True
-    updated = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    now = datetime.now(timezone.utc)
+    updated = now.strftime("%Y-%m-%dT%H:%M:%SZ")
     label_colours: dict[str, str] = dict()
     all_pr_data: List[dict] = []
     # A few files are known to have broken detailed information.
@@ -355,12 +393,19 @@ def main() -> None:
             if not line.startswith("--"):
                 known_erronerous.append(line.rstrip())
     # Read all pr info files in the data directory.
-    pr_dirs: List[str] = sorted(listdir("data"))
+    # We read the slim records derived from these files: these contain all data we need, but are much smaller.
+    # The data of most closed PRs is stored in pack files instead (see `packed_data.py`).
+    packed = PackedData()
+    pr_dirs: List[str] = list_pr_dirs(packed)
+    prune_slim_records(pr_dirs)
+    # Forget about the directories which no longer exist (e.g., because they contained broken data).
+    manifest = DataManifest.load()
+    existing = set(pr_dirs)
+    manifest.save(removed=[dir for dir in manifest.entries if dir not in existing])
     for pr_dir in pr_dirs:
         only_basic_info = "basic" in pr_dir
         pr_number = pr_dir.removesuffix("-basic")
-        filename = path.join("data", pr_dir, "basic_pr_info.json") if only_basic_info else path.join("data", pr_dir, "pr_info.json")
-        match parse_json_file(filename, pr_number):
+        match load_pr_info(pr_dir, packed):
             case str(err):
                 if pr_number not in known_erronerous:
                     print(f"attention: found an unexpected error!\n  {err}", file=sys.stderr)
@@ -376,14 +421,20 @@ def main() -> None:
                         else:
                             label_colours[name] = colour
                 if (not fast) or data["data"]["repository"]["pullRequest"]["state"] == "OPEN":
-                    all_pr_data.append(get_aggregate_data(data, only_basic_info))
+                    aggregate_data = get_aggregate_data(data, only_basic_info)
+                    # The weight of an open PR for counting reviewer assignments, relative to the time of this run.
+                    if aggregate_data["state"] == "open":
+                        aggregate_data["assignment_weight"] = _compute_assignment_weight(aggregate_data, now)
+                    all_pr_data.append(aggregate_data)
     if not fast:
         all_prs = {
+            "schema_version": AGGREGATE_SCHEMA_VERSION,
             "timestamp": updated,
             "label_colours": dict(sorted(label_colours.items())),
             "pr_statusses": all_pr_data,
         }
     just_open_prs = {
+        "schema_version": AGGREGATE_SCHEMA_VERSION,
         "timestamp": updated,
         "label_colours": dict(sorted(label_colours.items())),
         "pr_statusses": [item for item in all_pr_data if item["state"] == "open"],
@@ -423,6 +474,7 @@ def main() -> None:
         "all_assignments": all_assignments,
     }
 
+    reviewer_load = compute_reviewer_load(updated, all_assignments, all_pr_data)
     infty_cosmos_data = compute_infinity_cosmos_data(updated, just_open_prs["pr_statusses"])
 
     if not fast:
@@ -432,8 +484,11 @@ def main() -> None:
         print(json.dumps(just_open_prs, indent=4), file=f)
     with open(path.join("processed_data", "assignment_data.json"), "w") as f:
         print(json.dumps(assignment_data, indent=4), file=f)
+    with open(path.join("processed_data", "reviewer_load.json"), "w") as f:
+        print(json.dumps(reviewer_load, indent=4), file=f)
     with open(path.join("processed_data", "infinity_cosmos_data.json"), "w") as f:
         print(json.dumps(infty_cosmos_data, indent=4), file=f)
 
 
-main()
+if __name__ == "__main__":
+    main()
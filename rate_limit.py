@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+Keep track of github's GraphQL rate limit, and plan how many PRs each run can download.
+
+Github limits how many "points" a token can spend on GraphQL queries per hour (5000 for a personal token);
+each query costs at least one point, and large queries (such as batches of many PRs) cost more.
+Each query sent by `downloader.py` also asks for the `rateLimit { cost remaining resetAt limit }` field
+(this is removed from the response before storing it). The results are kept in a small persistent ledger
+(`rate_limit_ledger.json`), which records
+- the remaining budget, and when it will be reset,
+- an estimate of the cost of each kind of query (an exponentially weighted moving average), and
+- an estimate of the cost of downloading one PR (averaged over whole runs, including batching and pagination).
+
+`download_missing_outdated_PRs.sh` uses the ledger to decide how many PRs of each kind (redownloads, backfills, ...)
+fit into one run, while reserving enough budget for the critical `gather_stats.sh` step.
+
+Usage:
+- `python3 rate_limit.py plan KIND=COUNT...` prints a line `KIND=N` for each kind of download, in the given order
+  of priority: N is the number of PRs of this kind (out of COUNT candidates) which should be downloaded in this run.
+  The output is meant to be evaluated by the shell.
+- `python3 rate_limit.py status` prints the current state of the ledger.
+"""
+
+import fcntl
+import json
+import math
+import os
+import sys
+import time
+from os import path
+from typing import List, Tuple
+
+from util import eprint, epoch_to_github_time, github_time_to_epoch
+
+LEDGER_FILE = "rate_limit_ledger.json"
+
+# The field added to each GraphQL query: it is inserted at the top level of the query.
+RATE_LIMIT_SELECTION = "  rateLimit { cost remaining resetAt limit }\n"
+
+# The rate limit assumed before any query has been recorded.
+DEFAULT_LIMIT = 5000
+
+# The estimated cost of downloading one PR, before any download has been recorded.
+DEFAULT_COST_PER_PR = 1.0
+
+# The smallest estimated cost of downloading one PR. Batched queries can make the cost per PR tiny, but the planner
+# (and `backfill.py`) divide by it: the estimate must stay positive, also after rounding it when saving the ledger.
+MIN_COST_PER_PR = 0.01
+
+# The weight of each new observation in the moving averages of costs.
+EWMA_WEIGHT = 0.3
+
+# `gather_stats.sh` downloads all PRs updated since its last run (see `detect_changes.py`): usually, these are far fewer
+# than 100 PRs. Enough budget for downloading 100 PRs is always reserved for it.
+GATHER_STATS_MAX_PRS = 100
+
+# The maximum number of PRs of each kind downloaded in one run of `download_missing_outdated_PRs.sh`,
+# regardless of the budget (to bound the duration of each run). Stubborn PRs are slow to download.
+MAX_PRS_PER_RUN = {"redownload": 100, "missing": 20, "closed": 20, "stubborn": 2}
+
+
+# Add the `rateLimit` field to the GraphQL query |query|.
+def with_rate_limit(query: str) -> str:
+    start = query.index("{\n") + 2
+    return query[:start] + RATE_LIMIT_SELECTION + query[start:]
+
+
+# Remove the `rateLimit` field from the response |response|, and return its value (or None if it is missing).
+def pop_rate_limit(response: dict) -> dict | None:
+    data = response.get("data")
+    return data.pop("rateLimit", None) if isinstance(data, dict) else None
+
+
+class RateLimitLedger:
+    def __init__(
+        self, remaining: int | None = None, limit: int = DEFAULT_LIMIT, reset_at: int = 0,
+        query_costs: dict[str, float] = {}, cost_per_pr: float = DEFAULT_COST_PER_PR,
+    ) -> None:
+        # The remaining budget (None if unknown), the budget after a reset, and the time (in seconds since the epoch) of the next reset.
+        self.remaining = remaining
+        self.limit = limit
+        self.reset_at = reset_at
+        # Estimated cost of each kind of query, and of downloading one PR.
+        self.query_costs = dict(query_costs)
+        self.cost_per_pr = cost_per_pr
+        # The total cost of all queries recorded since this ledger was loaded.
+        self.run_cost = 0
+
+    @staticmethod
+    def load(file: str = LEDGER_FILE) -> "RateLimitLedger":
+        if not path.exists(file):
+            return RateLimitLedger()
+        with open(file, "r") as fi:
+            data = json.load(fi)
+        return RateLimitLedger(
+            data["remaining"], data["limit"], github_time_to_epoch(data["reset_at"]), data["query_costs"],
+            max(MIN_COST_PER_PR, data["cost_per_pr"])
+        )
+
+    # Several downloaders can run at once (see `work_queue.py`), each saving the ledger when it finishes.
+    # Merge this ledger with the saved one (holding an exclusive lock on `rate_limit_ledger.json.lock`, like `work_queue.py`),
+    # so no observation is lost: the newest rate limit window wins, and within one window, the smallest remaining budget.
+    # Cost estimates only known to the saved ledger are kept.
+    def save(self, file: str = LEDGER_FILE) -> None:
+        with open(file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if path.exists(file):
+                    self._merge(RateLimitLedger.load(file))
+                self._write(file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # Merge the observations of the ledger |saved| into this one.
+    def _merge(self, saved: "RateLimitLedger") -> None:
+        if saved.reset_at > self.reset_at or self.remaining is None:
+            (self.remaining, self.limit, self.reset_at) = (saved.remaining, saved.limit, saved.reset_at)
+        elif saved.reset_at == self.reset_at and saved.remaining is not None:
+            self.remaining = min(self.remaining, saved.remaining)
+        for (kind, cost) in saved.query_costs.items():
+            self.query_costs.setdefault(kind, cost)
+
+    def _write(self, file: str) -> None:
+        data = {
+            "remaining": self.remaining,
+            "limit": self.limit,
+            "reset_at": epoch_to_github_time(self.reset_at),
+            "query_costs": {key: round(value, 2) for (key, value) in sorted(self.query_costs.items())},
+            "cost_per_pr": round(self.cost_per_pr, 2),
+        }
+        # Replace the file atomically, so readers never see a partial file.
+        tmp = f"{file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as fi:
+            json.dump(data, fi, indent=2)
+            fi.write("\n")
+        os.replace(tmp, file)
+
+    # Record the `rateLimit` field |rate_limit| of the response to a query of kind |kind|.
+    def record(self, rate_limit: dict, kind: str) -> None:
+        cost = rate_limit["cost"]
+        self.run_cost += cost
+        old = self.query_costs.get(kind)
+        self.query_costs[kind] = cost if old is None else (1 - EWMA_WEIGHT) * old + EWMA_WEIGHT * cost
+        reset_at = github_time_to_epoch(rate_limit["resetAt"])
+        # Responses to concurrent queries can arrive in any order: within the same rate limit window,
+        # the smallest remaining budget is the most recent one.
+        if reset_at != self.reset_at or self.remaining is None:
+            self.remaining = rate_limit["remaining"]
+        else:
+            self.remaining = min(self.remaining, rate_limit["remaining"])
+        (self.reset_at, self.limit) = (reset_at, rate_limit["limit"])
+
+    # Record that the queries since this ledger was loaded downloaded |number_prs| PRs.
+    def record_run(self, number_prs: int) -> None:
+        if number_prs > 0 and self.run_cost > 0:
+            self.cost_per_pr = max(MIN_COST_PER_PR, (1 - EWMA_WEIGHT) * self.cost_per_pr + EWMA_WEIGHT * self.run_cost / number_prs)
+
+    # The budget available at time |now| (in seconds since the epoch).
+    def available(self, now: float) -> int:
+        if self.remaining is None or now >= self.reset_at:
+            return self.limit
+        return self.remaining
+
+    # Decide how many PRs of each kind to download at time |now|: |wanted| lists pairs (kind, number of candidates),
+    # in order of priority. Return a list of pairs (kind, number of PRs to download).
+    def plan(self, wanted: List[Tuple[str, int]], now: float) -> List[Tuple[str, int]]:
+        budget = self.available(now) - GATHER_STATS_MAX_PRS * self.cost_per_pr
+        result = []
+        for (kind, count) in wanted:
+            number = max(0, min(count, MAX_PRS_PER_RUN.get(kind, count), math.floor(budget / self.cost_per_pr)))
+            budget -= number * self.cost_per_pr
+            result.append((kind, number))
+        return result
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    ledger = RateLimitLedger.load()
+    if args == ["status"]:
+        print(f"remaining budget: {ledger.remaining} of {ledger.limit} (reset at {epoch_to_github_time(ledger.reset_at)})")
+        print(f"estimated cost per PR: {ledger.cost_per_pr:.2f}")
+        for (kind, cost) in sorted(ledger.query_costs.items()):
+            print(f"estimated cost of a '{kind}' query: {cost:.2f}")
+    elif args and args[0] == "plan" and all(arg.count("=") == 1 and arg.split("=")[1].isdigit() for arg in args[1:]):
+        wanted = [(arg.split("=")[0], int(arg.split("=")[1])) for arg in args[1:]]
+        planned = ledger.plan(wanted, time.time())
+        eprint(f"rate limit budget: {ledger.available(time.time())} points, planned downloads: {planned}")
+        for (kind, number) in planned:
+            print(f"{kind}={number}")
+    else:
+        eprint("usage: rate_limit.py plan KIND=COUNT... | rate_limit.py status")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 #!/usr/bin/env bash
 
-# Download detailed PR information for a given list of PRs.
+# Download detailed PR information for a given list of PRs (or ranges A-B of PRs).
 # This script returns the exit code
-# - 0 if no errors occurred, and data for at least one PR was downloaded,
-# - 1 if the was an error fetching data.
+# - 0 if no errors occurred, and data for all PRs was downloaded (or was present already),
+# - 1 if the was an error fetching data, or the backfill was interrupted.
 #
 # See https://github.com/jcommelin/gh-mathlib-metadata/blob/master/backfill.sh
 # for a previous version of this script, which would download information for
@@ -13,51 +13,8 @@
 # See e.g. http://redsymbol.net/articles/unofficial-bash-strict-mode/ for explanation.
 set -e -u -o pipefail
 
-CURRENT_TIME=$(date -u +"%Y-%m-%dT%H:%M:%SZ")
-
-# We iterate over each argument, assume it is a PR number
-# and attempt to download data for that numbered PR.
-
-# This script does not perform any rate limiting: make sure to do so yourself!
-
-stubborn_prs=$(cat "stubborn_prs.txt" | grep --invert-match "^--" | sort | uniq)
-
-# NB: keep this function in sync with download_missing_outdated_PRs.sh
-# |download_normal $pr| downloads 'normal' info for the PR '$pr' into the appropriate directory.
-# Do not use with stubborn PRs: usually, this would time out.
-function download_normal {
-    local dir="data/$1"
-    local tmpdir="data/$1-temp"
-    mkdir -p "$tmpdir"
-    # Run pr_info.sh and pr_reactions.sh and save the output.
-    # "parse error: Invalid numeric literal at line N, column M'" comes from jq complaining about e.g. an empty file.
-
-    # Save the output to a temporary directory, which we delete in case anything goes wrong.
-    { scripts/pr_info.sh "$1" | jq '.' > "$tmpdir/pr_info.json"; } || { rm -r -f $tmpdir && return 1; }
-    # Save the current timestamp.
-    echo "$CURRENT_TIME" > "$tmpdir/timestamp.txt"
-    { scripts/pr_reactions.sh "$1" | jq '.' > "$tmpdir/pr_reactions.json"; } || { rm -r -f $tmpdir && return 1; }
-    rm -r -f $dir
-    mv -f $tmpdir/ $dir/
-}
-
-# |download_stubborn $pr| downloads "stubborn" info for the PR '$pr' into the appropriate directory.
-function download_stubborn {
-  local dir="data/$1-basic"
-  mkdir -p "$dir"
-  scripts/basic_pr_info.sh "$1" | jq '.' > "$dir/basic_pr_info.json"
-  echo "$CURRENT_TIME" > "$dir/timestamp.txt"
-}
-
-for prnumber in "$@"
-do
-  # Make sure to only match whole-word boundaries, i.e. PRs 15158 or 19585 being stubborn
-  # does not mean PR 58 should be treated as stubborn.
-  if [[ -n $(echo $stubborn_prs | grep -w "$prnumber") ]]; then
-    download_stubborn $prnumber
-  else
-    download_normal $prnumber
-  fi
-done
-
-echo "Backfilling/re-downloading run completed successfully"
+# We assume each argument is a PR number or range, and attempt to download data for these PRs.
+# backfill.py skips PRs with valid data, stays within github's rate limit and saves its progress:
+# if it is interrupted, `python3 backfill.py --resume` continues where it stopped.
+# It downloads basic information for all stubborn PRs, and normal information for all others.
+python3 backfill.py "$@"
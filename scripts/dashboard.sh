@@ -20,6 +20,8 @@ query(\$endCursor: String) {
 	      title
         state
 	      updatedAt
+        headRefOid
+        statusCheckRollup { state }
         labels(first: 10, orderBy: {direction: DESC, field: CREATED_AT}) {
           nodes {
             name
@@ -17,112 +17,105 @@ CURRENT_TIME=$(date -u +"%Y-%m-%dT%H:%M:%SZ")
 # but for our purposes, that is fine.
 stubborn_prs=$(cat "stubborn_prs.txt" | grep --invert-match "^--" | sort | uniq)
 
-# |download_normal $pr| downloads 'normal' info for the PR '$pr' into the appropriate directory.
-# Do not use with stubborn PRs: usually, this would time out.
-function download_normal {
-    local dir="data/$1"
-    local tmpdir="data/$1-temp"
-    mkdir -p "$tmpdir"
-    # Run pr_info.sh and pr_reactions.sh and save the output.
-    # "parse error: Invalid numeric literal at line N, column M'" comes from jq complaining about e.g. an empty file.
-
-    # Save the output to a temporary directory, which we delete in case anything goes wrong.
-    { scripts/pr_info.sh "$1" | jq '.' > "$tmpdir/pr_info.json"; } || { echo "$1" >> "broken_pr_data.txt"; rm -r -f $tmpdir && return 1; }
-    # Save the current timestamp.
-    echo "$CURRENT_TIME" > "$tmpdir/timestamp.txt"
-    { scripts/pr_reactions.sh "$1" | jq '.' > "$tmpdir/pr_reactions.json"; } || { echo "$1" >> "broken_pr_data.txt"; rm -r -f $tmpdir && return 1; }
-    rm -r -f $dir
-    mv -f $tmpdir/ $dir/
-}
+# All downloads are done by downloader.py: it downloads basic information for stubborn PRs
+# and normal information for all other PRs, and appends the numbers of all non-stubborn PRs
+# whose download failed to broken_pr_data.txt.
 
-# |download_stubborn $pr| downloads "stubborn" info for the PR '$pr' into the appropriate directory.
-function download_stubborn {
-  local dir="data/$1-basic"
-  mkdir -p "$dir"
-  scripts/basic_pr_info.sh "$1" | jq '.' > "$dir/basic_pr_info.json"
-  echo "$CURRENT_TIME" > "$dir/timestamp.txt"
+# |is_packed $dir| succeeds iff the data directory '$dir' (e.g. "123" or "123-basic")
+# has been moved into the pack files: see packed_data.py.
+function is_packed {
+  [ -f packed_data/index.txt ] && cut -f1 packed_data/index.txt | grep -q -x -F "$1"
 }
 
-# |download_pr $pr| downloads information for the PR $pr into the appropriate directory.
-# It consults $stubborn_prs to determine whether to treat a PR as stubborn or not.
-function download_pr {
-  # Make sure to only match whole-word boundaries, i.e. PRs 15158 or 19585 being stubborn
-  # does not mean PR 58 should be treated as stubborn.
-  if [[ -n $(echo $stubborn_prs | grep -w "$1") ]]; then
-    download_stubborn $1
-  else
-    download_normal $1
-  fi
-}
-
-# Re-download data if missing. Take care to not ask for too much at once!
-# FIXME: this is only somewhat robust --- improve this to ensure to avoid
-# re-re-downloading in a loop!
-for pr in $(cat "redownload.txt"); do
-  echo "About to re-download PR $pr"
-  # We try re-downloading every PR, so "redownload.txt" gets emptied for sure.
-  download_pr $pr || true
-done
-echo "" > redownload.txt
-echo "Successfully re-downloaded all planned PRs (if any)"
+# Collect the candidates for downloading in this run.
+# PRs to re-download, e.g. because their data was found to be broken.
+to_redownload=$(cat "redownload.txt" | grep --invert-match "^--" || true)
 
-# In case there are PRs which got "missed" somehow, backfill data for up to two of them.
-i=0
+# PRs which got "missed" somehow.
+missing_candidates=""
 for pr in $(cat "missing_prs.txt" | grep --invert-match "^--" | head --lines 50); do
-  # Check if the directory exists
-  if [ -d "data/$pr" ]; then
+  # Check if the directory exists (or has been packed)
+  if [ -d "data/$pr" ] || is_packed "$pr"; then
     echo "[skip] Data exists for #$pr: $CURRENT_TIME"
     continue
   fi
-  if [ $i -eq 2 ]; then
-    break;
-  fi
-  i=$((i+1))
-  echo "Attempting to backfill data for PR $pr"
-  download_pr $pr
+  missing_candidates="$missing_candidates $pr"
 done
-# If there were less than two "missing" PRs to backfill, backfill PRs from `closed_prs_to_backfill.txt`.
-# Order these randomly to ensure that any one PR which ought to be stubborn
+
+# Closed PRs to backfill. Order these randomly to ensure that any one PR which ought to be stubborn
 # does not clog the "backfilling queue".
+closed_candidates=""
 for pr in $(cat "closed_prs_to_backfill.txt" | grep --invert-match "^--" | head --lines 50 | shuf); do
-  # Check if the directory exists
-  if [ -d "data/$pr" ]; then
+  # Check if the directory exists (or has been packed)
+  if [ -d "data/$pr" ] || is_packed "$pr"; then
     echo "[skip] Data exists for #$pr: $CURRENT_TIME"
     continue
-  elif [ -d "data/$pr-basic" ]; then
+  elif [ -d "data/$pr-basic" ] || is_packed "$pr-basic"; then
     # If such a PR is ever classified as stubborn, it should be removed from this file:
     # this scenario should never happen. Let's be extra safe just in case.
     echo "unexpected: closed PR to backfill is stubborn!"
     echo "[skip] Data exists for 'stubborn' PR $pr: $CURRENT_TIME"
     continue
   fi
-  echo "Attempting to backfill data for PR $pr"
-  download_normal $pr
-  if [ $i -eq 2 ]; then
-    break;
-  fi
-  i=$((i+1))
+  closed_candidates="$closed_candidates $pr"
 done
 
-echo "Backfilled at most one PR successfully"
-
-# Do the same for at most 2 stubborn PRs.
-# (Using `head --lines 2` is *not* equivalent, as we want to count *non-skipped* PRs.)
-i=0
+# Stubborn PRs without any data.
+stubborn_candidates=""
 for pr in $stubborn_prs; do
   # Check if the directory exists.
-  if [ -d "data/$pr-basic" ]; then
+  if [ -d "data/$pr-basic" ] || is_packed "$pr-basic"; then
     echo "[skip] Data exists for 'stubborn' PR #$pr: $CURRENT_TIME"
     continue
   fi
-  echo "Attempting to backfill data for 'stubborn' PR $pr"
-  download_stubborn $pr
-  i=$((i+1))
-  if [ $i -eq 2 ]; then
-    break;
-  fi
+  stubborn_candidates="$stubborn_candidates $pr"
+done
+
+# Skip PRs whose download failed recently (see download_queue.py).
+missing_candidates=$(python3 download_queue.py ready $missing_candidates)
+closed_candidates=$(python3 download_queue.py ready $closed_candidates)
+
+# Decide how many PRs of each kind fit into this run, given github's rate limit:
+# this sets the variables $redownload, $missing, $closed and $stubborn (see rate_limit.py).
+# Budget for the gather_stats.sh step is always reserved.
+eval "$(python3 rate_limit.py plan \
+  redownload=$(echo $to_redownload | wc -w) missing=$(echo $missing_candidates | wc -w) \
+  closed=$(echo $closed_candidates | wc -w) stubborn=$(echo $stubborn_candidates | wc -w))"
+
+# |first_prs N LIST| prints the first N PR numbers in LIST.
+function first_prs {
+  echo $2 | tr ' ' '\n' | head --lines "$1"
+}
+
+# Add the planned PRs to the work queue (see work_queue.py), in order of priority:
+# all other PRs (and all comments) are kept in "redownload.txt" for the next run.
+redownload_now=$(first_prs $redownload "$to_redownload")
+echo "About to re-download PR(s)" $redownload_now
+python3 work_queue.py add redownload $redownload_now
+{ grep "^--" "redownload.txt" || true; echo $to_redownload | tr ' ' '\n' | tail --lines +$((redownload + 1)); } > redownload.txt.tmp
+mv redownload.txt.tmp redownload.txt
+missing_now=$(first_prs $missing "$missing_candidates")
+echo "Attempting to backfill data for PR(s)" $missing_now
+python3 work_queue.py add missing $missing_now
+closed_now=$(first_prs $closed "$closed_candidates")
+echo "Attempting to backfill data for closed PR(s)" $closed_now
+python3 work_queue.py add closed $closed_now
+# Stubborn PRs only get basic information.
+stubborn_now=$(first_prs $stubborn "$stubborn_candidates")
+echo "Attempting to backfill data for 'stubborn' PR(s)" $stubborn_now
+python3 work_queue.py add stubborn $stubborn_now
+
+# Drain the work queue with $DOWNLOAD_WORKERS concurrent workers (default: 1). Further workers can be started
+# elsewhere, on the same checkout. Failed downloads are recorded in broken_pr_data.txt, and retried in a later run.
+workers=""
+for i in $(seq 1 "${DOWNLOAD_WORKERS:-1}"); do
+  python3 downloader.py --worker "$(hostname)-$$-$i" --record-failures broken_pr_data.txt &
+  workers="$workers $!"
+done
+for pid in $workers; do
+  wait $pid || true
 done
-echo "Backfilled up to 2 'stubborn' PRs successfully"
+echo "Re-downloaded and backfilled all planned PRs (if any)"
 
 # # One-off task: final check if there are any PRs missing from that list.
 # for pr in $(seq 1 24550); do
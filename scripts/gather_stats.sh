@@ -4,6 +4,7 @@
 # This script returns the exit code
 # - 0 if no errors occurred, and data for at least one PR was downloaded,
 # - 1 if the was an error fetching data.
+# PRs whose download failed are recorded in broken_pr_data.txt, and retried later (see below).
 
 # Surface errors in this script to CI, so they get noticed.
 # See e.g. http://redsymbol.net/articles/unofficial-bash-strict-mode/ for explanation.
@@ -15,47 +16,23 @@ TIMEDELTA=$1
 cd "$(dirname "$0")"
 cd ..
 
-# GitHub repository details
-REPO="leanprover-community/mathlib4"
-API_URL="https://api.github.com/repos/$REPO/pulls"
+# Find all PRs updated since the last successful run (see detect_changes.py).
+# TIMEDELTA (in minutes) is only used if there is no previous run.
+prs=$(python3 detect_changes.py list --since-minutes "$TIMEDELTA")
 
-# Get the current timestamp and the timestamp from TIMEDELTA minutes ago.
-CURRENT_TIME=$(date -u +"%Y-%m-%dT%H:%M:%SZ")
-PAST_TIME=$(date -u -d "$TIMEDELTA minutes ago" +"%Y-%m-%dT%H:%M:%SZ")
-
-# Fetch the list of pull requests.
-response=$(curl -s "$API_URL?state=all&per_page=100")
-
-# Check if the response is not empty.
-if [ -z "$response" ]; then
-  echo "Failed to fetch PR data: $CURRENT_TIME"
+# Download data for all updated PRs, overwriting existing data if needed.
+# downloader.py downloads basic information for stubborn PRs (listed in stubborn_prs.txt), and normal information otherwise.
+# If some downloads fail (exit code 2), these PRs are recorded in broken_pr_data.txt: check_data_integrity.py
+# schedules them for downloading again (like all PRs with outdated data, including stubborn PRs), and
+# download_missing_outdated_PRs.sh retries them. So the watermark is committed nevertheless: otherwise, a PR which
+# always fails would keep the watermark from advancing, until more PRs changed than detect_changes.py can list.
+# On any other error, the watermark is not committed, and the next run lists the same PRs again.
+status=0
+python3 downloader.py --record-failures broken_pr_data.txt $prs || status=$?
+if [ $status -ne 0 ] && [ $status -ne 2 ]; then
+  exit $status
+fi
+python3 detect_changes.py commit
+if [ $status -ne 0 ]; then
   exit 1
 fi
-
-# Parse the JSON response and filter PRs updated in the last TIMEDELTA minutes.
-prs=$(echo "$response" | jq -r --arg PAST_TIME "$PAST_TIME" --arg CURRENT_TIME "$CURRENT_TIME" '
-  .[] | select(.updated_at >= $PAST_TIME and .updated_at <= $CURRENT_TIME) |
-  .number
-')
-
-# Parse the list of all stubborn PRs. This is newline-separated,
-# but for our purposes, that is fine.
-stubborn_prs=$(cat stubborn_prs.txt | grep --invert-match "^--")
-
-# Download data for all updated PRs, overwriting existing data if needed.
-for pr in $prs; do
-  if [[ $stubborn_prs == *$pr* ]]; then
-    dir="data/$pr-basic"
-    mkdir -p "$dir"
-    scripts/basic_pr_info.sh "$pr" | jq '.' > "$dir/basic_pr_info.json"
-    echo "$CURRENT_TIME" > "$dir/timestamp.txt"
-  else
-    dir="data/$pr"
-    mkdir -p "$dir"
-    # Run pr_info.sh and pr_reactions.sh and save the output.
-    scripts/pr_info.sh "$pr" | jq '.' > "$dir/pr_info.json"
-    scripts/pr_reactions.sh "$pr" | jq '.' > "$dir/pr_reactions.json"
-    # Save the current timestamp.
-    echo "$CURRENT_TIME" > "$dir/timestamp.txt"
-  fi
-done
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+"""
+This file maintains a cache of "slim" PR data: for each PR in the `data` directory,
+the slim record contains only the fields of `pr_info.json` (resp. `basic_pr_info.json`)
+which the aggregation pipeline actually uses, stored as compact JSON.
+A full `pr_info.json` contains much more (e.g. the full text of all comments or the status checks for every commit),
+so reading the slim records instead greatly reduces the number of bytes to parse per full run of `process.py`.
+
+Slim records keep the structure of the original files (just with fewer fields), hence can be passed to
+`get_aggregate_data`, `parse_data` or `determine_ci_status` without change.
+They live in a separate directory `slim_data`, as all contents of `data` are directly downloaded from github.
+Data of closed PRs which was moved into pack files (see `packed_data.py`) is read from there.
+Each record remembers the timestamp and size of the file it was derived from; a stale record is re-derived automatically.
+
+Running this file as a script (re-)derives all missing or outdated slim records.
+"""
+
+import json
+import os
+import sys
+from os import path
+from typing import List
+
+from packed_data import PackedData, is_packed, list_pr_dirs
+from util import find_data_file, parse_json_file
+
+# The directory containing all slim records, one file per directory in `data`.
+SLIM_DATA_DIR = "slim_data"
+
+# Increase this whenever |_PR_INFO_SHAPE| changes: all existing slim records become invalid then.
+SLIM_FORMAT_VERSION = 3
+
+# The fields of `pr_info.json` which are kept in a slim record. Each key is either mapped to `True`
+# (keep this field entirely) or to a dictionary describing which sub-fields to keep.
+# Lists (such as the `nodes` of a connection) are projected element-wise.
+# Fields which are missing in the input (e.g., in a `basic_pr_info.json` file) are skipped.
+#
+# This needs to contain all fields used by `get_aggregate_data` and `main` in `process.py`,
+# by `_process_data` and `parse_data` in `state_evolution.py` and `determine_ci_status`,
+# as well as the `pageInfo` fields used for deciding whether the data is complete (see `pagination.py`).
+_PR_INFO_SHAPE: dict = {
+    "number": True,
+    "state": True,
+    "title": True,
+    "body": True,
+    "isDraft": True,
+    "createdAt": True,
+    "updatedAt": True,
+    "headRefName": True,
+    "headRefOid": True,
+    "baseRefName": True,
+    "additions": True,
+    "deletions": True,
+    "changedFiles": True,
+    "author": {"login": True},
+    "headRepositoryOwner": {"login": True},
+    "files": {"pageInfo": True, "nodes": {"path": True}},
+    "labels": {"nodes": {"name": True, "color": True}},
+    "assignees": {"nodes": {"login": True}},
+    "comments": {"pageInfo": True, "nodes": {"author": {"login": True}}},
+    "reviews": {"pageInfo": True, "nodes": {"state": True, "author": {"login": True}}},
+    # Only the number of review comments is used.
+    "reviewThreads": {"nodes": {"comments": {"nodes": {}}}},
+    # Only the number of commits is used.
+    "commits": {"pageInfo": True, "nodes": {}},
+    "statusCheckRollup": {"state": True, "contexts": {"nodes": {"context": True, "name": True, "conclusion": True, "status": True}}},
+    "timelineItems": {"pageInfo": True, "nodes": {"__typename": True, "createdAt": True, "label": {"name": True}}},
+}
+
+
+def _project(value, shape):
+    if shape is True or value is None:
+        return value
+    if isinstance(value, list):
+        return [_project(item, shape) for item in value]
+    return {key: _project(value[key], sub) for (key, sub) in shape.items() if key in value}
+
+
+# Project the parsed contents of a `pr_info.json` or `basic_pr_info.json` file to a slim record.
+# |data| is assumed to be valid, i.e. to have been returned by `parse_json_file`.
+def project_pr_info(data: dict) -> dict:
+    inner = data["data"]["repository"]["pullRequest"]
+    return {"data": {"repository": {"pullRequest": _project(inner, _PR_INFO_SHAPE)}}}
+
+
+def _source_file(pr_dir: str) -> str:
+    return "basic_pr_info.json" if pr_dir.endswith("-basic") else "pr_info.json"
+
+
+def slim_record_path(pr_dir: str) -> str:
+    return path.join(SLIM_DATA_DIR, f"{pr_dir}.json")
+
+
+# Describe the current version of the source data for the directory |pr_dir| in `data`:
+# the contents of its timestamp file and the size of its (possibly compressed) PR info file.
+# (We do not use the modification time, as this changes with every fresh checkout of the data.)
+# If |packed| is given and |pr_dir| is packed, describe the packed data instead.
+def _source_version(pr_dir: str, packed: PackedData | None) -> dict:
+    if packed is not None and is_packed(packed, pr_dir):
+        name = packed.find_file(pr_dir, _source_file(pr_dir))
+        if name is None:
+            raise FileNotFoundError(f"no packed file {_source_file(pr_dir)} for {pr_dir}")
+        return {"format": SLIM_FORMAT_VERSION, "timestamp": packed.timestamp(pr_dir).strip(), "size": packed.size(pr_dir, name)}
+    with open(path.join("data", pr_dir, "timestamp.txt"), "r") as fi:
+        timestamp = fi.read().strip()
+    size = os.stat(find_data_file(path.join("data", pr_dir, _source_file(pr_dir)))).st_size
+    return {"format": SLIM_FORMAT_VERSION, "timestamp": timestamp, "size": size}
+
+
+def _parse_source(pr_dir: str, packed: PackedData | None) -> dict | str:
+    pr_number = pr_dir.removesuffix("-basic")
+    if packed is not None and is_packed(packed, pr_dir):
+        return packed.parse_json_file(pr_dir, _source_file(pr_dir), pr_number)
+    return parse_json_file(path.join("data", pr_dir, _source_file(pr_dir)), pr_number)
+
+
+# Read the slim record for |pr_dir|, if it exists and is up to date.
+def _read_slim_record(pr_dir: str, version: dict) -> dict | None:
+    try:
+        with open(slim_record_path(pr_dir), "r") as fi:
+            record = json.load(fi)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return None
+    return record["pr_info"] if record.get("source") == version else None
+
+
+def _write_slim_record(pr_dir: str, version: dict, slim: dict) -> None:
+    os.makedirs(SLIM_DATA_DIR, exist_ok=True)
+    # Write to a temporary file first, so an interrupted write never leaves a broken record behind.
+    tmp = slim_record_path(pr_dir) + ".tmp"
+    with open(tmp, "w") as fi:
+        json.dump({"source": version, "pr_info": slim}, fi, separators=(",", ":"))
+    os.replace(tmp, slim_record_path(pr_dir))
+
+
+# Return the (slim) PR info for the directory |pr_dir| in `data`, re-deriving the slim record if necessary.
+# Like `parse_json_file`, return an error message if the underlying data is invalid.
+# Directories which are not present in `data` are read from |packed|, if given.
+def load_pr_info(pr_dir: str, packed: PackedData | None = None) -> dict | str:
+    try:
+        version = _source_version(pr_dir, packed)
+    except (FileNotFoundError, ValueError):
+        # Without a timestamp, we cannot tell whether a slim record is current: read the original data.
+        return _parse_source(pr_dir, packed)
+    slim = _read_slim_record(pr_dir, version)
+    if slim is not None:
+        return slim
+    match _parse_source(pr_dir, packed):
+        case str(err):
+            return err
+        case dict(data):
+            slim = project_pr_info(data)
+            _write_slim_record(pr_dir, version, slim)
+            return slim
+
+
+# Remove all slim records whose directory in `data` has been removed (e.g., because it contained broken data).
+def prune_slim_records(pr_dirs: List[str]) -> None:
+    if not path.isdir(SLIM_DATA_DIR):
+        return
+    expected = set(f"{pr_dir}.json" for pr_dir in pr_dirs)
+    for name in os.listdir(SLIM_DATA_DIR):
+        if name not in expected:
+            os.remove(path.join(SLIM_DATA_DIR, name))
+
+
+def main() -> None:
+    packed = PackedData()
+    pr_dirs = [d for d in list_pr_dirs(packed) if not d.endswith("-temp")]
+    prune_slim_records(pr_dirs)
+    (raw_bytes, slim_bytes) = (0, 0)
+    for pr_dir in pr_dirs:
+        match load_pr_info(pr_dir, packed):
+            case str(err):
+                print(err, file=sys.stderr)
+            case dict(_data):
+                raw_bytes += _source_version(pr_dir, packed)["size"]
+                slim_bytes += os.stat(slim_record_path(pr_dir)).st_size
+    if raw_bytes:
+        print(f"slim records for {len(pr_dirs)} PRs: {slim_bytes / 1e6:.1f} MB instead of {raw_bytes / 1e6:.1f} MB ({slim_bytes / raw_bytes:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""
+A local stub of github's GraphQL API, for testing the downloading code without network access.
+
+The stub serves recorded responses: `load_recorded_responses` reads them from a directory of files
+`<query>-<PR number>.json` (such as `test/recorded/pr_info-1234.json`), where <query> is the name of one of
+the `.graphql` files in this repository. Incoming requests are matched to a query by comparing the query text
+with the contents of these files. Tests can also script a sequence of responses for a given query and PR
+(e.g., a server error followed by a successful response) to exercise retries.
+Batched queries (see `graphql_batch.py`) are answered by combining the responses for each query and PR;
+the stub can also simulate latency and a limit on the batch size (answering larger batches with a time-out).
+With `paginate=True`, the stub serves connections page by page (like github, see `pagination.py`):
+the recorded responses contain all nodes, and the stub splits them into pages.
+The cursors are the positions of the next node, so the stub also answers incremental updates (`pagination.update_query`).
+With `rate_limit=N`, the stub simulates github's rate limit (see `rate_limit.py`): it starts with a budget of N points,
+each query costs one point per PR (and query) it asks for, and queries exceeding the budget fail with a RATE_LIMITED error.
+The `rateLimit` field and the `x-ratelimit-*` headers are answered accordingly.
+With `pulls=[...]`, the stub also answers GET requests to the REST API's `pulls` endpoint (see `detect_changes.py`),
+with ETags: conditional requests for unchanged pages are answered with `304 Not Modified` (see `http_cache.py`).
+
+Usage from a test:
+    with StubGitHub(responses) as stub:
+        client = GraphQLClient(stub.url, None, max_connections=2)
+        ...
+    assert stub.requests == [...]
+
+Running this file as a script serves the recorded responses in a given directory until interrupted,
+e.g. `python3 stub_github.py test/recorded 8000` (then set GITHUB_GRAPHQL_URL=http://127.0.0.1:8000/graphql).
+"""
+
+import calendar
+import copy
+import glob
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from typing import List, NamedTuple, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from graphql_batch import alias, parse_batch_query, query_selection
+from pagination import APPEND_ONLY_CONNECTIONS, PAGE_SIZE, PAGINATED_CONNECTIONS, RECENT_NODES, page_queries, update_query
+from rate_limit import RATE_LIMIT_SELECTION
+
+# The names of all GraphQL queries the stub knows about.
+QUERIES = ["pr_info", "pr_reactions", "basic_pr_info"]
+
+
+# A response the stub server should send: HTTP status, response body and additional headers.
+class StubResponse(NamedTuple):
+    status: int
+    body: dict | str
+    headers: dict[str, str] = {}
+
+
+# Read all recorded responses in the directory |dir|: map each pair (query name, PR number)
+# to a list containing a successful response with the recorded data.
+def load_recorded_responses(dir: str) -> dict[Tuple[str, int], List[StubResponse]]:
+    responses = dict()
+    for file in glob.glob(path.join(dir, "*.json")):
+        (query, number) = path.basename(file).removesuffix(".json").rsplit("-", 1)
+        with open(file, "r") as fi:
+            responses[(query, int(number))] = [StubResponse(200, json.load(fi))]
+    return responses
+
+
+def _query_texts() -> dict[str, str]:
+    texts = dict()
+    for query in QUERIES:
+        with open(f"{query}.graphql", "r") as fi:
+            texts[fi.read()] = query
+    return texts
+
+
+# The page of |size| nodes starting at |offset| of a connection with nodes |nodes|.
+def _page(nodes: List[dict], offset: int, size: int) -> dict:
+    end = min(offset + size, len(nodes))
+    return {"pageInfo": {"hasNextPage": end < len(nodes), "endCursor": str(end)}, "nodes": nodes[offset:end]}
+
+
+# A stub github server on the local port |port| (by default, a free port), running in a background thread.
+# |responses| maps each pair (query name, PR number) to the list of responses to send, in order:
+# once the list is exhausted, the last response is repeated. Unknown requests are answered with a GraphQL error.
+# Each HTTP request takes at least |latency| seconds, plus |latency_per_query| seconds per query and PR it asks for.
+# Batched queries for more than |max_batch| queries are answered with HTTP status 504 (like a github time-out).
+# If |rate_limit| is given, the stub simulates a rate limit with that budget (which is never reset).
+class StubGitHub:
+    def __init__(
+        self, responses: dict[Tuple[str, int], List[StubResponse]], port: int = 0,
+        latency: float = 0.0, latency_per_query: float = 0.0, max_batch: int | None = None, paginate: bool = False,
+        rate_limit: int | None = None, pulls: List[dict] | None = None
+    ) -> None:
+        self.responses = {key: list(value) for (key, value) in responses.items()}
+        self.rate_limit = rate_limit
+        # The remaining budget, if simulating a rate limit, and the time of the (simulated) next reset.
+        self.remaining = rate_limit
+        self.reset_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+        self.paginate = paginate
+        self.latency = latency
+        self.latency_per_query = latency_per_query
+        self.max_batch = max_batch
+        # All queries received so far, as pairs (query name, PR number), in order.
+        # A batched request contributes one entry per query and PR.
+        self.requests: List[Tuple[str, int]] = []
+        # The number of HTTP requests received so far, and the total size of all response bodies sent.
+        self.http_requests = 0
+        self.bytes_sent = 0
+        # The number of connections accepted so far.
+        self.connections = 0
+        # The PRs served by the REST endpoint, and the number of REST requests (and of 304 responses to them) so far.
+        self.pulls = pulls or []
+        self.rest_requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._query_names = _query_texts()
+        self._page_queries = page_queries()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Support persistent connections.
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self) -> None:
+                (status, content, etag) = stub._rest_response(self.path, self.headers.get("If-None-Match"))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                response = stub._respond(request)
+                body = response.body if isinstance(response.body, str) else json.dumps(response.body)
+                content = body.encode()
+                with stub._lock:
+                    stub.bytes_sent += len(content)
+                self.send_response(response.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for (key, value) in response.headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/graphql"
+        # The base URL of the REST API.
+        self.rest_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _respond(self, request: dict) -> StubResponse:
+        text = request.get("query", "")
+        variables = request.get("variables", {})
+        asks_rate_limit = RATE_LIMIT_SELECTION in text
+        text = text.replace(RATE_LIMIT_SELECTION, "")
+        # Without a simulated rate limit, the `rateLimit` field is ignored.
+        if self.remaining is None:
+            return self._answer(text, variables)
+        cost = len(parse_batch_query(text) or [text])
+        with self._lock:
+            if self.remaining < cost:
+                self.http_requests += 1
+                error = {"type": "RATE_LIMITED", "message": "API rate limit exceeded"}
+                return StubResponse(200, {"errors": [error]}, self._rate_limit_headers())
+            self.remaining -= cost
+            rate_limit = {"cost": cost, "remaining": self.remaining, "resetAt": self.reset_at, "limit": self.rate_limit}
+            headers = self._rate_limit_headers()
+        response = self._answer(text, variables)
+        body = response.body
+        if asks_rate_limit and isinstance(body, dict) and isinstance(body.get("data"), dict):
+            body = dict(body, data=dict(body["data"], rateLimit=rate_limit))
+        return StubResponse(response.status, body, {**response.headers, **headers})
+
+    # The `x-ratelimit-*` headers describing the current state of the simulated rate limit, with the lock held.
+    def _rate_limit_headers(self) -> dict[str, str]:
+        assert self.rate_limit is not None and self.remaining is not None
+        return {
+            "x-ratelimit-limit": str(self.rate_limit),
+            "x-ratelimit-remaining": str(self.remaining),
+            "x-ratelimit-used": str(self.rate_limit - self.remaining),
+            "x-ratelimit-reset": str(calendar.timegm(time.strptime(self.reset_at, "%Y-%m-%dT%H:%M:%SZ"))),
+        }
+
+    def _answer(self, text: str, variables: dict) -> StubResponse:
+        if text in self._page_queries:
+            (name, connection) = self._page_queries[text]
+            with self._lock:
+                self.http_requests += 1
+                self.requests.append((f"{name}.{connection}", variables["prNumber"]))
+                return self._page_response(name, connection, variables["prNumber"], int(variables["cursor"]))
+        if self.paginate and text == update_query():
+            with self._lock:
+                self.http_requests += 1
+                self.requests.append(("pr_info_update", variables["prNumber"]))
+                return self._update_response(variables["prNumber"], variables)
+        if text in self._query_names:
+            wanted = [(self._query_names[text], variables.get("prNumber", -1))]
+        else:
+            wanted = parse_batch_query(text) or [("unknown", -1)]
+        time.sleep(self.latency + self.latency_per_query * len(wanted))
+        with self._lock:
+            self.http_requests += 1
+            self.requests.extend(wanted)
+            if text in self._query_names or wanted == [("unknown", -1)]:
+                return self._next_response(wanted[0])
+            if self.max_batch is not None and len(wanted) > self.max_batch:
+                return StubResponse(504, "gateway time-out")
+            return self._batch_response(wanted)
+
+    # The next scripted response for |key|, with the lock held.
+    def _next_response(self, key: Tuple[str, int]) -> StubResponse:
+        queue = self.responses.get(key)
+        if not queue:
+            return StubResponse(200, {"errors": [{"type": "NOT_FOUND", "message": f"no recorded response for {key[0]} {key[1]}"}]})
+        response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if self.paginate and response.status == 200 and isinstance(response.body, dict) and key[0] in PAGINATED_CONNECTIONS:
+            return StubResponse(200, self._first_page(key[0], response.body), response.headers)
+        return response
+
+    # Truncate all paginated connections in |body| (a response to the query |name|) to their first page,
+    # and add `pageInfo` fields. The cursors are the positions of the next node.
+    def _first_page(self, name: str, body: dict) -> dict:
+        inner = (body.get("data") or {}).get("repository", {}).get("pullRequest")
+        if inner is None:
+            return body
+        body = copy.deepcopy(body)
+        inner = body["data"]["repository"]["pullRequest"]
+        for connection in PAGINATED_CONNECTIONS[name]:
+            if connection in inner:
+                first = int(re.search(rf"\b{connection}\(first: (\d+)\)", query_selection(name)).group(1))
+                inner[connection] = _page(inner[connection]["nodes"], 0, first)
+        return body
+
+    # The response to an incremental update of PR |number| (see `pagination.update_query`), with the lock held.
+    def _update_response(self, number: int, variables: dict) -> StubResponse:
+        response = self._next_response(("pr_info", number))
+        queue = self.responses.get(("pr_info", number))
+        if response.status != 200 or not queue:
+            return response
+        full = queue[-1].body["data"]["repository"]["pullRequest"]
+        inner = response.body["data"]["repository"]["pullRequest"]
+        for connection in APPEND_ONLY_CONNECTIONS:
+            nodes = full[connection]["nodes"]
+            inner[connection] = dict(_page(nodes, int(variables[f"after_{connection}"] or 0), PAGE_SIZE), totalCount=len(nodes))
+        inner["lastCommit"] = {"nodes": full["commits"]["nodes"][-1:]}
+        for (field, connection) in [("recentComments", "comments"), ("recentReviews", "reviews")]:
+            inner[field] = {"nodes": [{"id": n["id"], "body": n["body"]} for n in full[connection]["nodes"][-RECENT_NODES:]]}
+        return response
+
+    # The response to a page query for |connection| of the query |name| for PR |number|, with the lock held.
+    def _page_response(self, name: str, connection: str, number: int, offset: int) -> StubResponse:
+        queue = self.responses.get((name, number))
+        if not queue:
+            return StubResponse(200, {"errors": [{"type": "NOT_FOUND", "message": f"no recorded response for {name} {number}"}]})
+        nodes = queue[-1].body["data"]["repository"]["pullRequest"][connection]["nodes"]
+        return StubResponse(200, {"data": {"repository": {"pullRequest": {connection: _page(nodes, offset, PAGE_SIZE)}}}})
+
+    # Combine the next scripted responses for all pairs in |wanted| into the response to a batched query, with the lock held.
+    # If any of them is not successful on the HTTP level (or reports a time-out or rate limit), so is the combined response.
+    def _batch_response(self, wanted: List[Tuple[str, int]]) -> StubResponse:
+        repository = dict()
+        errors = []
+        for key in wanted:
+            response = self._next_response(key)
+            if response.status != 200 or isinstance(response.body, str):
+                return response
+            single_errors = response.body.get("errors") or []
+            if any(err.get("type") in ["TIMEOUT", "RATE_LIMITED"] for err in single_errors):
+                return response
+            name = alias(*key)
+            repository[name] = ((response.body.get("data") or {}).get("repository") or {}).get("pullRequest")
+            errors.extend(dict(err, path=["repository", name]) for err in single_errors)
+        body: dict = {"data": {"repository": repository}}
+        if errors:
+            body["errors"] = errors
+        return StubResponse(200, body)
+
+    # Answer the REST request for |request_path|: only the `pulls` endpoint is supported (sorted by update time,
+    # most recent first). Responses have an ETag, and conditional requests are answered with 304 if nothing changed.
+    # Return the HTTP status, the body and the ETag.
+    def _rest_response(self, request_path: str, if_none_match: str | None) -> Tuple[int, bytes, str]:
+        url = urlsplit(request_path)
+        query = parse_qs(url.query)
+        (page, per_page) = (int(query.get("page", ["1"])[0]), int(query.get("per_page", ["30"])[0]))
+        with self._lock:
+            self.rest_requests += 1
+            if url.path != "/repos/leanprover-community/mathlib4/pulls":
+                return (404, b'{"message": "Not Found"}', '"404"')
+            pulls = sorted(self.pulls, key=lambda pr: pr["updated_at"], reverse=True)
+            content = json.dumps(pulls[(page - 1) * per_page:page * per_page]).encode()
+            etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+            if if_none_match == etag:
+                self.not_modified += 1
+                return (304, b"", etag)
+            self.bytes_sent += len(content)
+            return (200, content, etag)
+
+    def __enter__(self) -> "StubGitHub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> None:
+    if len(sys.argv) != 3 or not sys.argv[2].isdigit():
+        print("usage: stub_github.py <directory with recorded responses> <port>", file=sys.stderr)
+        sys.exit(1)
+    with StubGitHub(load_recorded_responses(sys.argv[1]), int(sys.argv[2])) as stub:
+        print(f"serving recorded responses on {stub.url}")
+        stub._thread.join()
+
+
+if __name__ == "__main__":
+    main()
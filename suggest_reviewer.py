@@ -6,16 +6,15 @@ This may take the current number of pull requests assigned to each reviewer into
 
 """
 
+import heapq
 import json
+import math
 import sys
 from typing import List, NamedTuple, Tuple
-from classify_pr_state import PRState, PRStatus, LabelKind, determine_PR_status, label_categorisation_rules
-from compute_dashboard_prs import LastStatusChange, DataStatus
 
 from datetime import datetime
-from os import path
 
-from dateutil import parser, tz
+from dateutil import parser
 
 from dashboard import (
     AggregatePRInfo,
@@ -51,14 +50,61 @@ class ReviewerInfo(NamedTuple):
     conflict_of_interest: List[str]
 
 
-def read_reviewer_info() -> List[ReviewerInfo]:
+# An index of all reviewers, for quickly finding the reviewers of a PR with given topic labels and author.
+# This is built once (by |read_reviewer_info|); the reviewers matching each combination of topic labels are cached.
+class ReviewerIndex:
+    def __init__(self, reviewers: List[ReviewerInfo]) -> None:
+        # All reviewers, in the order of the reviewer info file.
+        self.reviewers = reviewers
+        # The set of top-level areas of each reviewer (by their position in |reviewers|).
+        self.topics: List[frozenset[str]] = [frozenset(rev.top_level) for rev in reviewers]
+        # Each topic label, mapped to the positions of all reviewers interested in it.
+        self.by_topic: dict[str, List[int]] = dict()
+        for (i, topics) in enumerate(self.topics):
+            for topic in topics:
+                self.by_topic.setdefault(topic, []).append(i)
+        # Each PR author, mapped to the github handles of all reviewers with a conflict of interest with them.
+        self.conflicts: dict[str, set[str]] = dict()
+        for rev in reviewers:
+            for author in rev.conflict_of_interest:
+                self.conflicts.setdefault(author, set()).add(rev.github)
+        # The number of reviewers with each github handle.
+        self._handles: dict[str, int] = dict()
+        for rev in reviewers:
+            self._handles[rev.github] = self._handles.get(rev.github, 0) + 1
+        # Each combination of topic labels (in their order on a PR), mapped to all reviewers matching
+        # at least one of them, with the matching labels. See |matching|.
+        self._matches: dict[Tuple[str, ...], List[Tuple[ReviewerInfo, List[str]]]] = dict()
+
+    # The github handles of all reviewers who must not review a PR by |author|:
+    # the author themselves, and all reviewers with a conflict of interest with them.
+    def excluded(self, author: str) -> set[str]:
+        return {author} | self.conflicts.get(author, set())
+
+    # The number of reviewers whose github handle is not in |excluded|.
+    def number_eligible(self, excluded: set[str]) -> int:
+        return len(self.reviewers) - sum(self._handles.get(handle, 0) for handle in excluded)
+
+    # All reviewers interested in at least one of |topic_labels|, in the order of |reviewers|,
+    # together with the list of these labels they are interested in (in the order of |topic_labels|).
+    def matching(self, topic_labels: List[str]) -> List[Tuple[ReviewerInfo, List[str]]]:
+        key = tuple(topic_labels)
+        if key not in self._matches:
+            candidates = sorted({i for lab in topic_labels for i in self.by_topic.get(lab, [])})
+            self._matches[key] = [
+                (self.reviewers[i], [lab for lab in topic_labels if lab in self.topics[i]]) for i in candidates
+            ]
+        return self._matches[key]
+
+
+def read_reviewer_info() -> ReviewerIndex:
     # Future: download the raw file from this link, instead of reading a local copy!
     # (This requires fixing the upstream version first: locally, it is easy to just correct the bugs.)
     # And the file should live on a more stable branch (master?), or the webpage?
     _file_url = "https://raw.githubusercontent.com/leanprover-community/mathlib4/refs/heads/reviewer-topics/docs/reviewer-topics.json"
     with open("reviewer-topics.json", "r") as fi:
         reviewer_topics = json.load(fi)
-    return [
+    return ReviewerIndex([
         ReviewerInfo(
             entry["github_handle"], entry["zulip_handle"], entry["top_level"], entry["free_form"],
             entry["maximum_capacity"] if "maximum_capacity" in entry else DEFAULT_CAPACITY,
@@ -67,7 +113,7 @@ def read_reviewer_info() -> List[ReviewerInfo]:
             entry["conflict_of_interest"] if "conflict_of_interest" in entry else []
         )
         for entry in reviewer_topics
-    ]
+    ])
 
 
 class AssignmentStatistics(NamedTuple):
@@ -83,74 +129,23 @@ class AssignmentStatistics(NamedTuple):
     # - numbers is a list of *open* PRs assigned to this user, n_open the number of these,
     # - n_open_weighted counts these PRs with some *weight* applied: PRs on the queue or with just
     #   a merge conflict get full weight, PRs waiting on the author (or zulip) get weight ...
-    #   and blocked PRs do not get counted at all,
+    #   and blocked PRs do not get counted at all (see `_compute_assignment_weight` in `process.py`),
     # - n_all is the number of all PRs ever assigned to this user
     # Note that a PR assigned to several users is counted multiple times, once per assignee.
     assignments: dict[str, Tuple[List[int], float, int]]
 
 
-# Compute the weight of a pull request for the purposes of counting reviewer assignments.
-# A pull request has weight 1 if it is on the review queue or just has a merge conflict,
-# if it is waiting on the PR author or zulip, it has weight 1/(t+t)
-# (where t is the number of days since the PR was last on the queue),
-# blocked PRs get weight 0.
-def _compute_weight(pr: int, data: AggregatePRInfo) -> float:
-    # We don't use data.last_status_change as that is None for stubborn PRs
-    # (whereas we still classify them using labels and CI data).
-    labels: List[LabelKind] = [label_categorisation_rules[lab.name] for lab in data.labels if lab.name in label_categorisation_rules]
-    state = PRState(labels, data.CI_status, data.is_draft, data.head_repo != 'leanprover-community')
-    status: PRStatus = determine_PR_status(datetime(2025, 1, 1, tzinfo=tz.tzutc()), state)
-    match status:
-        case PRStatus.AwaitingReview | PRStatus.MergeConflict:
-            return 1.0
-        case PRStatus.Blocked:
-            return 0
-        case PRStatus.AwaitingAuthor | PRStatus.AwaitingDecision:
-            match data.last_status_change:
-                case None:
-                    print(f"info: PR {pr} has no last status update, assigning placehold weight 0.1")
-                    return 0.1
-                case LastStatusChange(DataStatus.Missing, _, _, _) | LastStatusChange(DataStatus.Incomplete, _, _, _):
-                    print(f"info: PR {pr} has incomplete or missing last update status information, assigning weight 0.1")
-                    return 0.1
-                case LastStatusChange(DataStatus.Valid, _, delta, current):
-                    assert current in [PRStatus.AwaitingAuthor, PRStatus.AwaitingDecision]
-                    # Future: do I want to refine this weight function?
-                    return 1 / (delta.days + 1)
-        case PRStatus.Delegated | PRStatus.AwaitingBors:
-            return 0
-        case PRStatus.Closed | PRStatus.Contradictory | PRStatus.NotReady: # | PRStatus.FromFork:
-            return 0
-        case PRStatus.HelpWanted:
-            return 0  # arguably also fine
-        case _:
-            # The above list should be complete!
-            assert False
-    return 0  # unreachable in practice
-
-
-# Compute a weighted sum of all PRs with number in |prs|.
-# A pull request has weight 1 if it is on the review queue or just has a merge conflict,
-# if it is waiting on the PR author or zulip, it has weight 1/(t+t)
-# (where t is the number of days since the PR was last on the queue),
-# blocked PRs get weight 0.
-# Self-assigned PRs also get weight 0.
-def _compute_assignment_weight(reviewer: str, prs : List[int], all_aggregate_info: dict[int, AggregatePRInfo]) -> float:
-    return sum([_compute_weight(pr, all_aggregate_info[pr]) for pr in prs if all_aggregate_info[pr].author != reviewer])
-
-
-def collect_assignment_statistics(all_aggregate_info: dict[int, AggregatePRInfo]) -> AssignmentStatistics:
-    with open(path.join("processed_data", "assignment_data.json"), "r") as fi:
-        assignment_data = json.load(fi)
+# Collect the statistics about all assigned PRs, given the contents |assignment_data| and |reviewer_load| of the files
+# `assignment_data.json` and `reviewer_load.json` (see `read_assignment_files` in `dashboard.py`).
+# These are computed by `process.py`, together with the weight of each PR (see `_compute_assignment_weight` in `process.py`).
+def collect_assignment_statistics(assignment_data: dict, reviewer_load: dict) -> AssignmentStatistics:
     time = parser.isoparse(assignment_data["timestamp"])
     num_open = assignment_data["number_open_prs"]
-    assignments = assignment_data["all_assignments"]
     numbers: dict[str, Tuple[List[int], float, int]] = {}
     assigned_open_prs = []
-    for reviewer, data in assignments.items():
-        open_assigned = sorted([entry["number"] for entry in data if entry["state"] == "open"])
-        numbers[reviewer] = (open_assigned, _compute_assignment_weight(reviewer, open_assigned, all_aggregate_info), len(data))
-        assigned_open_prs.extend(open_assigned)
+    for reviewer, load in reviewer_load["reviewers"].items():
+        numbers[reviewer] = (load["open_assigned"], load["weighted"], load["number_all_assigned"])
+        assigned_open_prs.extend(load["open_assigned"])
     num_multiple_assignees = len(assigned_open_prs) - len(set(assigned_open_prs))
     if assignment_data["number_open_assigned"] != len(list(set(assigned_open_prs))):
         print(f'WARNING: assignment statistics are inconsistent, found {assignment_data["number_open_assigned"]} open assigned PRs in the .json file, but am counting PR {len(list(set(assigned_open_prs)))} of them')
@@ -174,29 +169,34 @@ class ReviewerSuggestion(NamedTuple):
     suggested: str | None
 
 
+# The names of all topic labels of a PR, in their order on the PR.
+def _topic_labels(info: AggregatePRInfo) -> List[str]:
+    return [lab.name for lab in info.labels if lab.name.startswith("t-") or lab.name in ["CI", "IMO", "tech debt"]]
+
+
 # Suggest potential reviewers for a single pull request with given number.
 # We return all reviewers whose top-level interest have the best possible match
 # for this PR.
 def suggest_reviewers(
-    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: List[ReviewerInfo], number: int, info: AggregatePRInfo,
+    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: ReviewerIndex, number: int, info: AggregatePRInfo,
     all_info: dict[int, AggregatePRInfo]  # aggregate information about all PRs
 ) -> ReviewerSuggestion:
     # Look at all topic labels of this PR, and find all suitable reviewers.
-    topic_labels = [lab.name for lab in info.labels if lab.name.startswith("t-") or lab.name in ["CI", "IMO", "tech debt"]]
-    # Each reviewer, together with the list of top-level areas
+    topic_labels = _topic_labels(info)
+    # Each reviewer interested in at least one of these labels, together with the list of top-level areas
     # relevant to this PR in which this reviewer is competent.
     matching_reviewers: List[Tuple[ReviewerInfo, List[str]]] = []
     if topic_labels:
-        for rev in reviewers:
-            reviewer_lab = rev.top_level
-            match = [lab for lab in topic_labels if lab in reviewer_lab]
-            # Do not propose a PR's author as potential reviewer,
-            # nor suggest any reviewers who have a conflict of interest with the PR author.
-            if rev.github not in ([info.author] + rev.conflict_of_interest):
-                matching_reviewers.append((rev, match))
+        # Do not propose a PR's author as potential reviewer,
+        # nor suggest any reviewers who have a conflict of interest with the PR author.
+        excluded = reviewers.excluded(info.author)
+        number_eligible = reviewers.number_eligible(excluded)
+        matching_reviewers = [(rev, areas) for (rev, areas) in reviewers.matching(topic_labels) if rev.github not in excluded]
     else:
         # Do not propose a PR's author as potential reviewer.
-        matching_reviewers = [(rev, []) for rev in reviewers if rev.github != info.author]
+        excluded = {info.author}
+        matching_reviewers = [(rev, []) for rev in reviewers.reviewers if rev.github != info.author]
+        number_eligible = len(matching_reviewers)
 
     # Future: decide how to customise and filter the output, lots of possibilities!
     # - no and one reviewer look sensible already
@@ -204,22 +204,19 @@ def suggest_reviewers(
     # - don't suggest more than five reviewers --- but make clear there was a selection
     #   perhaps: have two columns "all matching reviewers" and "suggested one(s)" with up to three?
     # - would showing the full interests (not just the top-level areas) be helpful?
-    if not matching_reviewers:
+    if number_eligible == 0:
         print(f"found no reviewers with matching interest for PR {number}", file=sys.stderr)
         return ReviewerSuggestion("found no reviewers with matching interest", [], [], None)
-    elif len(matching_reviewers) == 1:
-        handle = matching_reviewers[0][0].github
+    elif number_eligible == 1:
+        handle = next(rev.github for rev in reviewers.reviewers if rev.github not in excluded)
         return ReviewerSuggestion(f"{user_link(handle)}", [handle], [handle], handle)
     else:
         if not topic_labels:
-            proposed_reviewers = [(rev, []) for rev in reviewers]
+            proposed_reviewers = [(rev, []) for rev in reviewers.reviewers]
         else:
-            max_score = max([len(areas) for (_, areas) in matching_reviewers])
-            if max_score > 1:
-                # If there are several areas, prefer reviewers which match the highest number of them.
-                proposed_reviewers = [(rev, areas) for (rev, areas) in matching_reviewers if len(areas) == max_score]
-            else:
-                proposed_reviewers = [(rev, areas) for (rev, areas) in matching_reviewers if len(areas) > 0]
+            max_score = max([len(areas) for (_, areas) in matching_reviewers], default=0)
+            # If there are several areas, prefer reviewers which match the highest number of them.
+            proposed_reviewers = [(rev, areas) for (rev, areas) in matching_reviewers if len(areas) == max_score]
             if not proposed_reviewers:
                 print(f"PR {number} has an area label, but found no reviewers with matching interests")
                 return ReviewerSuggestion("found no reviewers with interest in this area(s)", [], [], None)
@@ -265,7 +262,7 @@ def suggest_reviewers(
 # is returned --- who is on the review rotation and has available review capacity.
 # Return a dictionary (pr_number: candidate reviewer).
 def suggest_reviewers_many(
-    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: List[ReviewerInfo], prs_to_assign: List[int], info: dict[int, AggregatePRInfo]
+    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: ReviewerIndex, prs_to_assign: List[int], info: dict[int, AggregatePRInfo]
 ) -> dict[int, str]:
     suggestions = {}
     stats = existing_assignments.copy()
@@ -276,6 +273,188 @@ def suggest_reviewers_many(
             continue
         suggestions[number] = suggested
         (prs, n_weighted, n_all) = stats.get(suggested) or ([], 0, 0)
-        prs.append(number)
-        stats[suggested] = (prs, n_weighted + 1, n_all + 1)
+        # NB. Do not modify the list in |existing_assignments|.
+        stats[suggested] = (prs + [number], n_weighted + 1, n_all + 1)
     return suggestions
+
+
+# The objective of a batch assignment of reviewers (see |suggest_reviewers_batch|): each assigned PR is worth
+# |ASSIGNMENT_VALUE|, plus |MATCH_VALUE| for each of its topic labels in the reviewer's areas of interest.
+# Each new assignment of a reviewer costs |LOAD_PENALTY| times their weighted load afterwards, relative to their capacity:
+# thus, assigning as many PRs as possible comes first, then assigning them to reviewers with matching interests,
+# then spreading them among reviewers with spare capacity.
+ASSIGNMENT_VALUE = 100
+MATCH_VALUE = 10
+LOAD_PENALTY = 10
+
+
+# The number of PRs which can still be assigned to |rev|, if their current weighted load is |n_weighted|:
+# like |suggest_reviewers|, we assign a PR to a reviewer if their load is less than their capacity.
+def _free_slots(rev: ReviewerInfo, n_weighted: float) -> int:
+    if not rev.is_on_rotation or rev.is_temporarily_off_rotation:
+        return 0
+    return max(0, math.ceil(rev.maximum_capacity - n_weighted))
+
+
+# The cost of assigning a |k|-th new PR (counting from 0) to |rev|, if their current weighted load is |n_weighted|.
+# This is non-decreasing in |k|.
+def _load_penalty(rev: ReviewerInfo, n_weighted: float, k: int) -> int:
+    return math.floor(LOAD_PENALTY * (n_weighted + k + 1) / max(rev.maximum_capacity, 1))
+
+
+# All reviewers which could be assigned to the PR |info|, with the number of its topic labels they are interested in.
+# Reviewers are only assigned PRs in their areas of interest (if the PR has any topic labels), never PRs by themselves
+# or PRs by authors they have a conflict of interest with.
+def _assignment_candidates(reviewers: ReviewerIndex, info: AggregatePRInfo) -> List[Tuple[ReviewerInfo, int]]:
+    topic_labels = _topic_labels(info)
+    excluded = reviewers.excluded(info.author)
+    if topic_labels:
+        return [(rev, len(areas)) for (rev, areas) in reviewers.matching(topic_labels) if rev.github not in excluded]
+    return [(rev, 0) for rev in reviewers.reviewers if rev.github not in excluded]
+
+
+# The objective value of the assignment |assignment| (mapping PR numbers to the github handle of their reviewer),
+# given the existing assignments |existing_assignments|. Higher is better.
+def assignment_objective(
+    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: ReviewerIndex,
+    assignment: dict[int, str], info: dict[int, AggregatePRInfo]
+) -> int:
+    by_handle = {rev.github: rev for rev in reviewers.reviewers}
+    value = 0
+    count: dict[str, int] = dict()
+    for (number, handle) in assignment.items():
+        value += ASSIGNMENT_VALUE + MATCH_VALUE * len(set(_topic_labels(info[number])) & set(by_handle[handle].top_level))
+        count[handle] = count.get(handle, 0) + 1
+    for (handle, n) in count.items():
+        n_weighted = existing_assignments[handle][1] if handle in existing_assignments else 0
+        value -= sum(_load_penalty(by_handle[handle], n_weighted, k) for k in range(n))
+    return value
+
+
+# Suggest reviewers for a list of PRs at once, maximising |assignment_objective| over all possible assignments
+# (unlike |suggest_reviewers_many|, which assigns PRs one by one, in order).
+# This is a minimum-cost flow problem: each PR sends one unit of flow to one of its candidate reviewers
+# (see |_assignment_candidates|), each reviewer passes at most their number of free slots to the sink,
+# their k-th slot costing |_load_penalty|. PRs with the same candidates (and costs) are interchangeable,
+# so we solve this problem for classes of such PRs. We use successive shortest paths: in each phase, we compute
+# all shortest paths with Dijkstra's algorithm (using node potentials, as there are negative costs) and apply
+# as many of them as possible, stopping once no assignment improves the objective.
+# Return a dictionary (pr_number: reviewer).
+def suggest_reviewers_batch(
+    existing_assignments: dict[str, Tuple[List[int], float, int]], reviewers: ReviewerIndex, prs_to_assign: List[int], info: dict[int, AggregatePRInfo]
+) -> dict[int, str]:
+    # Reviewers with free slots: each is identified by their position in |revs|.
+    revs: List[ReviewerInfo] = []
+    position: dict[str, int] = dict()
+    penalties: List[List[int]] = []
+    for rev in reviewers.reviewers:
+        n_weighted = existing_assignments[rev.github][1] if rev.github in existing_assignments else 0
+        slots = _free_slots(rev, n_weighted)
+        if slots > 0 and rev.github not in position:
+            position[rev.github] = len(revs)
+            revs.append(rev)
+            penalties.append([_load_penalty(rev, n_weighted, k) for k in range(slots)])
+    # Group all PRs with any candidate reviewer into classes, by their candidates and the cost
+    # (i.e., the negated value) of each assignment.
+    classes: dict[Tuple[Tuple[int, int], ...], List[int]] = dict()
+    for number in prs_to_assign:
+        candidates = tuple(
+            (position[rev.github], -(ASSIGNMENT_VALUE + MATCH_VALUE * score))
+            for (rev, score) in _assignment_candidates(reviewers, info[number]) if rev.github in position
+        )
+        if candidates:
+            classes.setdefault(candidates, []).append(number)
+        else:
+            print(f"warning: no suitable reviewer was found for PR {number}")
+    edges = list(classes.keys())
+    costs = [dict(candidates) for candidates in edges]
+    (n_classes, n_revs) = (len(edges), len(revs))
+    sink = n_classes + n_revs
+    # The number of unassigned PRs in each class; the number of PRs of each class assigned to each reviewer.
+    unassigned = [len(numbers) for numbers in classes.values()]
+    flow: List[dict[int, int]] = [dict() for _ in revs]
+    used = [0] * n_revs
+    # Node potentials (classes, then reviewers, then the sink), making all reduced edge costs non-negative.
+    potential = [0] * (n_classes + n_revs + 1)
+    for candidates in edges:
+        for (j, cost) in candidates:
+            potential[n_classes + j] = min(potential[n_classes + j], cost)
+    potential[sink] = min([potential[n_classes + j] + penalties[j][0] for j in range(n_revs)], default=0)
+
+    # The residual edges leaving the node |u|, with their cost: PRs of a class can be assigned to any candidate,
+    # a reviewer can give up a PR assigned to them, or take another PR (if they have a free slot).
+    def out_edges(u: int) -> List[Tuple[int, int]]:
+        if u < n_classes:
+            return [(n_classes + j, cost) for (j, cost) in edges[u]]
+        j = u - n_classes
+        out = [(c, -costs[c][j]) for c in flow[j]]
+        if used[j] < len(penalties[j]):
+            out.append((sink, penalties[j][used[j]]))
+        return out
+
+    # Find a path from |u| to the sink of edges with reduced cost 0 (i.e., on a shortest path), avoiding all nodes
+    # in |visited|, and apply it: the last reviewer takes one more PR, all other reviewers swap one PR for another.
+    def augment(u: int, visited: set[int]) -> bool:
+        visited.add(u)
+        for (v, cost) in out_edges(u):
+            if v in visited or cost + potential[u] - potential[v] != 0:
+                continue
+            if v == sink or augment(v, visited):
+                if u < n_classes:
+                    flow[v - n_classes][u] = flow[v - n_classes].get(u, 0) + 1
+                elif v < n_classes:
+                    flow[u - n_classes][v] -= 1
+                    if flow[u - n_classes][v] == 0:
+                        del flow[u - n_classes][v]
+                else:
+                    used[u - n_classes] += 1
+                return True
+        return False
+
+    while True:
+        # Compute the shortest paths from all classes with unassigned PRs.
+        dist = [math.inf] * (n_classes + n_revs + 1)
+        heap = []
+        for c in range(n_classes):
+            if unassigned[c] > 0:
+                dist[c] = -potential[c]
+                heap.append((dist[c], c))
+        heapq.heapify(heap)
+        done = [False] * (n_classes + n_revs + 1)
+        while heap:
+            (d, u) = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            if u == sink:
+                break
+            for (v, cost) in out_edges(u):
+                new = d + cost + potential[u] - potential[v]
+                if new < dist[v]:
+                    dist[v] = new
+                    heapq.heappush(heap, (new, v))
+        if not done[sink] or dist[sink] + potential[sink] >= 0:
+            # No further assignment increases the objective.
+            break
+        for v in range(n_classes + n_revs + 1):
+            potential[v] += min(dist[v], dist[sink])
+        # Apply as many shortest paths as possible: these all have the same cost.
+        # (Nodes visited by a failed search cannot reach the sink, until the next path is applied.)
+        unreachable: set[int] = set()
+        for c in range(n_classes):
+            while unassigned[c] > 0 and potential[c] == 0 and c not in unreachable:
+                visited = set(unreachable)
+                if not augment(c, visited):
+                    unreachable = visited
+                    break
+                unassigned[c] -= 1
+                unreachable = set()
+
+    # Distribute the PRs of each class among the reviewers assigned to them.
+    suggestions = {}
+    for (c, numbers) in enumerate(classes.values()):
+        remaining = list(numbers)
+        for j in range(n_revs):
+            for _ in range(flow[j].get(c, 0)):
+                suggestions[remaining.pop(0)] = revs[j].github
+    return dict(sorted(suggestions.items()))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the backfill orchestrator in `backfill.py`, against a local stub server (see `stub_github.py`).
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from os import path
+
+from backfill import Checkpoint, parse_range, run_backfill
+from check_data_integrity import _has_valid_entries
+from data_manifest import DataManifest
+from downloader import GraphQLClient
+from packed_data import PackedData, list_pr_dirs
+from rate_limit import RateLimitLedger
+from stub_github import StubGitHub, StubResponse, load_recorded_responses
+
+RECORDED = load_recorded_responses(path.join("test", "recorded"))
+GRAPHQL_FILES = ["pr_info.graphql", "pr_reactions.graphql", "basic_pr_info.graphql"]
+NUMBERS = list(range(100, 112))
+
+
+def responses(numbers: list[int]) -> dict:
+    return {(query, n): RECORDED[(query, 16668)] for n in numbers for query in ["pr_info", "pr_reactions"]}
+
+
+# Run (or continue) the backfill with checkpoint file `checkpoint.json` in the directory |tmp| against |stub|.
+# Return the result of |run_backfill| and the checkpoint afterwards.
+def run(stub: StubGitHub, tmp: str, ledger: RateLimitLedger, budget: float | None = None, wait: bool = True) -> tuple[bool, Checkpoint]:
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        checkpoint = Checkpoint.load("checkpoint.json") or Checkpoint([(100, 105), (106, 111)])
+        (packed, manifest) = (PackedData(), DataManifest.load())
+        data_dirs = set(list_pr_dirs(packed))
+        client = GraphQLClient(stub.url, None, max_connections=2, backoff=0.01, ledger=ledger)
+        finished = asyncio.run(run_backfill(
+            client, ledger, checkpoint, "checkpoint.json", lambda n: _has_valid_entries(data_dirs, packed, manifest, n),
+            [], 2, "none", None, 4, budget, wait,
+        ))
+        client.close()
+        return (finished, Checkpoint.load("checkpoint.json"))
+    finally:
+        os.chdir(cwd)
+
+
+def test_parse_range() -> None:
+    assert (parse_range("12"), parse_range("10-20"), parse_range("20-10"), parse_range("x-1")) == ((12, 12), (10, 20), None, None)
+
+
+def test_resumable_backfill() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        for file in GRAPHQL_FILES:
+            shutil.copy(file, tmp)
+        os.mkdir(path.join(tmp, "data"))
+        ledger = RateLimitLedger()
+        # Each PR costs two points: with a budget of eight points, the backfill stops after the first chunk.
+        with StubGitHub(responses(NUMBERS), rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, ledger, budget=8)
+        assert not finished
+        assert (checkpoint.position, checkpoint.downloaded, checkpoint.failed) == (4, 4, [])
+        # Resuming continues with the next PR. Downloading PR 105 fails.
+        with StubGitHub(responses([n for n in NUMBERS if n != 105]), rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, ledger)
+        assert finished
+        assert sorted({n for (_query, n) in stub.requests}) == NUMBERS[4:]
+        assert (checkpoint.position, checkpoint.downloaded, checkpoint.failed) == (12, 11, [105])
+        # Failed PRs are retried when resuming.
+        with StubGitHub(responses(NUMBERS), rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, ledger)
+        assert finished
+        assert {n for (_query, n) in stub.requests} == {105}
+        assert (checkpoint.downloaded, checkpoint.failed) == (12, [])
+        assert sorted(os.listdir(path.join(tmp, "data"))) == [str(n) for n in NUMBERS]
+
+        # A new backfill of the same PRs skips all of them.
+        os.remove(path.join(tmp, "checkpoint.json"))
+        with StubGitHub(responses(NUMBERS), rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, RateLimitLedger())
+        assert finished and stub.requests == []
+        assert (checkpoint.downloaded, checkpoint.skipped) == (0, 12)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_backfill_respects_rate_limit() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        for file in GRAPHQL_FILES:
+            shutil.copy(file, tmp)
+        os.mkdir(path.join(tmp, "data"))
+        # After the first chunk, only 108 points remain: less than the budget reserved for `gather_stats.sh`.
+        ledger = RateLimitLedger()
+        with StubGitHub(responses(NUMBERS), rate_limit=116) as stub:
+            (finished, checkpoint) = run(stub, tmp, ledger, wait=False)
+        assert not finished
+        assert ledger.remaining == 108
+        assert (checkpoint.position, checkpoint.downloaded) == (4, 4)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_missing_prs_are_not_retried() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        for file in GRAPHQL_FILES:
+            shutil.copy(file, tmp)
+        os.mkdir(path.join(tmp, "data"))
+        # Number 103 belongs to an issue; downloading PR 105 fails.
+        stub_responses = responses([n for n in NUMBERS if n != 105])
+        stub_responses[("pr_info", 103)] = [StubResponse(200, {"data": {"repository": {"pullRequest": None}}, "errors": [
+            {"type": "NOT_FOUND", "path": ["repository", "pullRequest"], "message": "Could not resolve to a PullRequest"}
+        ]})]
+        with StubGitHub(stub_responses, rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, RateLimitLedger())
+        assert finished
+        assert (checkpoint.downloaded, checkpoint.failed, checkpoint.not_found) == (10, [105], [103])
+        # Only the transient failure is retried when resuming.
+        with StubGitHub(responses(NUMBERS), rate_limit=1000) as stub:
+            (finished, checkpoint) = run(stub, tmp, RateLimitLedger())
+        assert finished and {n for (_query, n) in stub.requests} == {105}
+        assert (checkpoint.downloaded, checkpoint.failed, checkpoint.not_found) == (11, [], [103])
+        assert "103" not in os.listdir(path.join(tmp, "data"))
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the validation of the data directory and for the comparison with github's data in `check_data_integrity.py`.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from os import path
+
+import pytest
+
+from check_data_integrity import (
+    IntegrityModel, RESTData, _parse_rest_data, check_data_directory_contents, check_model, remove_broken_data, update_redownload_file,
+)
+from ci_status import CIStatus
+from compute_dashboard_prs import PLACEHOLDER_AGGREGATE_INFO, infer_pr_url
+from data_manifest import DataManifest
+from download_queue import MAX_FAILURES, DownloadQueue
+from download_state import DownloadState
+from packed_data import PackedData
+from util import parse_json_data, pr_fingerprint
+
+
+def write(file: str, content: str) -> None:
+    with open(file, "w") as fi:
+        fi.write(content)
+
+
+# Create a data directory with 40 PRs in the current directory, some of which are broken.
+def make_data_directory() -> None:
+    for number in range(100, 140):
+        dir = path.join("data", str(number) if number % 10 else f"{number}-basic")
+        os.makedirs(dir)
+        for name in ["pr_info.json", "pr_reactions.json"] if number % 10 else ["basic_pr_info.json"]:
+            write(path.join(dir, name), '{"data": {}}' if number % 7 else "{broken")
+        if number % 13:
+            write(path.join(dir, "timestamp.txt"), "2025-01-01T00:00:00Z\n")
+    os.makedirs(path.join("data", "141-temp"))
+
+
+def test_parallel_validation(capsys) -> None:
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        make_data_directory()
+        packed = PackedData()
+        results = []
+        for jobs in [1, 3]:
+            results.append((check_data_directory_contents(packed, DataManifest(dict()), jobs), capsys.readouterr().err))
+        assert results[0] == results[1]
+        ((normal, stubborn), output) = results[0]
+        assert sorted(normal) == [(n, False) for n in [104, 105, 112, 117, 119, 126, 133]] + [(141, True)]
+        assert stubborn == [130]
+        assert output.index("PR 104") < output.index("PR 105") < output.index("PR 141")
+        # With a manifest, valid directories are not validated again.
+        manifest = DataManifest(dict())
+        check_data_directory_contents(packed, manifest, 1)
+        assert check_data_directory_contents(packed, manifest, 1) == results[0][0]
+        assert sum(entry["valid"] for entry in manifest.entries.values()) == 32
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def test_check_model(capsys) -> None:
+    now = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+    def rest(number: int, updated: datetime) -> RESTData:
+        return RESTData(number, infer_pr_url(number), "unknown", "unknown title", "OPEN", updated.isoformat(), [])
+
+    def aggregate(updated: datetime, ci: CIStatus = CIStatus.Pass, state: str = "open"):
+        return PLACEHOLDER_AGGREGATE_INFO._replace(last_updated=updated, CI_status=ci, state=state)
+
+    recent = now - timedelta(minutes=5)
+    model = IntegrityModel(
+        {
+            1: rest(1, recent),
+            2: rest(2, recent),
+            3: rest(3, now - timedelta(minutes=2)),
+            4: rest(4, now - timedelta(minutes=5)),
+            5: rest(5, now - timedelta(hours=2)),
+            6: rest(6, now - timedelta(minutes=10)),
+        },
+        {
+            # 1 is up to date, 2 is missing.
+            1: aggregate(recent),
+            # Outdated, and with a different title and author: all differences are reported.
+            3: aggregate(now - timedelta(hours=1))._replace(title="old title", author="someone"),
+            # CI running, but recently updated: this is fine.
+            4: aggregate(now - timedelta(minutes=5), CIStatus.Running),
+            # CI running for more than an hour.
+            5: aggregate(now - timedelta(hours=2), CIStatus.Running),
+            6: aggregate(now - timedelta(minutes=10), CIStatus.Missing),
+            # Closed on github.
+            7: aggregate(now - timedelta(days=1)),
+            8: aggregate(now - timedelta(days=1), state="closed"),
+        },
+    )
+    report = check_model(model, now)
+    kinds = [(f.number, f.kind) for f in report.findings]
+    assert kinds == [(2, "missing"), (3, "outdated")] + [(3, "field_mismatch")] * 3 + [
+        (5, "ci_running"), (6, "ci_missing"), (7, "wrongly_open")
+    ]
+    assert [f.message.split(":")[0] for f in report.findings[2:5]] == [
+        "mismatched data field 'author' for PR 3", "mismatched data field 'title' for PR 3", "mismatched data field 'updatedAt' for PR 3"
+    ]
+    assert report.missing_prs() == [2]
+    assert report.outdated_prs() == [2, 3, 5, 6, 7]
+    # With many outdated PRs, PRs with merely missing CI data are not re-downloaded.
+    for number in range(10, 20):
+        report.add(number, "outdated", "")
+    assert 6 not in report.outdated_prs()
+    assert report.to_json("now")["counts"]["outdated"] == 11
+    assert "Compared information about 5 PRs (0 with fingerprints), found 1 PRs with different data" in capsys.readouterr().out
+
+
+def test_fingerprint_comparison(capsys) -> None:
+    updated = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+    def search_result(number: int, ci_state: str) -> dict:
+        return {
+            "number": number, "url": infer_pr_url(number), "author": {"login": "unknown", "url": "https://github.com/unknown"},
+            "title": "unknown title", "state": "OPEN", "updatedAt": "2025-06-01T12:00:00Z", "headRefOid": "abc123",
+            "statusCheckRollup": {"state": ci_state}, "labels": {"nodes": []},
+        }
+
+    # The fingerprint which `process.py` stores for a PR with successful CI.
+    fingerprint = pr_fingerprint("unknown", "unknown title", "open", 1748779200, [], "SUCCESS", "abc123")
+    aggregate = PLACEHOLDER_AGGREGATE_INFO._replace(last_updated=updated, CI_status=CIStatus.Running, fingerprint=fingerprint)
+    model = IntegrityModel(
+        # CI finished for PR 1 (without changing its last update time), but is still running for PR 2.
+        {1: _parse_rest_data(search_result(1, "SUCCESS")), 2: _parse_rest_data(search_result(2, "PENDING"))},
+        {1: aggregate, 2: aggregate},
+    )
+    assert model.rest[1].fingerprint == fingerprint
+    report = check_model(model, updated)
+    assert [(f.number, f.kind) for f in report.findings] == [(2, "field_mismatch")]
+    assert "mismatched fingerprint for PR 2" in report.findings[0].message
+    assert "Compared information about 2 PRs (2 with fingerprints), found 1 PRs" in capsys.readouterr().out
+
+
+def test_head_and_ci_changes(capsys) -> None:
+    now = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    long_ago = now - timedelta(hours=3)
+
+    def rest(number: int, updated: datetime, head_oid: str | None, ci_state: str | None) -> RESTData:
+        return RESTData(number, infer_pr_url(number), "unknown", "unknown title", "OPEN", updated.isoformat(), [], None, head_oid, ci_state)
+
+    running = PLACEHOLDER_AGGREGATE_INFO._replace(
+        last_updated=long_ago, CI_status=CIStatus.Running, head_oid="abc", CI_rollup_state="PENDING"
+    )
+    model = IntegrityModel(
+        {
+            # CI is still running: that it was started long ago is no reason to re-download.
+            1: rest(1, long_ago, "abc", "PENDING"),
+            # A force-push, within the allowed delay.
+            2: rest(2, long_ago + timedelta(minutes=5), "def", "PENDING"),
+            # CI finished, without changing the last update time.
+            3: rest(3, long_ago, "abc", "FAILURE"),
+            # The search results do not contain the head commit: fall back to the heuristic.
+            4: rest(4, long_ago, None, None),
+        },
+        {1: running, 2: running, 3: running, 4: running},
+    )
+    report = check_model(model, now)
+    assert [(f.number, f.kind) for f in report.findings] == [(2, "head_changed"), (3, "ci_changed"), (4, "ci_running")]
+    assert "changed from abc to def" in report.findings[0].message
+    assert report.outdated_prs() == [2, 3, 4]
+
+
+def test_broken_compressed_files(capsys) -> None:
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        # PR 100 has a truncated gzip file, PR 101 a corrupt zstandard file, PR 102 is fine.
+        content = gzip.compress(b'{"data": {}}')
+        for (number, files) in [
+            (100, {"pr_info.json.gz": content[:-4], "pr_reactions.json.gz": content}),
+            (101, {"pr_info.json.zst": b"not zstandard", "pr_reactions.json.gz": content}),
+            (102, {"pr_info.json.gz": content, "pr_reactions.json.gz": content}),
+        ]:
+            os.makedirs(path.join("data", str(number)))
+            for (name, data) in files.items():
+                with open(path.join("data", str(number), name), "wb") as fi:
+                    fi.write(data)
+            write(path.join("data", str(number), "timestamp.txt"), "2025-01-01T00:00:00Z\n")
+        (normal, stubborn) = check_data_directory_contents(PackedData(), DataManifest(dict()), 1)
+        assert (sorted(normal), stubborn) == ([(100, False), (101, False)], [])
+        assert "is broken" in capsys.readouterr().err
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def test_zstd_frames_without_content_size() -> None:
+    pytest.importorskip("zstandard")
+    # This file was written by the `zstd` command line tool reading from a pipe: its frame does not record the decompressed size.
+    with open(path.join("test", "compressed", "pr_info.json.zst"), "rb") as fi:
+        content = fi.read()
+    assert parse_json_data("pr_info.json.zst", content, "1") == {"data": {"repository": {"pullRequest": {"number": 1}}}}
+    assert "is broken" in parse_json_data("pr_info.json.zst", content[:-4], "1")
+
+
+def test_update_redownload_file() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        file = path.join(tmp, "redownload.txt")
+        queue = DownloadQueue(dict())
+        for number in [1, 2, 3]:
+            queue.add(number, True, 1000 * number)
+        # PR 2 was chosen by an earlier run, PR 7 was added by hand.
+        write(file, "-- re-download after the label fix\n7\n2\n")
+        update_redownload_file(queue, {}, 2, 5000.0, file)
+        with open(file, "r") as fi:
+            assert fi.read() == "-- re-download after the label fix\n7\n1\n2\n"
+        # Downloading PR 1 failed: it is backing off, so PR 3 takes its place.
+        queue.record_failure(1, 1, 5000.0)
+        update_redownload_file(queue, {1: 1}, 2, 5000.0, file)
+        with open(file, "r") as fi:
+            assert fi.read() == "-- re-download after the label fix\n7\n2\n3\n"
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_stubborn_promotion(capsys) -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        write(path.join(tmp, "missing_prs.txt"), "5\n")
+        (queue, state) = (DownloadQueue(dict()), DownloadState.open(tmp))
+        # The failed downloads are only counted by the download state; the queue backs off.
+        for failures in range(1, MAX_FAILURES):
+            remove_broken_data(5, True, True, queue, state, "download failed")
+            assert (state.failures(), queue.entries[5].not_before > 0) == ({5: failures}, True)
+        remove_broken_data(5, True, True, queue, state, "download failed")
+        assert (state.stubborn(), state.with_status("missing"), state.failures(), 5 in queue.entries) == ([5], [], {}, False)
+        assert "marking it as stubborn" in capsys.readouterr().out
+        state.close()
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the compact aggregate records in `compute_dashboard_prs.py`.
+"""
+
+from datetime import datetime, timezone
+
+from dateutil import relativedelta
+
+from classify_pr_state import PRStatus
+from compute_dashboard_prs import DataStatus, LastStatusChange, TotalQueueTime
+
+
+def test_value_equality() -> None:
+    time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    now = datetime(2025, 1, 4, tzinfo=timezone.utc)
+    # A stored |delta| and one computed relative to |now| are the same value.
+    stored = LastStatusChange(DataStatus.Valid, time, relativedelta.relativedelta(days=3), PRStatus.AwaitingReview)
+    computed = LastStatusChange(DataStatus.Valid, time, None, PRStatus.AwaitingReview, now)
+    assert stored == computed and hash(stored) == hash(computed)
+    assert stored != LastStatusChange(DataStatus.Incomplete, time, relativedelta.relativedelta(days=3), PRStatus.AwaitingReview)
+    assert TotalQueueTime(DataStatus.Valid, 60, "") == TotalQueueTime(DataStatus.Valid, 60, "")
+    assert len({TotalQueueTime(DataStatus.Valid, 60, ""), TotalQueueTime(DataStatus.Valid, 60, ""), TotalQueueTime(DataStatus.Valid, None, "")}) == 2
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the data manifest in `data_manifest.py`.
+"""
+
+import os
+import shutil
+import tempfile
+from os import path
+
+from data_manifest import DataManifest
+from packed_data import PackedData
+
+
+def write(file: str, content: str) -> None:
+    with open(file, "w") as fi:
+        fi.write(content)
+
+
+def test_manifest() -> None:
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        os.makedirs(path.join("data", "12"))
+        write(path.join("data", "12", "pr_info.json"), '{"data": 1}')
+        write(path.join("data", "12", "timestamp.txt"), "2025-01-01T00:00:00Z\n")
+        packed = PackedData()
+        manifest = DataManifest.load()
+        assert not manifest.is_known_valid(packed, "12")
+        manifest.record(packed, "12", True)
+        assert manifest.entries["12"]["timestamp"] == "2025-01-01T00:00:00Z"
+        manifest.save()
+        manifest = DataManifest.load()
+        assert manifest.is_known_valid(packed, "12")
+        # A file with a new modification time, but the same contents (e.g. after a fresh checkout) is still known.
+        os.utime(path.join("data", "12", "pr_info.json"), ns=(0, 0))
+        assert manifest.is_known_valid(packed, "12")
+        assert manifest.changed == {"12"}
+        # Changed contents (even of the same size) are detected.
+        write(path.join("data", "12", "pr_info.json"), '{"data": 2}')
+        assert not manifest.is_known_valid(packed, "12")
+        # So are new files.
+        manifest.record(packed, "12", True)
+        write(path.join("data", "12", "pr_reactions.json"), "{}")
+        assert not manifest.is_known_valid(packed, "12")
+        # Invalid directories are always validated again.
+        manifest.record(packed, "12", False)
+        assert not manifest.is_known_valid(packed, "12")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def test_concurrent_updates_are_merged() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        file = path.join(tmp, "data_manifest.json")
+        (first, second) = (DataManifest.load(file), DataManifest.load(file))
+        first.entries["1"] = {"valid": True}
+        first.changed.add("1")
+        first.save()
+        second.entries["2"] = {"valid": True}
+        second.changed.add("2")
+        second.save()
+        assert sorted(DataManifest.load(file).entries) == ["1", "2"]
+        second.save(removed=["1"])
+        assert sorted(DataManifest.load(file).entries) == ["2"]
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the change detection in `detect_changes.py`, against a list of PRs instead of github's REST API.
+"""
+
+from typing import Callable, List, Tuple
+
+from detect_changes import OVERLAP_SECONDS, PER_PAGE, Watermark, detect_changes
+from util import epoch_to_github_time, github_time_to_epoch
+
+START = github_time_to_epoch("2025-01-01T00:00:00Z")
+
+
+# A fake |fetch_page| for the PRs |prs|, given as a dictionary mapping PR numbers to update times (in seconds since the epoch).
+# Return the function, and the list of all pages fetched (to be filled in).
+def fake_pages(prs: dict[int, int]) -> Tuple[Callable[[int], List[Tuple[int, str]]], List[int]]:
+    ordered = sorted(prs.items(), key=lambda item: -item[1])
+    fetched: List[int] = []
+
+    def fetch_page(page: int) -> List[Tuple[int, str]]:
+        fetched.append(page)
+        return [(n, epoch_to_github_time(t)) for (n, t) in ordered[(page - 1) * PER_PAGE:page * PER_PAGE]]
+
+    return (fetch_page, fetched)
+
+
+def test_bursts_are_paged_through() -> None:
+    # 250 PRs updated within a minute, plus many older ones.
+    prs = {n: START - 10_000 - n for n in range(1000)}
+    prs.update({n: START + 60 + n % 60 for n in range(1000, 1250)})
+    (fetch_page, fetched) = fake_pages(prs)
+    (changed, watermark) = detect_changes(fetch_page, Watermark(START, dict()), 0)
+    assert changed == list(range(1000, 1250))
+    assert fetched == [1, 2, 3]
+    assert watermark.time == START + 119
+    # Without further updates, nothing changed.
+    (fetch_page, fetched) = fake_pages(prs)
+    assert detect_changes(fetch_page, watermark, 0)[0] == []
+
+
+def test_updates_near_the_watermark() -> None:
+    prs = {1: START - 2 * OVERLAP_SECONDS, 2: START - 10, 3: START}
+    (fetch_page, _fetched) = fake_pages(prs)
+    # Without a watermark, all PRs updated since the given time are listed.
+    (changed, watermark) = detect_changes(fetch_page, None, START - 60)
+    assert changed == [2, 3]
+    # A PR updated again at the same second as the watermark, and a PR whose update appeared late
+    # (with an update time before the watermark) are found; PR 3 is not listed again.
+    prs.update({2: START, 4: START - 5})
+    (fetch_page, _fetched) = fake_pages(prs)
+    (changed, watermark) = detect_changes(fetch_page, watermark, 0)
+    assert changed == [2, 4]
+    assert watermark.time == START
+    assert Watermark.from_json(watermark.to_json()).boundary == watermark.boundary
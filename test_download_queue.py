@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the download queue in `download_queue.py`.
+"""
+
+import shutil
+import tempfile
+from os import path
+
+from download_queue import BACKOFF_SECONDS, MAX_FAILURES, DownloadQueue
+
+NOW = 1_700_000_000
+HOUR = 3600
+
+
+def test_priority_order() -> None:
+    queue = DownloadQueue()
+    queue.add(1, is_open=False, outdated_since=NOW - 100 * HOUR)
+    queue.add(2, is_open=True, outdated_since=NOW - HOUR)
+    queue.add(3, is_open=True, outdated_since=NOW - 10 * HOUR)
+    queue.add(4, is_open=True, outdated_since=NOW - HOUR, ci_running_since=NOW - 5 * HOUR)
+    # Open PRs come first; among these, the data claiming that CI is running for hours is most likely wrong.
+    assert queue.next(10, NOW) == [4, 3, 2, 1]
+    assert queue.next(2, NOW) == [4, 3]
+    # Re-adding a PR keeps the earliest time it was known to be outdated.
+    queue.add(3, is_open=True, outdated_since=NOW)
+    assert queue.entries[3].outdated_since == NOW - 10 * HOUR
+
+
+def test_backoff_and_stubborn_promotion() -> None:
+    queue = DownloadQueue()
+    queue.add(1, is_open=True, outdated_since=NOW - 10 * HOUR)
+    queue.add(2, is_open=True, outdated_since=NOW - HOUR)
+    assert not queue.record_failure(1, 1, NOW)
+    # PR 1 is backing off now...
+    assert not queue.is_ready(1, NOW + 60)
+    assert queue.next(10, NOW + 60, {1: 1}) == [2]
+    # ... until the backoff is over; with a failure, its priority is lower.
+    assert queue.next(10, NOW + BACKOFF_SECONDS) == [1, 2]
+    assert queue.next(10, NOW + BACKOFF_SECONDS, {1: 1}) == [2, 1]
+    # The backoff doubles after each failure.
+    for failures in range(2, MAX_FAILURES):
+        assert not queue.record_failure(1, failures, NOW)
+        assert queue.entries[1].not_before == NOW + BACKOFF_SECONDS * 2 ** (failures - 1)
+    # After too many failures, the PR should be marked stubborn.
+    assert queue.record_failure(1, MAX_FAILURES, NOW)
+    assert 1 not in queue.entries
+    # PRs which are not queued (e.g. missing PRs) are added on their first failure.
+    assert not queue.record_failure(3, 1, NOW)
+    assert queue.entries[3].not_before == NOW + BACKOFF_SECONDS
+    assert queue.is_ready(4, NOW)
+
+
+def test_persistence_and_retain() -> None:
+    queue = DownloadQueue()
+    queue.add(1, is_open=True, outdated_since=NOW, ci_running_since=NOW - HOUR)
+    queue.add(2, is_open=False, outdated_since=NOW - HOUR)
+    queue.record_failure(2, 1, NOW)
+    tmp = tempfile.mkdtemp()
+    try:
+        queue.save(path.join(tmp, "queue.json"))
+        loaded = DownloadQueue.load(path.join(tmp, "queue.json"))
+        assert loaded.entries == queue.entries
+    finally:
+        shutil.rmtree(tmp)
+    queue.retain({2, 3})
+    assert list(queue.entries) == [2]
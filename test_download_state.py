@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the download bookkeeping in `download_state.py`.
+"""
+
+import shutil
+import tempfile
+from os import path
+
+from download_state import DownloadState
+
+
+def write(file: str, content: str) -> None:
+    with open(file, "w") as fi:
+        fi.write(content)
+
+
+def read(file: str) -> str:
+    with open(file, "r") as fi:
+        return fi.read()
+
+
+def test_state_and_export() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        write(path.join(tmp, "missing_prs.txt"), "-- a manual comment\n5\n-- second attempt for 5\n7\n")
+        write(path.join(tmp, "closed_prs_to_backfill.txt"), "9\n")
+        write(path.join(tmp, "stubborn_prs.txt"), "-- stubborn PRs\n3\n")
+        state = DownloadState.open(tmp, now=0)
+        assert (state.with_status("missing"), state.with_status("backfill"), state.stubborn()) == ([5, 7], [9], [3])
+        with state.transaction():
+            # Stubborn PRs and PRs which are already missing are not added again.
+            assert state.add("missing", [3, 11, 7], now=1) == [11]
+            state.mark_done([5], now=1)
+            assert [state.record_failure(9, "broken data", now=1) for _ in range(2)] == [1, 2]
+            assert state.record_failure(5, "download failed", now=1) == 1
+            assert state.failures() == {5: 1, 9: 2}
+            # Marking a PR as stubborn resets its failures, but keeps the last error.
+            state.mark_stubborn(9, now=1)
+        state.export()
+        state.close()
+        assert read(path.join(tmp, "missing_prs.txt")) == "-- a manual comment\n7\n11\n"
+        assert read(path.join(tmp, "closed_prs_to_backfill.txt")) == "\n"
+        assert read(path.join(tmp, "stubborn_prs.txt")) == "-- stubborn PRs\n3\n9\n"
+
+        # Re-opening the state only writes the rows changed by editing the files.
+        state = DownloadState.open(tmp, now=2)
+        assert state.connection.total_changes == 0
+        assert state.connection.execute("SELECT failures, last_error FROM prs WHERE number = 9").fetchone() == (0, "broken data")
+        assert state.failures() == {5: 1}
+        with state.transaction():
+            state.clear_failures([5], now=2)
+        assert state.failures() == {}
+        state.close()
+        write(path.join(tmp, "missing_prs.txt"), "-- a manual comment\n7\n11\n13\n")
+        state = DownloadState.open(tmp, now=3)
+        assert state.connection.total_changes == 1
+        assert state.with_status("missing") == [7, 11, 13]
+
+        # A failing transaction changes nothing.
+        try:
+            with state.transaction():
+                state.mark_done([7, 11, 13], now=4)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        assert state.with_status("missing") == [7, 11, 13]
+        state.close()
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+"""
+Tests for `downloader.py`, against a local stub server (see `stub_github.py`) serving the recorded responses in `test/recorded`.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import shutil
+import tempfile
+from os import path
+from typing import List
+
+from downloader import GraphQLClient, download_prs, is_not_found
+from graphql_batch import AdaptiveBatchSize
+from pagination import is_connection_complete, is_paginated
+from rate_limit import RateLimitLedger
+from stub_github import StubGitHub, StubResponse, load_recorded_responses
+
+RECORDED = load_recorded_responses(path.join("test", "recorded"))
+GRAPHQL_FILES = ["pr_info.graphql", "pr_reactions.graphql", "basic_pr_info.graphql"]
+
+
+# Run the downloader for |numbers| (with stubborn PRs |stubborn|) against |stub|, in a fresh temporary directory
+# (or in the directory |tmp|, if given). Return the temporary directory (the caller should delete it) and the list of failed downloads.
+# If |sizer| is given, PRs are downloaded in batches. If |ledger| is given, the cost of all queries is recorded there.
+# If |written| is given, the names of all directories written are added to it.
+def run_downloader(
+    stub: StubGitHub, numbers: List[int], stubborn: List[int] = [], jobs: int = 2, sizer: AdaptiveBatchSize | None = None,
+    tmp: str | None = None, ledger: RateLimitLedger | None = None, written: List[str] | None = None
+) -> tuple[str, List[int]]:
+    if tmp is None:
+        tmp = tempfile.mkdtemp()
+        for file in GRAPHQL_FILES:
+            shutil.copy(file, tmp)
+        os.mkdir(path.join(tmp, "data"))
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        client = GraphQLClient(stub.url, None, max_connections=jobs, backoff=0.01, ledger=ledger)
+        failed = asyncio.run(download_prs(client, numbers, stubborn, jobs, "none", sizer, written=written))
+        client.close()
+    finally:
+        os.chdir(cwd)
+    return (tmp, failed)
+
+
+def read_json(*parts: str) -> dict:
+    with open(path.join(*parts), "r") as fi:
+        return json.load(fi)
+
+
+def test_download_normal_and_stubborn() -> None:
+    with StubGitHub(RECORDED) as stub:
+        (tmp, failed) = run_downloader(stub, [16668, 15158], stubborn=[15158])
+    try:
+        assert failed == []
+        assert sorted(os.listdir(path.join(tmp, "data"))) == ["15158-basic", "16668"]
+        assert sorted(os.listdir(path.join(tmp, "data", "16668"))) == ["pr_info.json", "pr_reactions.json", "timestamp.txt"]
+        assert sorted(os.listdir(path.join(tmp, "data", "15158-basic"))) == ["basic_pr_info.json", "timestamp.txt"]
+        assert read_json(tmp, "data", "16668", "pr_info.json") == RECORDED[("pr_info", 16668)][0].body
+        assert read_json(tmp, "data", "16668", "pr_reactions.json") == RECORDED[("pr_reactions", 16668)][0].body
+        assert read_json(tmp, "data", "15158-basic", "basic_pr_info.json") == RECORDED[("basic_pr_info", 15158)][0].body
+        with open(path.join(tmp, "data", "16668", "timestamp.txt"), "r") as fi:
+            assert fi.read().endswith("Z\n")
+        assert sorted(stub.requests) == [("basic_pr_info", 15158), ("pr_info", 16668), ("pr_reactions", 16668)]
+    finally:
+        shutil.rmtree(tmp)
+
+
+# Only the directories actually written are reported, not other (stale) directories of the same PRs.
+def test_written_directories() -> None:
+    for sizer in [None, AdaptiveBatchSize(maximum=10)]:
+        tmp = tempfile.mkdtemp()
+        try:
+            for file in GRAPHQL_FILES:
+                shutil.copy(file, tmp)
+            for dirname in ["16668-basic", "15158"]:
+                os.makedirs(path.join(tmp, "data", dirname))
+            written: List[str] = []
+            with StubGitHub(RECORDED) as stub:
+                (_tmp, failed) = run_downloader(stub, [16668, 15158], stubborn=[15158], sizer=sizer, tmp=tmp, written=written)
+            assert failed == []
+            assert sorted(written) == ["15158-basic", "16668"]
+        finally:
+            shutil.rmtree(tmp)
+
+
+def test_transient_errors_are_retried() -> None:
+    responses = dict(RECORDED)
+    responses[("pr_info", 16668)] = [
+        StubResponse(502, "bad gateway"),
+        StubResponse(200, {"errors": [{"type": "RATE_LIMITED", "message": "slow down"}]}),
+        RECORDED[("pr_info", 16668)][0],
+    ]
+    with StubGitHub(responses) as stub:
+        (tmp, failed) = run_downloader(stub, [16668])
+    try:
+        assert failed == []
+        assert stub.requests.count(("pr_info", 16668)) == 3
+        assert read_json(tmp, "data", "16668", "pr_info.json") == RECORDED[("pr_info", 16668)][0].body
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_failed_download_leaves_no_data() -> None:
+    responses = dict(RECORDED)
+    responses[("pr_reactions", 16668)] = [StubResponse(200, {"errors": [{"type": "NOT_FOUND", "message": "no such PR"}]})]
+    with StubGitHub(responses) as stub:
+        (tmp, failed) = run_downloader(stub, [16668])
+    try:
+        assert failed == [16668]
+        # Permanent errors are not retried.
+        assert stub.requests.count(("pr_reactions", 16668)) == 1
+        # Neither the final nor the temporary directory exist.
+        assert os.listdir(path.join(tmp, "data")) == []
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_connections_are_reused() -> None:
+    numbers = list(range(100, 120))
+    responses = {(query, n): RECORDED[(query, 16668)] for n in numbers for query in ["pr_info", "pr_reactions"]}
+    with StubGitHub(responses) as stub:
+        (tmp, failed) = run_downloader(stub, numbers, jobs=3)
+    try:
+        assert failed == []
+        assert len(os.listdir(path.join(tmp, "data"))) == len(numbers)
+        assert len(stub.requests) == 2 * len(numbers)
+        assert stub.connections <= 3
+    finally:
+        shutil.rmtree(tmp)
+
+
+def list_files(tmp: str) -> dict[str, bytes]:
+    result = dict()
+    for (dirpath, _dirnames, filenames) in os.walk(path.join(tmp, "data")):
+        for name in filenames:
+            if name != "timestamp.txt":
+                with open(path.join(dirpath, name), "rb") as fi:
+                    result[path.relpath(path.join(dirpath, name), tmp)] = fi.read()
+    return result
+
+
+def test_batched_download_writes_the_same_files() -> None:
+    with StubGitHub(RECORDED) as stub:
+        (single, _failed) = run_downloader(stub, [16668, 15158], stubborn=[15158])
+    with StubGitHub(RECORDED) as stub:
+        (batched, failed) = run_downloader(stub, [16668, 15158], stubborn=[15158], jobs=1, sizer=AdaptiveBatchSize(initial=4))
+    try:
+        assert failed == []
+        assert stub.http_requests == 1
+        assert list_files(batched) == list_files(single)
+    finally:
+        shutil.rmtree(single)
+        shutil.rmtree(batched)
+
+
+def test_batch_with_failed_pr() -> None:
+    responses = dict(RECORDED)
+    responses[("pr_info", 100)] = [StubResponse(200, {"errors": [{"type": "NOT_FOUND", "message": "no such PR"}]})]
+    with StubGitHub(responses) as stub:
+        (tmp, failed) = run_downloader(stub, [16668, 100], jobs=1, sizer=AdaptiveBatchSize(initial=4))
+    try:
+        # Only the PR with an error fails; the other data in the batch is kept.
+        assert failed == [100]
+        assert os.listdir(path.join(tmp, "data")) == ["16668"]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_not_found_errors() -> None:
+    assert is_not_found([{"type": "NOT_FOUND", "path": ["repository", "pullRequest"], "message": "no such PR"}])
+    # Errors about the repository itself (e.g. without permission to read it) or without a path are not about the PR.
+    assert not is_not_found([{"type": "NOT_FOUND", "path": ["repository"], "message": "no such repository"}])
+    assert not is_not_found([{"type": "NOT_FOUND", "message": "no such PR"}])
+    assert not is_not_found([])
+
+
+def test_batches_are_split_on_time_outs() -> None:
+    numbers = list(range(100, 116))
+    responses = {(query, n): RECORDED[(query, 16668)] for n in numbers for query in ["pr_info", "pr_reactions"]}
+    sizer = AdaptiveBatchSize(initial=16, maximum=16)
+    # Batches of more than three PRs (i.e., six queries) time out.
+    with StubGitHub(responses, max_batch=6) as stub:
+        (tmp, failed) = run_downloader(stub, numbers, jobs=1, sizer=sizer)
+    try:
+        assert failed == []
+        assert len(os.listdir(path.join(tmp, "data"))) == len(numbers)
+        assert sizer.size <= 4
+        # Far fewer requests than downloading each PR separately.
+        assert stub.http_requests < 2 * len(numbers)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_adaptive_batch_size() -> None:
+    sizer = AdaptiveBatchSize(initial=4, maximum=6, target_seconds=1.0)
+    sizer.record_success(4, 0.1, 1000)
+    assert sizer.size == 5
+    # Partial batches do not grow the size.
+    sizer.record_success(2, 0.1, 1000)
+    assert sizer.size == 5
+    sizer.record_success(5, 0.1, 1000)
+    sizer.record_success(6, 0.1, 1000)
+    assert sizer.size == 6
+    sizer.record_success(6, 2.0, 1000)
+    assert sizer.size == 5
+    sizer.record_timeout()
+    assert sizer.size == 2
+    sizer.record_timeout()
+    sizer.record_timeout()
+    assert sizer.size == 1
+
+
+# A response to `pr_info.graphql` for a large PR, with |sizes| nodes in the given connections.
+def large_pr_info(sizes: dict[str, int]) -> dict:
+    body = copy.deepcopy(RECORDED[("pr_info", 16668)][0].body)
+    inner = body["data"]["repository"]["pullRequest"]
+    for (connection, size) in sizes.items():
+        nodes = inner[connection]["nodes"]
+        inner[connection]["nodes"] = [
+            dict(nodes[i % len(nodes)], position=i, **({"id": f"{nodes[i % len(nodes)]['id']}-{i}"} if "id" in nodes[0] else {}))
+            for i in range(size)
+        ]
+    return body
+
+
+def test_large_prs_are_paginated() -> None:
+    sizes = {"timelineItems": 430, "commits": 250, "comments": 100, "files": 101}
+    full = large_pr_info(sizes)
+    responses = dict(RECORDED)
+    responses[("pr_info", 16668)] = [StubResponse(200, full)]
+    for sizer in [None, AdaptiveBatchSize(initial=4)]:
+        with StubGitHub(responses, paginate=True) as stub:
+            (tmp, failed) = run_downloader(stub, [16668, 15158], stubborn=[15158], sizer=sizer)
+        try:
+            assert failed == []
+            inner = read_json(tmp, "data", "16668", "pr_info.json")["data"]["repository"]["pullRequest"]
+            for (connection, size) in sizes.items():
+                assert inner[connection]["nodes"] == full["data"]["repository"]["pullRequest"][connection]["nodes"]
+                assert not inner[connection]["pageInfo"]["hasNextPage"]
+            assert inner["reviews"]["pageInfo"] == {"hasNextPage": False, "endCursor": "1"}
+            # Follow-up pages only ask for the incomplete connections.
+            pages = sorted(query for (query, _n) in stub.requests if "." in query)
+            assert pages == ["pr_info.commits"] * 2 + ["pr_info.files"] + ["pr_info.timelineItems"] * 4
+        finally:
+            shutil.rmtree(tmp)
+
+
+def test_legacy_data_completeness() -> None:
+    inner = RECORDED[("pr_info", 16668)][0].body["data"]["repository"]["pullRequest"]
+    assert not is_paginated(inner)
+    assert is_connection_complete(inner, "timelineItems")
+    legacy = large_pr_info({"timelineItems": 250, "comments": 100})["data"]["repository"]["pullRequest"]
+    assert not is_connection_complete(legacy, "timelineItems")
+    assert not is_connection_complete(legacy, "comments")
+    legacy["comments"]["pageInfo"] = {"hasNextPage": False, "endCursor": "100"}
+    assert is_connection_complete(legacy, "comments")
+    assert is_paginated(legacy)
+
+
+# Add |count| timeline items of type |typename| and one comment to the response |body| to `pr_info.graphql`, and change its labels.
+# Also edit the last comment, and change the CI status of the last commit.
+def add_activity(body: dict, count: int, typename: str = "LabeledEvent") -> dict:
+    body = copy.deepcopy(body)
+    inner = body["data"]["repository"]["pullRequest"]
+    inner["timelineItems"]["nodes"].extend({"__typename": typename, "position": i} for i in range(count))
+    inner["comments"]["nodes"][-1]["body"] = "edited"
+    last = inner["commits"]["nodes"][-1]
+    inner["commits"]["nodes"][-1] = dict(last, commit=dict(last["commit"], statusCheckRollup=None))
+    inner["comments"]["nodes"].append(dict(inner["comments"]["nodes"][0], id="new comment"))
+    inner["labels"]["nodes"] = []
+    return body
+
+
+def test_incremental_update() -> None:
+    old = large_pr_info({"timelineItems": 430, "commits": 250, "comments": 120})
+    new = add_activity(old, 3)
+    for sizer in [None, AdaptiveBatchSize(initial=4)]:
+        with StubGitHub({**RECORDED, ("pr_info", 16668): [StubResponse(200, old)]}, paginate=True) as stub:
+            (tmp, failed) = run_downloader(stub, [16668], sizer=sizer)
+            full_bytes = stub.bytes_sent
+        with StubGitHub({**RECORDED, ("pr_info", 16668): [StubResponse(200, new)]}, paginate=True) as stub:
+            (tmp, failed) = run_downloader(stub, [16668], sizer=sizer, tmp=tmp)
+            incremental_bytes = stub.bytes_sent
+            update_requests = [query for (query, _n) in stub.requests if query.startswith("pr_info")]
+        with StubGitHub({**RECORDED, ("pr_info", 16668): [StubResponse(200, new)]}, paginate=True) as stub:
+            (fresh, _failed) = run_downloader(stub, [16668])
+        try:
+            assert failed == []
+            assert update_requests == ["pr_info_update"]
+            # The incrementally updated data equals a fresh download.
+            assert read_json(tmp, "data", "16668", "pr_info.json") == read_json(fresh, "data", "16668", "pr_info.json")
+            assert incremental_bytes * 5 < full_bytes
+        finally:
+            shutil.rmtree(tmp)
+            shutil.rmtree(fresh)
+
+
+def test_incremental_update_after_force_push() -> None:
+    old = large_pr_info({"timelineItems": 130})
+    new = add_activity(old, 1, "HeadRefForcePushedEvent")
+    with StubGitHub({**RECORDED, ("pr_info", 16668): [StubResponse(200, old)]}, paginate=True) as stub:
+        (tmp, _failed) = run_downloader(stub, [16668])
+    with StubGitHub({**RECORDED, ("pr_info", 16668): [StubResponse(200, new)]}, paginate=True) as stub:
+        (tmp, failed) = run_downloader(stub, [16668], tmp=tmp)
+    try:
+        assert failed == []
+        # The update is discarded, and the data is downloaded completely.
+        assert [query for (query, _n) in stub.requests if not query.startswith("pr_reactions")] == [
+            "pr_info_update", "pr_info", "pr_info.timelineItems"
+        ]
+        inner = read_json(tmp, "data", "16668", "pr_info.json")["data"]["repository"]["pullRequest"]
+        assert inner["timelineItems"]["nodes"] == new["data"]["repository"]["pullRequest"]["timelineItems"]["nodes"]
+    finally:
+        shutil.rmtree(tmp)
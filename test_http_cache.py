@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the HTTP cache in `http_cache.py`, against the REST endpoint of the stub server in `stub_github.py`.
+"""
+
+import shutil
+import tempfile
+from functools import partial
+
+from detect_changes import detect_changes, fetch_page
+from http_cache import HttpCache
+from stub_github import StubGitHub
+from util import epoch_to_github_time, github_time_to_epoch
+
+START = github_time_to_epoch("2025-01-01T00:00:00Z")
+
+
+def pulls(count: int, offset: int = 0) -> list[dict]:
+    return [{"number": n, "updated_at": epoch_to_github_time(START - n + offset), "title": "x" * 100} for n in range(count)]
+
+
+def test_conditional_requests() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        with StubGitHub({}, pulls=pulls(10)) as stub:
+            url = f"{stub.rest_url}/repos/leanprover-community/mathlib4/pulls?per_page=5&page=1"
+            cache = HttpCache(tmp)
+            first = cache.get(url)
+            assert cache.get(url) == first
+            assert (stub.rest_requests, stub.not_modified) == (2, 1)
+            assert (cache.requests, cache.not_modified, cache.bytes_saved) == (2, 1, len(first))
+            # A new cache instance (e.g. in the next run) uses the stored responses.
+            assert HttpCache(tmp).get(url) == first
+            assert stub.not_modified == 2
+            # Changed data is downloaded again.
+            stub.pulls = pulls(10, offset=60)
+            assert cache.get(url) != first
+            assert stub.not_modified == 2
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_polling_without_changes() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        with StubGitHub({}, pulls=pulls(250)) as stub:
+            cache = HttpCache(tmp)
+            fetch = partial(fetch_page, cache, stub.rest_url, None)
+            (changed, watermark) = detect_changes(fetch, None, START - 1000)
+            assert len(changed) == 250
+            sent = stub.bytes_sent
+            # If nothing changed, all pages are answered with 304.
+            assert detect_changes(fetch, watermark, 0)[0] == []
+            assert stub.not_modified == cache.not_modified == 2
+            assert stub.bytes_sent == sent
+    finally:
+        shutil.rmtree(tmp)
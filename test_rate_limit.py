@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the rate limit ledger and planner in `rate_limit.py`, including against the simulated rate limit of `stub_github.py`.
+"""
+
+import os
+import shutil
+import tempfile
+from os import path
+
+from graphql_batch import AdaptiveBatchSize
+from rate_limit import MIN_COST_PER_PR, RateLimitLedger, pop_rate_limit, with_rate_limit
+from stub_github import StubGitHub
+from util import epoch_to_github_time
+from test_downloader import RECORDED, read_json, run_downloader
+
+NOW = 1_700_000_000
+
+
+def test_plan_reserves_budget_for_gather_stats() -> None:
+    ledger = RateLimitLedger(remaining=400, limit=5000, reset_at=NOW + 600, cost_per_pr=2.0)
+    # 400 points, of which 200 are reserved for downloading 100 PRs in gather_stats.sh: that leaves room for 100 PRs.
+    planned = ledger.plan([("redownload", 70), ("missing", 50), ("closed", 50), ("stubborn", 5)], NOW)
+    assert planned == [("redownload", 70), ("missing", 20), ("closed", 10), ("stubborn", 0)]
+    # Once the rate limit has been reset, the whole budget is available again (but the per-run maxima apply).
+    planned = ledger.plan([("redownload", 70), ("missing", 50), ("closed", 50), ("stubborn", 5)], NOW + 601)
+    assert planned == [("redownload", 70), ("missing", 20), ("closed", 20), ("stubborn", 2)]
+    # If the budget is (almost) exhausted, nothing is planned.
+    ledger.remaining = 150
+    assert ledger.plan([("redownload", 3)], NOW) == [("redownload", 0)]
+
+
+def test_ledger_records_costs() -> None:
+    ledger = RateLimitLedger()
+    ledger.record({"cost": 1, "remaining": 4990, "resetAt": "2023-11-14T23:00:00Z", "limit": 5000}, "pr_info")
+    # Responses to concurrent queries can arrive out of order.
+    ledger.record({"cost": 3, "remaining": 4980, "resetAt": "2023-11-14T23:00:00Z", "limit": 5000}, "batch")
+    ledger.record({"cost": 1, "remaining": 4985, "resetAt": "2023-11-14T23:00:00Z", "limit": 5000}, "pr_info")
+    assert ledger.remaining == 4980
+    assert ledger.query_costs == {"pr_info": 1, "batch": 3}
+    assert ledger.run_cost == 5
+    ledger.record_run(5)
+    assert round(ledger.cost_per_pr, 2) == 1.0
+    # After a reset, the new remaining budget is used.
+    ledger.record({"cost": 1, "remaining": 4999, "resetAt": "2023-11-15T00:00:00Z", "limit": 5000}, "pr_info")
+    assert ledger.remaining == 4999
+    tmp = tempfile.mkdtemp()
+    try:
+        ledger.save(path.join(tmp, "ledger.json"))
+        loaded = RateLimitLedger.load(path.join(tmp, "ledger.json"))
+        assert (loaded.remaining, loaded.reset_at, loaded.query_costs) == (4999, ledger.reset_at, ledger.query_costs)
+    finally:
+        shutil.rmtree(tmp)
+
+
+# The estimated cost per PR stays positive, even when it is very small (or was saved as zero by an older version).
+def test_cost_per_pr_stays_positive() -> None:
+    ledger = RateLimitLedger(cost_per_pr=0.004)
+    ledger.run_cost = 1
+    ledger.record_run(1000)
+    assert ledger.cost_per_pr == MIN_COST_PER_PR
+    tmp = tempfile.mkdtemp()
+    try:
+        ledger.save(path.join(tmp, "ledger.json"))
+        assert read_json(tmp, "ledger.json")["cost_per_pr"] > 0
+        with open(path.join(tmp, "ledger.json"), "w") as fi:
+            fi.write('{"remaining": 10, "limit": 5000, "reset_at": "2023-11-14T23:00:00Z", "query_costs": {}, "cost_per_pr": 0.0}')
+        loaded = RateLimitLedger.load(path.join(tmp, "ledger.json"))
+        assert loaded.cost_per_pr == MIN_COST_PER_PR
+        assert loaded.plan([("redownload", 3)], NOW) == [("redownload", 3)]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_concurrent_saves_are_merged() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        file = path.join(tmp, "ledger.json")
+        RateLimitLedger(remaining=4000, reset_at=NOW + 600).save(file)
+        # Two workers load the ledger at startup, and save it when they finish.
+        (first, second) = (RateLimitLedger.load(file), RateLimitLedger.load(file))
+        first.record({"cost": 2, "remaining": 3500, "resetAt": epoch_to_github_time(NOW + 600), "limit": 5000}, "batch")
+        second.record({"cost": 1, "remaining": 3700, "resetAt": epoch_to_github_time(NOW + 600), "limit": 5000}, "pr_info")
+        first.save(file)
+        second.save(file)
+        merged = RateLimitLedger.load(file)
+        assert (merged.remaining, merged.query_costs) == (3500, {"batch": 2, "pr_info": 1})
+        # An observation from an older rate limit window does not overwrite a newer one.
+        old = RateLimitLedger(remaining=10, reset_at=NOW - 3000)
+        old.save(file)
+        assert (RateLimitLedger.load(file).remaining, RateLimitLedger.load(file).reset_at) == (3500, NOW + 600)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_rate_limit_field() -> None:
+    query = "query($owner: String!) {\n  repository(owner: $owner) {\n  }\n}\n"
+    assert with_rate_limit(query).startswith("query($owner: String!) {\n  rateLimit { cost remaining resetAt limit }\n  repository")
+    response = {"data": {"repository": {}, "rateLimit": {"cost": 1}}}
+    assert pop_rate_limit(response) == {"cost": 1}
+    assert response == {"data": {"repository": {}}}
+    assert pop_rate_limit({"errors": []}) is None
+
+
+def test_downloads_against_simulated_rate_limit() -> None:
+    numbers = list(range(100, 110))
+    responses = {(query, n): RECORDED[(query, 16668)] for n in numbers for query in ["pr_info", "pr_reactions"]}
+    ledger = RateLimitLedger()
+    with StubGitHub(responses, rate_limit=50) as stub:
+        (tmp, failed) = run_downloader(stub, numbers, jobs=1, sizer=AdaptiveBatchSize(initial=5, maximum=5), ledger=ledger)
+    try:
+        assert failed == []
+        # Two batches of five PRs, each costing ten points.
+        assert ledger.remaining == 30
+        assert ledger.query_costs == {"batch": 10}
+        ledger.record_run(len(numbers))
+        assert round(ledger.cost_per_pr, 2) == 1.3
+        # The rate limit information is not stored.
+        assert "rateLimit" not in read_json(tmp, "data", "100", "pr_info.json")["data"]
+    finally:
+        shutil.rmtree(tmp)
+    # Once the budget is exhausted, downloads fail.
+    with StubGitHub(responses, rate_limit=15) as stub:
+        (tmp, failed) = run_downloader(stub, numbers, jobs=1, sizer=AdaptiveBatchSize(initial=5, maximum=5), ledger=RateLimitLedger())
+    try:
+        assert failed == numbers[5:]
+        assert len(os.listdir(path.join(tmp, "data"))) == 5
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the reviewer suggestions in `suggest_reviewer.py`.
+"""
+
+from datetime import datetime, timezone
+
+from compute_dashboard_prs import PLACEHOLDER_AGGREGATE_INFO, AggregatePRInfo, Label
+from process import _compute_assignment_weight, compute_reviewer_load
+from suggest_reviewer import (
+    ReviewerIndex, ReviewerInfo, assignment_objective, collect_assignment_statistics, suggest_reviewers, suggest_reviewers_batch
+)
+
+
+def reviewer(github: str, top_level: list[str], conflicts: list[str] = [], capacity: int = 10) -> ReviewerInfo:
+    return ReviewerInfo(github, github, top_level, "", capacity, True, False, conflicts)
+
+
+def pr(author: str, labels: list[str]) -> AggregatePRInfo:
+    return PLACEHOLDER_AGGREGATE_INFO._replace(author=author, labels=[Label(lab, "ffffff", "") for lab in labels])
+
+
+REVIEWERS = ReviewerIndex([
+    reviewer("alice", ["t-algebra", "t-topology"]),
+    reviewer("bob", ["t-algebra"], conflicts=["erin"]),
+    reviewer("carol", ["t-topology", "CI"]),
+    reviewer("dave", ["t-analysis"]),
+])
+
+
+def test_reviewer_index() -> None:
+    assert (REVIEWERS.by_topic["t-algebra"], REVIEWERS.by_topic["t-topology"]) == ([0, 1], [0, 2])
+    assert REVIEWERS.excluded("erin") == {"erin", "bob"}
+    assert REVIEWERS.number_eligible({"erin", "bob"}) == 3
+    # The matching areas are listed in the order of the PR's labels; the matches are cached.
+    matches = REVIEWERS.matching(["t-topology", "t-algebra"])
+    assert [(rev.github, areas) for (rev, areas) in matches] == [
+        ("alice", ["t-topology", "t-algebra"]), ("bob", ["t-algebra"]), ("carol", ["t-topology"]),
+    ]
+    assert REVIEWERS.matching(["t-topology", "t-algebra"]) is matches
+
+
+def test_suggest_reviewers() -> None:
+    def suggest(author: str, labels: list[str]) -> list[str]:
+        return suggest_reviewers({"alice": ([1, 2], 10.0, 2)}, REVIEWERS, 1, pr(author, labels), {}).all_potential_reviewers
+
+    # Reviewers matching the most areas are preferred; busy reviewers come last.
+    assert suggest("frank", ["t-algebra", "t-topology"]) == ["alice"]
+    assert suggest("frank", ["t-algebra"]) == ["bob", "alice"]
+    # The author and reviewers with a conflict of interest are never suggested.
+    assert suggest("erin", ["t-algebra"]) == ["alice"]
+    assert suggest("carol", ["t-topology"]) == ["alice"]
+    assert suggest("frank", ["t-combinatorics"]) == []
+    result = suggest_reviewers({"alice": ([1, 2], 10.0, 2)}, REVIEWERS, 1, pr("erin", ["t-algebra"]), {})
+    # Alice is at full capacity.
+    assert (result.all_available_reviewers, result.suggested) == ([], None)
+
+
+def test_batch_assignment() -> None:
+    reviewers = ReviewerIndex([
+        reviewer("alice", ["t-algebra", "t-topology"], capacity=2),
+        reviewer("bob", ["t-algebra"], capacity=2),
+        reviewer("carol", ["t-analysis"], conflicts=["erin"], capacity=3),
+    ])
+    # Alice and Bob each have room for one more PR; Carol for three.
+    existing = {"alice": ([1], 1.0, 1), "bob": ([2], 1.0, 1)}
+    info = {10: pr("frank", ["t-algebra"]), 11: pr("frank", ["t-topology"]), 12: pr("erin", ["t-analysis"]), 13: pr("frank", [])}
+    assignment = suggest_reviewers_batch(existing, reviewers, [10, 11, 12, 13], info)
+    # Only Alice can review PR 11, so PR 10 goes to Bob. Nobody can review PR 12.
+    assert assignment == {10: "bob", 11: "alice", 13: "carol"}
+    assert assignment_objective(existing, reviewers, assignment, info) == 3 * 100 + 2 * 10 - (10 + 10 + 3)
+    assert assignment_objective(existing, reviewers, {10: "alice", 13: "carol"}, info) == 2 * 100 + 10 - (10 + 3)
+
+
+def test_reviewer_load() -> None:
+    now = datetime(2025, 3, 11, tzinfo=timezone.utc)
+    def aggregate(number: int, author: str, labels: list[str], ci: str = "pass", last_change: int | None = None) -> dict:
+        data = {
+            "number": number, "author": author, "state": "open", "label_names": labels, "CI_status": ci,
+            "is_draft": False, "head_repo": {"login": "leanprover-community"}, "assignees": ["alice"],
+        }
+        if last_change is not None:
+            data["last_status_change"] = {"status": "valid", "time": last_change, "current_status": "AwaitingAuthor"}
+        return data
+
+    all_pr_data = [
+        aggregate(1, "frank", []),
+        # Awaiting author for four days.
+        aggregate(2, "frank", ["awaiting-author"], last_change=int(datetime(2025, 3, 7, tzinfo=timezone.utc).timestamp())),
+        # Awaiting author, but the time of the last status change is unknown.
+        aggregate(3, "frank", ["awaiting-author"]),
+        aggregate(4, "frank", [], ci="fail"),
+        # Self-assigned PRs do not count.
+        aggregate(5, "alice", []),
+    ]
+    for data in all_pr_data:
+        data["assignment_weight"] = _compute_assignment_weight(data, now)
+    assert [data["assignment_weight"]["value"] for data in all_pr_data] == [1.0, 0.2, 0.1, 0.0, 1.0]
+    assert all_pr_data[1]["assignment_weight"]["status"] == "AwaitingAuthor"
+    assignments = {"alice": [{"number": n, "state": "open"} for n in range(1, 6)] + [{"number": 6, "state": "closed"}]}
+    reviewer_load = compute_reviewer_load("2025-03-11T00:00:00Z", assignments, all_pr_data)
+    load = reviewer_load["reviewers"]["alice"]
+    assert (load["open_assigned"], round(load["weighted"], 6), load["number_all_assigned"]) == ([1, 2, 3, 4, 5], 1.3, 6)
+
+    assignment_data = {"timestamp": "2025-03-11T00:00:00Z", "number_open_prs": 7, "number_open_assigned": 5}
+    stats = collect_assignment_statistics(assignment_data, reviewer_load)
+    assert (stats.num_open, stats.assigned_open, stats.number_multiple_assignees) == (7, [1, 2, 3, 4, 5], 0)
+    assert stats.assignments["alice"][0] == [1, 2, 3, 4, 5]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the webhook service in `webhook_service.py`, using the recorded deliveries in `test/webhooks`.
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+from os import path
+from typing import List, Tuple
+
+from webhook_service import Debouncer, HeadCommits, WebhookService, affected_prs, replay, signature
+from work_queue import WorkItem, WorkQueue
+
+BURST = path.join("test", "webhooks", "burst.jsonl")
+
+
+def test_debouncer() -> None:
+    debouncer = Debouncer(debounce_seconds=10, max_delay_seconds=60)
+    debouncer.note(1, 0)
+    debouncer.note(2, 10)
+    debouncer.note(1, 8)
+    assert debouncer.due(12) == []
+    assert debouncer.due(18) == [1]
+    assert debouncer.due(30) == [2]
+    # A PR with a constant stream of events is enqueued after at most |max_delay_seconds|.
+    for now in range(100, 170, 5):
+        debouncer.note(3, now)
+        assert debouncer.due(now) == ([3] if now == 160 else [])
+
+
+def read_burst() -> List[Tuple[str, bytes]]:
+    with open(BURST, "r") as fi:
+        deliveries = [json.loads(line) for line in fi if line.strip()]
+    return [(delivery["event"], json.dumps(delivery["payload"]).encode()) for delivery in deliveries]
+
+
+def test_burst_is_coalesced() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        queue = WorkQueue(path.join(tmp, "work_queue.json"))
+        service = WebhookService(queue, "secret", Debouncer(debounce_seconds=10))
+        # One delivery per second.
+        burst = read_burst()
+        statuses = [service.handle(event, body, signature("secret", body), now) for (now, (event, body)) in enumerate(burst)]
+        # Deliveries without any PR (a push, a comment on an issue, another repository) are accepted, but ignored.
+        assert statuses == [202, 202, 202, 202, 204, 202, 204, 204, 202, 202]
+        # Deliveries with a wrong signature are rejected.
+        assert [service.handle(event, body, signature("wrong", body), 10) for (event, body) in burst] == [401] * len(burst)
+        # PR 101 has been quiet since its last event (at time 5); PRs 100 and 103 saw an event at time 9 or 8.
+        assert (service.flush(9), service.flush(15), queue.items()) == ([], [101], [WorkItem(101, "webhook", None, 0, 0)])
+        assert service.flush(19) == [100, 103]
+        # All events about one PR lead to a single download.
+        assert [(item.kind, item.number) for item in queue.items()] == [("webhook", 101), ("webhook", 100), ("webhook", 103)]
+        assert (service.deliveries, service.enqueued) == (10, 3)
+        # Another burst does not add the PRs queued already.
+        for (now, (event, body)) in enumerate(burst, start=20):
+            service.handle(event, body, signature("secret", body), now)
+        assert service.flush(100) == [100, 101, 103]
+        assert (len(queue.items()), service.enqueued) == (3, 3)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_fork_ci_events() -> None:
+    repository = {"full_name": "leanprover-community/mathlib4"}
+    heads = HeadCommits(max_size=2)
+    pull_request = {"repository": repository, "pull_request": {"number": 100, "head": {"sha": "abc"}}}
+    check_suite = {"repository": repository, "check_suite": {"head_sha": "abc", "pull_requests": []}}
+    # Github does not list the PR for CI events on forks: the head commit is unknown yet.
+    assert affected_prs("check_suite", check_suite, heads) == []
+    assert affected_prs("pull_request", pull_request, heads) == [100]
+    assert affected_prs("check_suite", check_suite, heads) == [100]
+    assert affected_prs("check_run", {"repository": repository, "check_run": check_suite["check_suite"]}, heads) == [100]
+    # Only the most recent head commits are remembered.
+    heads.note("def", 101)
+    heads.note("ghi", 102)
+    assert (heads.get("abc"), heads.get("def"), heads.get("ghi")) == (None, 101, 102)
+
+
+def test_failed_flush_is_retried() -> None:
+    class FlakyQueue(WorkQueue):
+        def add(self, kind: str, numbers: List[int]) -> int:
+            self.calls = getattr(self, "calls", 0) + 1
+            if self.calls == 1:
+                raise OSError("disk full")
+            return super().add(kind, numbers)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        service = WebhookService(FlakyQueue(path.join(tmp, "work_queue.json")), None, Debouncer(debounce_seconds=10))
+        body = json.dumps({"repository": {"full_name": "leanprover-community/mathlib4"}, "pull_request": {"number": 100}}).encode()
+        assert service.handle("pull_request", body, None, 0) == 202
+        try:
+            service.flush(10)
+            assert False, "the error should be raised"
+        except OSError:
+            pass
+        # The PR is pending again, and is enqueued once it has been quiet for long enough.
+        assert (service.flush(15), service.flush(20), service.enqueued) == ([], [100], 1)
+    finally:
+        shutil.rmtree(tmp)
+
+
+# A smoke test of the HTTP server: the flushing is tested above.
+def test_http_server() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        service = WebhookService(WorkQueue(path.join(tmp, "work_queue.json")), "secret")
+        server = service.server(0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            statuses = replay(f"http://127.0.0.1:{server.server_address[1]}/", BURST, "secret")
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert statuses == [202, 202, 202, 202, 204, 202, 204, 204, 202, 202]
+        assert (service.deliveries, sorted(service.debouncer.pending)) == (10, [100, 101, 103])
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_signature() -> None:
+    # The example from github's documentation on validating webhook deliveries.
+    expected = "sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17"
+    assert signature("It's a Secret to Everybody", b"Hello, World!") == expected
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the work queue in `work_queue.py`, and for several download workers draining it at once.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from os import path
+from typing import List
+
+from stub_github import StubGitHub
+from test_downloader import GRAPHQL_FILES, RECORDED
+from work_queue import MAX_ATTEMPTS, RETRY_SECONDS, WorkQueue
+
+NOW = 1_700_000_000
+
+
+def test_leases() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        queue = WorkQueue(path.join(tmp, "work_queue.json"))
+        assert queue.add("redownload", [1, 2, 3]) == 3
+        # PRs which are queued already are not added again.
+        assert queue.add("missing", [3, 4]) == 1
+        assert queue.claim("a", 2, NOW, lease_seconds=60) == [("redownload", 1), ("redownload", 2)]
+        assert queue.claim("b", 5, NOW, lease_seconds=60) == [("redownload", 3), ("missing", 4)]
+        assert queue.claim("c", 5, NOW + 30) == []
+        # Once a lease expires, another worker can claim the PR; the previous worker cannot complete it any more.
+        assert queue.claim("c", 1, NOW + 60, lease_seconds=60) == [("redownload", 1)]
+        assert queue.complete("a", [1, 2]) == [2]
+        assert queue.complete("c", [1]) == [1]
+        assert [item.number for item in queue.items()] == [3, 4]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_failed_downloads_are_retried() -> None:
+    tmp = tempfile.mkdtemp()
+    try:
+        queue = WorkQueue(path.join(tmp, "work_queue.json"))
+        queue.add("missing", [1])
+        now = NOW
+        for attempt in range(1, MAX_ATTEMPTS):
+            assert queue.claim("a", 1, now) == [("missing", 1)]
+            assert queue.fail("a", [1], now) == []
+            # The PR is released, but can only be claimed again after a while.
+            assert queue.claim("a", 1, now + 1) == []
+            now += RETRY_SECONDS
+        assert queue.claim("a", 1, now) == [("missing", 1)]
+        assert queue.fail("a", [1], now) == [1]
+        assert queue.items() == []
+    finally:
+        shutil.rmtree(tmp)
+
+
+# Drain a work queue with |numbers| using |workers| download processes against |stub|. Return the time this took.
+def run_workers(stub: StubGitHub, numbers: List[int], workers: int) -> float:
+    tmp = tempfile.mkdtemp()
+    try:
+        for file in GRAPHQL_FILES:
+            shutil.copy(file, tmp)
+        os.mkdir(path.join(tmp, "data"))
+        open(path.join(tmp, "stubborn_prs.txt"), "w").close()
+        WorkQueue(path.join(tmp, "work_queue.json")).add("missing", numbers)
+        env = dict(os.environ, GITHUB_GRAPHQL_URL=stub.url, GH_TOKEN="token")
+        script = path.join(os.getcwd(), "downloader.py")
+        args = ["--jobs", "1", "--max-batch-size", "1", "--claim", "1"]
+        start = time.monotonic()
+        processes = [
+            subprocess.Popen([sys.executable, script, *args, "--worker", f"worker-{i}"], cwd=tmp, env=env, stdout=subprocess.DEVNULL)
+            for i in range(workers)
+        ]
+        assert [process.wait() for process in processes] == [0] * workers
+        duration = time.monotonic() - start
+        assert sorted(os.listdir(path.join(tmp, "data"))) == sorted(str(n) for n in numbers)
+        assert WorkQueue(path.join(tmp, "work_queue.json")).items() == []
+        return duration
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_workers_scale() -> None:
+    numbers = list(range(100, 124))
+    responses = {(query, n): RECORDED[(query, 16668)] for n in numbers for query in ["pr_info", "pr_reactions"]}
+    with StubGitHub(responses, latency=0.1) as stub:
+        single = run_workers(stub, numbers, 1)
+        # Each PR is downloaded exactly once.
+        assert Counter(stub.requests) == Counter((query, n) for n in numbers for query in ["pr_info", "pr_reactions"])
+        stub.requests.clear()
+        parallel = run_workers(stub, numbers, 4)
+        assert Counter(stub.requests) == Counter((query, n) for n in numbers for query in ["pr_info", "pr_reactions"])
+    # Four workers are almost four times as fast (up to the start-up time of each process).
+    assert single / parallel > 2.5
@@ -3,31 +3,124 @@
 """
 This file contains various utility functions, which are needed in several otherwise unrelated scripts.
 Currently, this contains the following
-- a function to parse JSON files with PR info (with error handling),
+- a function to parse JSON files with PR info (with error handling), which transparently handles compressed files,
 - a helper for comparing lists of PR numbers (with detailed information about the differences)
 - a function to format a |relativedelta|
+- helpers for converting between the time representations of the aggregate data files
+- a function computing the fingerprint of a PR's key data
 """
 
+import calendar
+import gzip
+import hashlib
 import json
+import os
 import sys
-from typing import List
-from dateutil import relativedelta
-from datetime import timedelta
+import time
+import zlib
+from typing import List, Tuple
+from dateutil import parser, relativedelta
+from datetime import datetime, timedelta, timezone
+
+# Support for zstandard-compressed data files is optional.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 def eprint(val):
     print(val, file=sys.stderr)
 
 
-# Parse the JSON file 'name' for PR 'number'. Returned the parsed file if successful,
-# and an error message describing what went wrong otherwise.
-def parse_json_file(name: str, pr_number: str) -> dict | str:
-    data = None
-    with open(name, "r") as fi:
+# Each file in the `data` directory can be stored uncompressed (e.g. `pr_info.json`),
+# or compressed with gzip or zstandard (e.g. `pr_info.json.gz` or `pr_info.json.zst`).
+COMPRESSED_SUFFIXES = [".gz", ".zst"]
+
+
+# Return the name of a file without any compression suffix, e.g. "pr_info.json" for "pr_info.json.gz".
+def strip_compression_suffix(name: str) -> str:
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            return name.removesuffix(suffix)
+    return name
+
+
+# Find the file storing the data for 'name' (e.g., "data/123/pr_info.json"), which may be compressed.
+# If no such file exists, return 'name' unchanged (so opening it fails as usual).
+def find_data_file(name: str) -> str:
+    if os.path.exists(name):
+        return name
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(name + suffix):
+            return name + suffix
+    return name
+
+
+# Decompressing a data file failed: the file is truncated or corrupt,
+# or it is compressed in a format which cannot be read here (e.g., as the 'zstandard' module is not installed).
+class DecompressionError(Exception):
+    pass
+
+
+# Decompress the contents |content| of the data file 'name', if 'name' has a compression suffix.
+# Raise a |DecompressionError| if this fails.
+def decompress_data(name: str, content: bytes) -> bytes:
+    if name.endswith(".gz"):
+        try:
+            return gzip.decompress(content)
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            raise DecompressionError(f"cannot decompress {name}: {e}") from e
+    elif name.endswith(".zst"):
+        if zstandard is None:
+            raise DecompressionError(f"cannot read {name}: the 'zstandard' module is not installed")
+        # Unlike |ZstdDecompressor.decompress|, a decompression object also reads frames which do not record
+        # their decompressed size (such as the ones written by the `zstd` command line tool from a pipe).
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
         try:
-            data = json.load(fi)
-        except json.decoder.JSONDecodeError:
-            return f"error: the file {name} for PR {pr_number} is invalid JSON, ignoring"
+            result = decompressor.decompress(content)
+        except zstandard.ZstdError as e:
+            raise DecompressionError(f"cannot decompress {name}: {e}") from e
+        if not decompressor.eof:
+            raise DecompressionError(f"cannot decompress {name}: the file is truncated")
+        return result
+    return content
+
+
+# Read the contents of the (possibly compressed) file at 'name', decompressing them if necessary.
+# |name| is the actual file name, including any compression suffix.
+def read_data_file(name: str) -> bytes:
+    with open(name, "rb") as fi:
+        return decompress_data(name, fi.read())
+
+
+# Serialize the JSON data |data| for storing in the `data` directory, in the format |compression|:
+# "none" (pretty-printed, like `jq '.'`), "gz" or "zst" (compact and compressed).
+# Return the suffix to append to the file name (e.g. ".gz") and the file contents.
+def encode_json_data(data: dict, compression: str) -> Tuple[str, bytes]:
+    if compression == "none":
+        return ("", (json.dumps(data, indent=2, ensure_ascii=False) + "\n").encode())
+    compact = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+    if compression == "gz":
+        # Set the modification time to zero, so equal data yields byte-identical files.
+        return (".gz", gzip.compress(compact, compresslevel=9, mtime=0))
+    elif compression == "zst":
+        if zstandard is None:
+            raise RuntimeError("cannot compress with zstandard: the 'zstandard' module is not installed")
+        return (".zst", zstandard.ZstdCompressor(level=19).compress(compact))
+    raise ValueError(f"unknown compression format '{compression}': expected 'none', 'gz' or 'zst'")
+
+
+# Parse the contents |content| of the JSON file 'name' for PR 'number', decompressing them if necessary.
+# Return the parsed data if successful, and an error message describing what went wrong otherwise.
+def parse_json_data(name: str, content: bytes, pr_number: str) -> dict | str:
+    data = None
+    try:
+        data = json.loads(decompress_data(name, content))
+    except DecompressionError as e:
+        return f"error: the file {name} for PR {pr_number} is broken ({e}), ignoring"
+    except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+        return f"error: the file {name} for PR {pr_number} is invalid JSON, ignoring"
     if "errors" in data:
         return f"warning: the data for PR {pr_number} is incomplete, ignoring"
     elif "data" not in data:
@@ -35,6 +128,16 @@ def parse_json_file(name: str, pr_number: str) -> dict | str:
     return data
 
 
+# Parse the JSON file 'name' for PR 'number'. Returned the parsed file if successful,
+# and an error message describing what went wrong otherwise.
+# 'name' may be stored compressed: in that case, 'name' can omit the compression suffix.
+def parse_json_file(name: str, pr_number: str) -> dict | str:
+    name = find_data_file(name)
+    with open(name, "rb") as fi:
+        content = fi.read()
+    return parse_json_data(name, content, pr_number)
+
+
 # Compare two lists of PR numbers for equality, printing informative output if different.
 def my_assert_eq(msg: str, left: List[int], right: List[int]) -> bool:
     if left != right:
@@ -65,6 +168,66 @@ def format_delta(delta: relativedelta.relativedelta) -> str:
     else:
         return pluralize(delta.seconds, "second")
 
+# Version of the aggregate data format written by `process.py`.
+# - Version 1 (files without a "schema_version" field) stores all points in time as ISO 8601 strings,
+#   and durations as stringified |timedelta| and |relativedelta| values.
+# - Version 2 stores points in time as seconds since the epoch (in UTC) and durations as integer seconds.
+#   Human-readable |relativedelta|s are only computed when reading the file.
+# Readers should accept both versions, at least until all aggregate files have been regenerated.
+AGGREGATE_SCHEMA_VERSION = 2
+
+# The time format used by github, e.g. "2024-07-15T21:08:42Z".
+GITHUB_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+# Convert a timestamp as returned by github into seconds since the epoch.
+def github_time_to_epoch(value: str) -> int:
+    return calendar.timegm(time.strptime(value, GITHUB_TIME_FORMAT))
+
+
+# Inverse to github_time_to_epoch.
+def epoch_to_github_time(value: int) -> str:
+    return time.strftime(GITHUB_TIME_FORMAT, time.gmtime(value))
+
+
+# Convert a timezone-aware datetime into seconds since the epoch (ignoring microseconds).
+def datetime_to_epoch(value: datetime) -> int:
+    return calendar.timegm(value.utctimetuple())
+
+
+def epoch_to_datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+# The fingerprint of a PR's key data: its author, title, state (e.g. "open"), last update (in seconds since the epoch),
+# label names, the state of its status check rollup (e.g. "SUCCESS" or "PENDING", None if there is none)
+# and the SHA of its head commit. `process.py` stores this in the aggregate data file, and `check_data_integrity.py`
+# compares it with the fingerprint computed from github's search results: equal fingerprints mean equal data.
+def pr_fingerprint(
+    author: str, title: str, state: str, last_updated: int, label_names: List[str], ci_state: str | None, head_oid: str
+) -> str:
+    canonical = [author, title, state.lower(), last_updated, sorted(label_names), ci_state, head_oid]
+    return hashlib.sha256(json.dumps(canonical, separators=(",", ":")).encode()).hexdigest()[:16]
+
+
+# Parse a point in time from an aggregate data file, in either schema version.
+def parse_aggregate_time(value: str | int) -> datetime:
+    if isinstance(value, int):
+        return epoch_to_datetime(value)
+    return parser.isoparse(value)
+
+
+# The total number of seconds of a timedelta, ignoring microseconds (as we don't need them).
+def timedelta_toseconds(delta: timedelta) -> int:
+    return delta.days * 86400 + delta.seconds
+
+
+# Convert a duration in seconds into a |relativedelta|, for display purposes.
+# Like the durations computed in `state_evolution.py`, this only has days (but no months or years).
+def seconds_to_relativedelta(seconds: int) -> relativedelta.relativedelta:
+    return relativedelta.relativedelta(seconds=seconds)
+
+
 # We consciously do not use the repr() instance on timedelta, as this does not round-trip:
 # it displays everything with hours and minutes, even when the interval representation might differ.
 #
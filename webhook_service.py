@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+"""
+A small HTTP service receiving github's webhooks, which enqueues a download for each PR that changed.
+
+Polling the REST API for recently updated PRs (`gather_stats.sh`) misses some updates (for instance,
+re-running CI does not change a PR's `updated_at` field). Github can instead notify us of every change by
+sending a webhook: this service accepts the events
+- `pull_request` (including labels being added or removed, draft state changes and pushes),
+- `pull_request_review`, `pull_request_review_comment`, `pull_request_review_thread` and `issue_comment` (on PRs),
+- `check_run` and `check_suite` (CI starting or finishing, including re-runs),
+and ignores all others (and events about other repositories). If the environment variable WEBHOOK_SECRET is set,
+each delivery's `X-Hub-Signature-256` header is verified, and deliveries with a wrong signature are rejected.
+
+A burst of events for the same PR (e.g. a push, followed by CI starting, a label change and CI finishing) should lead
+to a single download, after the burst: each PR is *debounced* (see |Debouncer|). Once a PR has seen no new event
+for |DEBOUNCE_SECONDS|, or at most |MAX_DELAY_SECONDS| after its first event, it is added to the work queue
+(see `work_queue.py`) as a download of kind "webhook". Download workers (`downloader.py --worker NAME`) drain the queue.
+PRs which are queued already are not added twice. If adding PRs to the work queue fails, they are retried later.
+
+For PRs from forks, github's `check_run` and `check_suite` events do not name the PR (their list `pull_requests`
+is empty): the service remembers the head commit of each PR it has seen a PR event for (see |HeadCommits|),
+and maps CI events to PRs by their head commit. CI events for a fork's commit the service has not seen yet
+(e.g. right after the service was restarted) are missed; the next PR event or `gather_stats.sh` picks these up.
+
+Usage:
+- `python3 webhook_service.py serve [PORT]` runs the service (on port 8080 by default) until interrupted.
+  The service only listens on the loopback interface: expose it to github through a reverse proxy,
+- `python3 webhook_service.py replay URL FILE...` sends recorded deliveries to a running service, e.g.
+  `python3 webhook_service.py replay http://127.0.0.1:8080/ test/webhooks/burst.jsonl`.
+  Each line of a file is an object `{"event": ..., "payload": ..., "delay": ...}`: the delivery is sent `delay` seconds
+  (default: 0) after the previous one, and signed with WEBHOOK_SECRET (if set).
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from downloader import OWNER, REPO
+from util import eprint
+from work_queue import WorkQueue
+
+DEFAULT_PORT = 8080
+
+# A PR is enqueued once it has seen no event for this many seconds, or this long after its first (pending) event.
+DEBOUNCE_SECONDS = 60.0
+MAX_DELAY_SECONDS = 300.0
+
+# How often the service checks for PRs which are due.
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# The work queue's kind for the downloads requested by webhooks.
+QUEUE_KIND = "webhook"
+
+# The number of head commits remembered for mapping CI events on forks to PRs.
+MAX_HEAD_COMMITS = 10000
+
+
+# The most recent head commits of PRs, as a map from a commit's sha to the PR number.
+# Only the |max_size| most recently noted commits are remembered.
+class HeadCommits:
+    def __init__(self, max_size: int = MAX_HEAD_COMMITS) -> None:
+        self.max_size = max_size
+        self.prs: dict[str, int] = dict()
+
+    def note(self, sha: str, number: int) -> None:
+        # Re-inserting moves the commit to the end, i.e. marks it as the most recent one.
+        self.prs.pop(sha, None)
+        self.prs[sha] = number
+        if len(self.prs) > self.max_size:
+            del self.prs[next(iter(self.prs))]
+
+    def get(self, sha: str | None) -> int | None:
+        return self.prs.get(sha) if sha else None
+
+
+# Return the numbers of the PRs (in the mathlib repository) concerned by the webhook event |event| with payload |payload|.
+# |heads| records the head commits of all PRs seen, and is used for the CI events of PRs from forks.
+def affected_prs(event: str, payload: dict, heads: HeadCommits) -> List[int]:
+    if (payload.get("repository") or {}).get("full_name") != f"{OWNER}/{REPO}":
+        return []
+    if event in ["pull_request", "pull_request_review", "pull_request_review_comment", "pull_request_review_thread"]:
+        pr = payload["pull_request"]
+        sha = (pr.get("head") or {}).get("sha")
+        if sha:
+            heads.note(sha, pr["number"])
+        return [pr["number"]]
+    if event == "issue_comment":
+        # Comments on issues (rather than PRs) are not interesting.
+        issue = payload["issue"]
+        return [issue["number"]] if "pull_request" in issue else []
+    if event in ["check_run", "check_suite"]:
+        # A check suite can belong to several PRs (with the same head commit), or to none at all (e.g. on master).
+        # For PRs from forks, github leaves the list of PRs empty: use the head commit instead.
+        numbers = {pr["number"] for pr in payload[event]["pull_requests"]}
+        if not numbers:
+            number = heads.get(payload[event].get("head_sha"))
+            numbers = set() if number is None else {number}
+        return sorted(numbers)
+    return []
+
+
+# The value of the `X-Hub-Signature-256` header for the body |body|, given the webhook secret |secret|.
+def signature(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+# Coalesce bursts of events per PR: |note| records an event, and |due| returns all PRs whose burst is over.
+class Debouncer:
+    def __init__(self, debounce_seconds: float = DEBOUNCE_SECONDS, max_delay_seconds: float = MAX_DELAY_SECONDS) -> None:
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        # For each PR with pending events, the times of its first and last pending event.
+        self.pending: dict[int, tuple[float, float]] = dict()
+
+    def note(self, number: int, now: float) -> None:
+        (first, _last) = self.pending.get(number, (now, now))
+        self.pending[number] = (first, now)
+
+    # Return (and forget) all PRs which are due at time |now|, in the order of their first event.
+    def due(self, now: float) -> List[int]:
+        result = [
+            number for (number, (first, last)) in sorted(self.pending.items(), key=lambda item: item[1])
+            if now - last >= self.debounce_seconds or now - first >= self.max_delay_seconds
+        ]
+        for number in result:
+            del self.pending[number]
+        return result
+
+
+# The state of the service: the secret for verifying deliveries (if any), the debouncer,
+# the head commits of the PRs seen so far and the work queue.
+class WebhookService:
+    def __init__(self, queue: WorkQueue, secret: str | None = None, debouncer: Debouncer | None = None) -> None:
+        self.queue = queue
+        self.secret = secret
+        self.debouncer = debouncer or Debouncer()
+        self.heads = HeadCommits()
+        # The number of deliveries accepted so far, and the number of PRs enqueued so far.
+        self.deliveries = 0
+        self.enqueued = 0
+        self._lock = threading.Lock()
+
+    # Handle a delivery of event |event| with body |body| at time |now|. Return the HTTP status code of the response.
+    def handle(self, event: str, body: bytes, signature_header: str | None, now: float) -> int:
+        if self.secret and not hmac.compare_digest(signature(self.secret, body), signature_header or ""):
+            return 401
+        try:
+            payload = json.loads(body)
+        except ValueError as err:
+            eprint(f"warning: malformed '{event}' webhook payload: {err}")
+            return 400
+        with self._lock:
+            try:
+                numbers = affected_prs(event, payload, self.heads)
+            except (KeyError, TypeError, AttributeError) as err:
+                eprint(f"warning: malformed '{event}' webhook payload: {err}")
+                return 400
+            self.deliveries += 1
+            for number in numbers:
+                self.debouncer.note(number, now)
+        return 202 if numbers else 204
+
+    # Add all PRs which are due at time |now| to the work queue. Return these PRs.
+    # If the work queue cannot be updated, the PRs are noted as pending again (and become due after another
+    # |debounce_seconds|), and the error is raised.
+    def flush(self, now: float) -> List[int]:
+        with self._lock:
+            due = self.debouncer.due(now)
+        if due:
+            try:
+                self.enqueued += self.queue.add(QUEUE_KIND, due)
+            except Exception:
+                with self._lock:
+                    for number in due:
+                        self.debouncer.note(number, now)
+                raise
+            print(f"info: enqueued download(s) of PR(s) {due}")
+        return due
+
+    # Run an HTTP server for this service on port |port| (0 chooses a free port), flushing due PRs in the background.
+    # Return the server: the caller should call its `serve_forever` method (and `shutdown` to stop it).
+    def server(self, port: int, flush_interval: float = FLUSH_INTERVAL_SECONDS) -> ThreadingHTTPServer:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = service.handle(
+                    self.headers.get("X-GitHub-Event", ""), body, self.headers.get("X-Hub-Signature-256"), time.monotonic()
+                )
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+
+        def flush_loop() -> None:
+            while True:
+                time.sleep(flush_interval)
+                try:
+                    service.flush(time.monotonic())
+                except Exception as err:
+                    # Keep the loop running: the PRs are retried later.
+                    eprint(f"error: could not add PRs to the work queue: {err!r}")
+
+        threading.Thread(target=flush_loop, daemon=True).start()
+        return server
+
+
+# Send the recorded deliveries in the file |file| to the service at |url|. Return the HTTP status codes of the responses.
+def replay(url: str, file: str, secret: str | None) -> List[int]:
+    with open(file, "r") as fi:
+        deliveries = [json.loads(line) for line in fi if line.strip()]
+    statuses = []
+    for delivery in deliveries:
+        time.sleep(delivery.get("delay", 0))
+        body = json.dumps(delivery["payload"]).encode()
+        headers = {"Content-Type": "application/json", "X-GitHub-Event": delivery["event"]}
+        if secret:
+            headers["X-Hub-Signature-256"] = signature(secret, body)
+        request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request) as response:
+                statuses.append(response.status)
+        except urllib.error.HTTPError as err:
+            statuses.append(err.code)
+    return statuses
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    secret = os.environ.get("WEBHOOK_SECRET")
+    if args and args[0] == "serve" and len(args) <= 2 and all(arg.isdigit() for arg in args[1:]):
+        port = int(args[1]) if len(args) == 2 else DEFAULT_PORT
+        if not secret:
+            eprint("warning: WEBHOOK_SECRET is not set, webhook deliveries are not verified")
+        service = WebhookService(WorkQueue(), secret)
+        server = service.server(port)
+        print(f"listening for webhooks on port {server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            # Do not lose the pending PRs.
+            service.flush(float("inf"))
+    elif len(args) >= 3 and args[0] == "replay":
+        for file in args[2:]:
+            statuses = replay(args[1], file, secret)
+            print(f"replayed {len(statuses)} deliveries from {file}: HTTP status codes {statuses}")
+    else:
+        eprint("usage: webhook_service.py serve [PORT] | webhook_service.py replay URL FILE...")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
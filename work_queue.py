@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+A work queue of PRs to download, with leases, so several download workers can run at the same time.
+
+The scripts used to decide which PRs to download and download them in one process: running two of them at once
+would download the same PRs twice (and both would write to the same temporary directories).
+Instead, `download_missing_outdated_PRs.sh` adds the PRs it wants downloaded to this queue (each with a kind,
+such as "redownload" or "missing"), and any number of workers (`downloader.py --worker NAME`) drain it:
+- a worker *claims* some PRs for a while (it takes a lease on them): until the lease expires,
+  no other worker will claim these PRs,
+- afterwards, it marks each PR as *completed* (removing it from the queue) or as *failed*
+  (releasing it, so it is retried after |RETRY_SECONDS|; after |MAX_ATTEMPTS| failed attempts, the PR is dropped).
+If a worker dies, its leases expire, and other workers take over its PRs.
+Completing or failing a PR whose lease has expired (and which may have been claimed by another worker since) has no effect.
+
+The queue is stored in `work_queue.json`. Each operation holds an exclusive lock (`flock`) on `work_queue.json.lock`
+while reading and writing the queue, and the queue file is replaced atomically. Workers on several machines
+can share a queue on a network file system, as long as it supports `flock`.
+
+Usage:
+- `python3 work_queue.py add KIND PR_NUMBER...` adds PRs to the queue (PRs which are queued already keep their kind),
+- `python3 work_queue.py show` prints all queued PRs and their leases.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import sys
+import time
+from os import path
+from typing import Iterator, List, NamedTuple, Tuple
+
+from util import eprint, epoch_to_github_time, github_time_to_epoch
+
+WORK_QUEUE_FILE = "work_queue.json"
+
+# The default duration of a lease, in seconds: this should be much longer than downloading one claim of PRs takes.
+LEASE_SECONDS = 15 * 60
+
+# After a failed download, how long to wait before a PR can be claimed again,
+# and how often downloading a PR is attempted at most.
+RETRY_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+class WorkItem(NamedTuple):
+    number: int
+    # The kind of download, e.g. "redownload", "missing", "closed" or "stubborn".
+    kind: str
+    # The worker holding a lease on this PR (None if there is none), and the time (in seconds since the epoch)
+    # the lease expires. For an item without a lease, the item cannot be claimed before that time.
+    owner: str | None
+    until: int
+    attempts: int
+
+
+class WorkQueue:
+    def __init__(self, file: str = WORK_QUEUE_FILE) -> None:
+        self.file = file
+
+    # Lock the queue, and yield its items (in the order they were added): changes to the list are saved afterwards.
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[List[WorkItem]]:
+        with open(self.file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                items = self._read()
+                yield items
+                self._write(items)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> List[WorkItem]:
+        if not path.exists(self.file):
+            return []
+        with open(self.file, "r") as fi:
+            data = json.load(fi)
+        return [
+            WorkItem(item["number"], item["kind"], item["owner"], github_time_to_epoch(item["until"]), item["attempts"])
+            for item in data["items"]
+        ]
+
+    def _write(self, items: List[WorkItem]) -> None:
+        lines = [
+            json.dumps({"number": item.number, "kind": item.kind, "owner": item.owner,
+                        "until": epoch_to_github_time(item.until), "attempts": item.attempts})
+            for item in items
+        ]
+        tmp = f"{self.file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as fi:
+            fi.write('{"items": [\n' + ",\n".join(lines) + "\n]}\n")
+        os.replace(tmp, self.file)
+
+    # All items in the queue.
+    def items(self) -> List[WorkItem]:
+        with self._locked() as items:
+            return list(items)
+
+    # Add the PRs |numbers| to the queue, as downloads of kind |kind|. Return the number of PRs added.
+    def add(self, kind: str, numbers: List[int]) -> int:
+        with self._locked() as items:
+            queued = {item.number for item in items}
+            new = [n for n in dict.fromkeys(numbers) if n not in queued]
+            items.extend(WorkItem(n, kind, None, 0, 0) for n in new)
+            return len(new)
+
+    # Claim (at most) |count| PRs for the worker |worker| at time |now|, for |lease_seconds| seconds.
+    # PRs are claimed in the order they were added. Return the claimed PRs, as pairs (kind, PR number).
+    def claim(self, worker: str, count: int, now: float, lease_seconds: int = LEASE_SECONDS) -> List[Tuple[str, int]]:
+        claimed = []
+        with self._locked() as items:
+            for (i, item) in enumerate(items):
+                if len(claimed) >= count:
+                    break
+                if item.until <= now:
+                    items[i] = item._replace(owner=worker, until=int(now + lease_seconds))
+                    claimed.append((item.kind, item.number))
+        return claimed
+
+    # Mark the downloads of |numbers| by |worker| as successful, removing them from the queue.
+    # Return the PRs which were still leased by |worker|.
+    def complete(self, worker: str, numbers: List[int]) -> List[int]:
+        with self._locked() as items:
+            done = [item.number for item in items if item.number in numbers and item.owner == worker]
+            items[:] = [item for item in items if item.number not in done]
+        return done
+
+    # Mark the downloads of |numbers| by |worker| as failed at time |now|. Return the PRs which were dropped from the queue
+    # because downloading them failed too often.
+    def fail(self, worker: str, numbers: List[int], now: float) -> List[int]:
+        dropped = []
+        with self._locked() as items:
+            for (i, item) in enumerate(items):
+                if item.number in numbers and item.owner == worker:
+                    if item.attempts + 1 >= MAX_ATTEMPTS:
+                        dropped.append(item.number)
+                    items[i] = item._replace(owner=None, until=int(now + RETRY_SECONDS), attempts=item.attempts + 1)
+            items[:] = [item for item in items if item.number not in dropped]
+        return dropped
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    queue = WorkQueue()
+    if len(args) >= 2 and args[0] == "add" and all(arg.isdigit() for arg in args[2:]):
+        added = queue.add(args[1], [int(arg) for arg in args[2:]])
+        print(f"added {added} PR(s) of kind '{args[1]}' to the work queue")
+    elif args == ["show"]:
+        now = time.time()
+        for item in queue.items():
+            lease = f", leased by {item.owner} until {epoch_to_github_time(item.until)}" if item.owner and item.until > now else ""
+            print(f"PR {item.number} ({item.kind}): {item.attempts} failed attempt(s){lease}")
+    else:
+        eprint("usage: work_queue.py add KIND PR_NUMBER... | work_queue.py show")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()